@@ -0,0 +1,79 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Backfill the score_rollups table from the raw scores table
+
+Detection keeps score_rollups up to date as scores are recorded, so this is
+only needed once for scores recorded before the rollups existed (or to repair
+a time range).  The rollups in the given range are replaced by ones recomputed
+from the raw scores, so re-running over the same range is safe.  Detection
+processes with rollup support update the same rows as they record scores, so
+run it before starting them or restrict the end time to before they started.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import db_manager
+import score_history
+
+import logging
+import time
+import dateutil.parser
+
+DAY_SECONDS = 24*60*60
+
+
+def main():
+    optArgs = [
+        ["s", "startTime", "starting date and time in ISO format (e.g., 2019-02-22T14:34:56 in Pacific time zone)"],
+        ["e", "endTime", "ending date and time in ISO format (e.g., 2019-02-22T14:34:56 in Pacific time zone)"],
+    ]
+    args = collect_args.collectArgs([], optionalArgs=optArgs)
+    dbManager = db_manager.DbManager(sqliteFile=settings.db_file,
+                                     psqlHost=settings.psqlHost, psqlDb=settings.psqlDb,
+                                     psqlUser=settings.psqlUser, psqlPasswd=settings.psqlPasswd)
+    if args.startTime:
+        startTime = time.mktime(dateutil.parser.parse(args.startTime).timetuple())
+    else:
+        dbResult = dbManager.query('SELECT min(Timestamp) as mintime FROM scores')
+        if not dbResult or not dbResult[0]['mintime']:
+            logging.warning('No scores to backfill')
+            return
+        startTime = dbResult[0]['mintime']
+    if args.endTime:
+        endTime = time.mktime(dateutil.parser.parse(args.endTime).timetuple())
+    else:
+        endTime = time.time()
+    # include the whole bucket containing startTime, but not the partial bucket containing endTime
+    startTime = score_history.getBucketStart(startTime)
+    endTime = score_history.getBucketStart(endTime)
+
+    # one day per transaction to keep transactions reasonably sized
+    for rangeStart in range(startTime, endTime, DAY_SECONDS):
+        rangeEnd = min(rangeStart + DAY_SECONDS, endTime)
+        dbManager.rebuildScoreRollups(rangeStart, rangeEnd, score_history.BUCKET_SECONDS)
+        logging.warning('Backfilled rollups from %s to %s', time.ctime(rangeStart), time.ctime(rangeEnd))
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,93 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Microbenchmark the image difference implementations in img_archive
+
+Compares the original ImageMath implementation with the numpy diffImages(),
+diffImageArrays() reusing output buffers, and diffImageSequence(), and
+verifies they all produce identical bytes.  Uses the given images, or random
+full resolution (3072x2048) frames by default.
+
+"""
+
+import sys
+import os
+fuegoRoot = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import img_archive
+
+import logging
+import time
+import numpy as np
+from PIL import Image
+
+
+def timeFn(fn, repeats):
+    """Returns the minimum seconds per call of given function over the given repeats
+    """
+    times = []
+    for i in range(repeats):
+        timeStart = time.time()
+        fn()
+        times.append(time.time() - timeStart)
+    return min(times)
+
+
+def main():
+    reqArgs = []
+    optArgs = [
+        ["a", "imgA", "(optional) image to subtract from"],
+        ["b", "imgB", "(optional) image to subtract"],
+        ["r", "repeats", "(optional) number of timed repeats (default 5)", int],
+        ["n", "numFrames", "(optional) number of frames for sequence benchmark (default 10)", int],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    repeats = args.repeats or 5
+    numFrames = args.numFrames or 10
+    if args.imgA and args.imgB:
+        imgA = Image.open(args.imgA).convert('RGB')
+        imgB = Image.open(args.imgB).convert('RGB')
+    else:
+        randomState = np.random.RandomState(0)
+        imgA = Image.fromarray(randomState.randint(0, 256, (2048, 3072, 3), dtype=np.uint8), 'RGB')
+        imgB = Image.fromarray(randomState.randint(0, 256, (2048, 3072, 3), dtype=np.uint8), 'RGB')
+    logging.warning('Image size %s', imgA.size)
+
+    refBytes = img_archive.diffImagesImageMath(imgA, imgB).tobytes()
+    assert img_archive.diffImages(imgA, imgB).tobytes() == refBytes
+    arrayA = np.asarray(imgA)
+    arrayB = np.asarray(imgB)
+    out = np.empty(arrayA.shape, dtype=np.uint8)
+    scratch = np.empty(arrayA.shape, dtype=np.int16)
+    assert img_archive.diffImageArrays(arrayA, arrayB, out=out, scratch=scratch).tobytes() == refBytes
+
+    refTime = timeFn(lambda: img_archive.diffImagesImageMath(imgA, imgB), repeats)
+    logging.warning('ImageMath diffImages: %.1f ms', refTime * 1000)
+    numpyTime = timeFn(lambda: img_archive.diffImages(imgA, imgB), repeats)
+    logging.warning('numpy diffImages: %.1f ms, speedup %.1fx', numpyTime * 1000, refTime / numpyTime)
+    arrayTime = timeFn(lambda: img_archive.diffImageArrays(arrayA, arrayB, out=out, scratch=scratch), repeats)
+    logging.warning('diffImageArrays with buffers: %.1f ms, speedup %.1fx', arrayTime * 1000, refTime / arrayTime)
+    frames = [arrayA, arrayB] * (numFrames // 2)
+    sequenceTime = timeFn(lambda: img_archive.diffImageSequence(frames), repeats) / (len(frames) - 1)
+    logging.warning('diffImageSequence: %.1f ms per diff, speedup %.1fx', sequenceTime * 1000, refTime / sequenceTime)
+
+
+if __name__=="__main__":
+    main()
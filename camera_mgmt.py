@@ -32,6 +32,7 @@ import db_manager
 import logging
 import random
 import datetime
+import time
 
 def execCameraSql(dbManager, sqlTemplate, cameraID, isQuery):
     sqlStr = sqlTemplate % cameraID
@@ -118,9 +119,17 @@ def main():
         return
 
     if args.mode == 'stats':
-        sqlTemplate = """SELECT max(timestamp) as maxtime FROM scores WHERE CameraName = '%s' """
+        # score_rollups has one row per segment per 15 minutes vs. one per image in scores
+        sqlTemplate = """SELECT max(BucketStart) as maxtime FROM score_rollups WHERE CameraName = '%s' """
         dbResult = execCameraSql(dbManager, sqlTemplate, args.cameraID, isQuery=True)
-        logging.warning('Most recent image scanned: %s', getTime(dbResult))
+        logging.warning('Most recent image scanned (15 minute granularity): %s', getTime(dbResult))
+        sqlTemplate = """SELECT sum(NumSamples) as cnt, max(MaxScore) as maxs, sum(SumScore)/sum(NumSamples) as avgs
+        FROM score_rollups WHERE CameraName = '%s' and BucketStart >= %d """
+        sqlStr = sqlTemplate % (args.cameraID, int(time.time()) - 24*60*60)
+        dbResult = dbManager.query(sqlStr)
+        if dbResult and dbResult[0]['cnt']:
+            logging.warning('Segment scores in last day: count %d, max %f, avg %f',
+                            dbResult[0]['cnt'], dbResult[0]['maxs'], dbResult[0]['avgs'])
         sqlTemplate = """SELECT max(timestamp) as maxtime FROM detections WHERE CameraName = '%s' """
         dbResult = execCameraSql(dbManager, sqlTemplate, args.cameraID, isQuery=True)
         logging.warning('Most recent smoke detection: %s', getTime(dbResult))
@@ -36,7 +36,7 @@ class DetectAlways:
 
     def detect(self, image_spec):
         detectionResult = {
-            'annotatedFile': '',
+            'annotatedImage': None,
             'fireSegment': {
                 'score': 0.9
             },
@@ -44,3 +44,7 @@ class DetectAlways:
             'timeMid': time.time()
         }
         return detectionResult
+
+
+    def detectMultiple(self, imageSpecs):
+        return [self.detect(image_spec) for image_spec in imageSpecs]
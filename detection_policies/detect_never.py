@@ -36,9 +36,13 @@ class DetectNever:
 
     def detect(self, image_spec):
         detectionResult = {
-            'annotatedFile': '',
+            'annotatedImage': None,
             'fireSegment': None,
             'driveFileIDs': '',
             'timeMid': time.time()
         }
         return detectionResult
+
+
+    def detectMultiple(self, imageSpecs):
+        return [self.detect(image_spec) for image_spec in imageSpecs]
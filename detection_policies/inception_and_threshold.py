@@ -31,16 +31,25 @@ settings.fuegoRoot = fuegoRoot
 import goog_helper
 import tf_helper
 import rect_to_squares
+import score_history
+import segment_masks
+import change_gate
+import inference_server
+import recheck_queue
+import drive_uploader
+import score_buffer
+import annotation_renderer
 
 import pathlib
-from PIL import Image, ImageFile, ImageDraw, ImageFont
+import io
+import numpy as np
+from PIL import Image, ImageFile
 import logging
-import shutil
+import tempfile
 import datetime
 import math
 import time
 
-import tensorflow as tf
 
 class InceptionV3AndHistoricalThreshold:
 
@@ -54,49 +63,121 @@ class InceptionV3AndHistoricalThreshold:
         self.camArchives = camArchives
         self.minusMinutes = minusMinutes
         self.useArchivedImages = useArchivedImages
-        self.graph = tf_helper.load_graph(settings.model_file)
-        self.labels = tf_helper.load_labels(settings.labels_file)
-        self.tfSession = tf.Session(graph=self.graph, config=tfConfig)
-
-
-    def _segmentImage(self, imgPath):
+        self.denseClassifier = None
+        if getattr(args, 'inferenceSocket', None):
+            # model is owned by shared inference server process
+            self.classifier = inference_server.InferenceClient(args.inferenceSocket)
+        elif getattr(settings, 'dense_scoring', False):
+            # whole frames scored at once by fully convolutional model
+            self.classifier = None
+            self.denseClassifier = tf_helper.DenseSegmentClassifier(settings.model_file, settings.labels_file,
+                                                                    tfConfig, getattr(settings, 'dense_strip_cells', None))
+        else:
+            self.classifier = tf_helper.createClassifier(settings, tfConfig)
+        self.scoreHistory = score_history.ScoreHistoryCache()
+        self.scoreHistory.refresh(dbManager, time.time())
+        self.scoreBuffer = score_buffer.ScoreWriteBuffer(dbManager)
+        self.segmentMasks = segment_masks.SegmentMasks(dbManager)
+        changeThreshold = float(args.changeThreshold) if getattr(args, 'changeThreshold', None) else 2.0
+        rescoreFrames = int(args.rescoreFrames) if getattr(args, 'rescoreFrames', None) else 10
+        self.changeGate = change_gate.SegmentChangeGate(changeThreshold, rescoreFrames)
+        self.recheckQueue = None
+        if getattr(args, 'recheck', None):
+            self.recheckQueue = recheck_queue.RecheckQueue(int(args.recheck))
+        # uploads happen in background with their own google services (clients are not thread safe)
+        self.driveUploader = drive_uploader.DriveUploader(lambda: goog_helper.getGoogleServices(settings, args)['drive'],
+                                                          getattr(settings, 'upload_spool_dir', None) or
+                                                          os.path.join(tempfile.gettempdir(), 'fuego_upload_spool'),
+                                                          patchFn=self._patchImageIDs)
+
+
+    def _segmentImage(self, camera, imgPath, imgBytes=None, imgArray=None):
         """Segment the given image into sections to for smoke classificaiton
 
+        The image is decoded once and the segments are views into the decoded
+        array, so no segment files are written to disk.  Segments masked for
+        the camera are skipped.
+
         Args:
-            imgPath (str): filepath of the image
+            camera (str): camera name
+            imgPath (str): filepath of the image (only read if imgBytes and imgArray are not given)
+            imgBytes (bytes): optional in memory JPEG data of the image
+            imgArray (numpy array): optional already decoded image
 
         Returns:
-            List of dictionary containing information on each segment
+            Tuple of the decoded image array and list of dictionary containing information on each segment
         """
-        img = Image.open(imgPath)
-        ppath = pathlib.PurePath(imgPath)
-        segments = rect_to_squares.cutBoxes(img, str(ppath.parent), imgPath)
-        img.close()
-        return segments
+        if imgArray is None:
+            img = Image.open(io.BytesIO(imgBytes) if imgBytes else imgPath)
+            imgArray = np.asarray(img.convert('RGB'))
+            img.close()
+        segments = rect_to_squares.cutBoxesArray(imgArray, callBackFn=self.segmentMasks.getSkipFn(camera))
+        return (imgArray, segments)
+
 
+    def _segmentAndClassify(self, images):
+        """Segment the given images into squares and classify each square
 
-    def _segmentAndClassify(self, imgPath):
-        """Segment the given image into squares and classify each square
+        The changed squares of all the images are classified together as one
+        batch to amortize the per call inference overhead.  Images fetched for
+        a re-check only classify the re-checked squares, and always classify
+        them since the scene may look unchanged since the near miss (e.g.,
+        static haze) and reused scores would confirm it.
 
         Args:
-            imgPath (str): filepath of the image to segment and clasify
+            images (list): list of image specs (see detect()) of the images to segment and classify
 
         Returns:
-            list of segments with scores sorted by decreasing score
+            list with tuple of decoded image array and list of segments for each image
+            with scores sorted by decreasing score
         """
-        segments = self._segmentImage(imgPath)
-        # print('si', segments)
-        tf_helper.classifySegments(self.tfSession, self.graph, self.labels, segments)
-        segments.sort(key=lambda x: -x['score'])
-        return segments
+        imgArrays = []
+        segmentsList = []
+        pendingList = []
+        toScore = []
+        for spec in images:
+            (camera, timestamp) = (spec['cameraID'], spec['timestamp'])
+            (imgArray, segments) = self._segmentImage(camera, spec['path'], spec.get('imgBytes'), spec.get('imgArray'))
+            # print('si', segments)
+            if spec.get('recheck'):
+                if self.recheckQueue:
+                    recheckKeys = self.recheckQueue.getRecheckSegmentKeys(camera, timestamp)
+                    if recheckKeys:
+                        segments = [s for s in segments if recheck_queue.getSegmentKey(s) in recheckKeys]
+                (imageToScore, pending) = (segments, None) # bypass change gate without advancing its rescore count
+            else:
+                (imageToScore, pending) = self.changeGate.selectSegments(camera, segments)
+            if self.denseClassifier:
+                self.denseClassifier.classifyFrameSegments(imgArray, imageToScore)
+            else:
+                toScore += imageToScore
+            imgArrays.append(imgArray)
+            segmentsList.append(segments)
+            pendingList.append(pending)
+        if not self.denseClassifier:
+            self.classifier.classifySegmentArrays(toScore)
+        for (spec, segments, pending) in zip(images, segmentsList, pendingList):
+            self.changeGate.updateSegments(spec['cameraID'], segments, pending)
+            segments.sort(key=lambda x: -x['score'])
+            if self.changeGate.getStats()['frames'] % 100 == 0:
+                self.changeGate.logStats()
+                if isinstance(self.classifier, tf_helper.CascadeClassifier):
+                    logging.warning('Cascade prefilter pass rate %.2f', self.classifier.getPassRate())
+                if self.recheckQueue:
+                    logging.warning('Re-checks: %s', self.recheckQueue.getStats())
+                if self.driveUploader.getStats()['queued']:
+                    self.driveUploader.logStats()
+                logging.warning('Score writes: %s', self.scoreBuffer.getStats())
+        return list(zip(imgArrays, segmentsList))
 
 
     def _collectPositves(self, imgPath, segments):
         """Collect all positive scoring segments
 
         Copy the images for all segments that score highter than > .5 to google drive folder
-        settings.positivePictures. These will be used to train future models.
-        Also, copy the full image for reference.
+        settings.positivePictures (or local settings.positivePicturesDir).
+        These will be used to train future models.  The uploads happen in the
+        background directly from memory.
 
         Args:
             imgPath (str): path name for main image
@@ -104,26 +185,32 @@ class InceptionV3AndHistoricalThreshold:
         """
         positiveSegments = 0
         ppath = pathlib.PurePath(imgPath)
-        googleDrive = self.google_services['drive']
         for segmentInfo in segments:
             if segmentInfo['score'] > .5:
+                coords = (segmentInfo['MinX'], segmentInfo['MinY'], segmentInfo['MaxX'], segmentInfo['MaxY'])
+                croppedImg = Image.fromarray(segmentInfo['imgArray'])
                 if hasattr(settings, 'positivePicturesDir'):
-                    pp = pathlib.PurePath(segmentInfo['imgPath'])
-                    destPath = os.path.join(settings.positivePicturesDir, pp.name)
-                    shutil.copy(segmentInfo['imgPath'], destPath)
+                    destPath = rect_to_squares.getCropImgPath(settings.positivePicturesDir, imgPath, coords)
+                    croppedImg.save(destPath, format='JPEG')
                 else:
-                    goog_helper.uploadFile(googleDrive, settings.positivePictures, segmentInfo['imgPath'])
+                    cropImgName = os.path.basename(rect_to_squares.getCropImgPath('', imgPath, coords))
+                    self.driveUploader.uploadData(settings.positivePictures, cropImgName,
+                                                  annotation_renderer.encodeJpeg(croppedImg))
                 positiveSegments += 1
 
         if positiveSegments > 0:
             # Commenting out saving full images for now to reduce data
-            # goog_helper.uploadFile(googleDrive, settings.positivePictures, imgPath)
+            # self.driveUploader.upload(settings.positivePictures, imgPath)
             logging.warning('Found %d positives in image %s', positiveSegments, ppath.name)
 
 
     def _recordScores(self, camera, timestamp, segments):
         """Record the smoke scores for each segment into SQL DB
 
+        The DB writes are buffered and done in bulk, but the in-memory score
+        history is updated immediately.  Segments rejected by a cascade prefilter
+        only have prefilter scores, so they are not recorded.
+
         Args:
             camera (str): camera name
             timestamp (int):
@@ -132,6 +219,7 @@ class InceptionV3AndHistoricalThreshold:
         dt = datetime.datetime.fromtimestamp(timestamp)
         secondsInDay = (dt.hour * 60 + dt.minute) * 60 + dt.second
 
+        segments = [segmentInfo for segmentInfo in segments if not segmentInfo.get('prefiltered')]
         dbRows = []
         for segmentInfo in segments:
             dbRow = {
@@ -141,12 +229,13 @@ class InceptionV3AndHistoricalThreshold:
                 'MinY': segmentInfo['MinY'],
                 'MaxX': segmentInfo['MaxX'],
                 'MaxY': segmentInfo['MaxY'],
-                'Score': segmentInfo['score'],
+                'Score': float(segmentInfo['score']),
                 'MinusMinutes': self.minusMinutes,
                 'SecondsInDay': secondsInDay
             }
             dbRows.append(dbRow)
-        self.dbManager.add_data('scores', dbRows)
+        self.scoreBuffer.add(dbRows, score_history.getRollupRows(camera, timestamp, segments))
+        self.scoreHistory.addScores(camera, timestamp, segments)
 
 
     def _postFilter(self, camera, timestamp, segments):
@@ -157,6 +246,7 @@ class InceptionV3AndHistoricalThreshold:
         multiple days, so this filter raises the threshold based on the max
         smoke score for same segment at same time of day over the last few days.
         Score must be > halfway between max value and 1.  Also, minimum .1 above max.
+        The 'threshold' and historical values are added to all segments checked.
 
         Args:
             camera (str): camera name
@@ -174,121 +264,99 @@ class InceptionV3AndHistoricalThreshold:
         # maxFireSegment['HistNumSamples'] = 10
         # return maxFireSegment
 
+        # pick up historical scores recorded by other processes (cheap no-op most of the time)
+        self.scoreHistory.refresh(self.dbManager, timestamp)
+
         # segments is sorted, so skip all work if max score is < .5
         if segments[0]['score'] < .5:
             return None
 
-        sqlTemplate = """SELECT MinX,MinY,MaxX,MaxY,count(*) as cnt, avg(score) as avgs, max(score) as maxs FROM scores
-        WHERE CameraName='%s' and Timestamp > %s and Timestamp < %s and SecondsInDay > %s and SecondsInDay < %s
-        GROUP BY MinX,MinY,MaxX,MaxY"""
-
-        dt = datetime.datetime.fromtimestamp(timestamp)
-        secondsInDay = (dt.hour * 60 + dt.minute) * 60 + dt.second
-        sqlStr = sqlTemplate % (camera, timestamp - 60*60*int(24*3.5), timestamp - 60*60*12, secondsInDay - 60*60, secondsInDay + 60*60)
-        # print('sql', sqlStr, timestamp)
-        dbResult = self.dbManager.query(sqlStr)
-        # if len(dbResult) > 0:
-        #     print('post filter result', dbResult)
         maxFireSegment = None
         maxFireScore = 0
         for segmentInfo in segments:
             if segmentInfo['score'] < .5: # segments is sorted. we've reached end of segments >= .5
                 break
-            for row in dbResult:
-                if (row['minx'] == segmentInfo['MinX'] and row['miny'] == segmentInfo['MinY'] and
-                    row['maxx'] == segmentInfo['MaxX'] and row['maxy'] == segmentInfo['MaxY']):
-                    threshold = (row['maxs'] + 1)/2 # threshold is halfway between max and 1
-                    # Segments with historical value above 0.8 are too noisy, so discard them by setting
-                    # threshold at least .2 above max.  Also requires .7 to reach .9 vs just .85
-                    threshold = max(threshold, row['maxs'] + 0.2)
-                    # print('thresh', row['minx'], row['miny'], row['maxx'], row['maxy'], row['maxs'], threshold)
-                    if (segmentInfo['score'] > threshold) and (segmentInfo['score'] > maxFireScore):
-                        maxFireScore = segmentInfo['score']
-                        maxFireSegment = segmentInfo
-                        maxFireSegment['HistAvg'] = row['avgs']
-                        maxFireSegment['HistMax'] = row['maxs']
-                        maxFireSegment['HistNumSamples'] = row['cnt']
+            segmentKey = (segmentInfo['MinX'], segmentInfo['MinY'], segmentInfo['MaxX'], segmentInfo['MaxY'])
+            row = self.scoreHistory.getHistory(camera, timestamp, segmentKey)
+            if row:
+                threshold = (row['maxs'] + 1)/2 # threshold is halfway between max and 1
+                # Segments with historical value above 0.8 are too noisy, so discard them by setting
+                # threshold at least .2 above max.  Also requires .7 to reach .9 vs just .85
+                threshold = max(threshold, row['maxs'] + 0.2)
+                # print('thresh', segmentKey, row['maxs'], threshold)
+                segmentInfo['threshold'] = threshold
+                segmentInfo['HistAvg'] = row['avgs']
+                segmentInfo['HistMax'] = row['maxs']
+                segmentInfo['HistNumSamples'] = row['cnt']
+                if (segmentInfo['score'] > threshold) and (segmentInfo['score'] > maxFireScore):
+                    maxFireScore = segmentInfo['score']
+                    maxFireSegment = segmentInfo
 
         return maxFireSegment
 
 
-    def _drawRect(self, imgDraw, x0, y0, x1, y1, width, color):
-        for i in range(width):
-            imgDraw.rectangle((x0+i,y0+i,x1-i,y1-i),outline=color)
+    def _updateRechecks(self, camera, timestamp, segments, fireSegment, isRecheck):
+        """Combine re-check scores and queue re-checks for near miss segments
 
+        Args:
+            camera (str): camera name
+            timestamp (int):
+            segments (list): Sorted List of dictionary containing information on each segment after _postFilter()
+            fireSegment (dict): segment detected by _postFilter() or None
+            isRecheck (bool): whether the image was fetched for a re-check
 
-    def _drawFireBox(self, imgPath, fireSegment):
+        Returns:
+            fireSegment, or the segment confirmed by a finished re-check sequence
+        """
+        confirmed = None
+        if isRecheck: # frames of the regular rotation may have reused scores
+            confirmed = self.recheckQueue.addScores(camera, timestamp, segments)
+        if fireSegment:
+            return fireSegment
+        if confirmed:
+            return confirmed
+        nearMisses = [s for s in segments if ('threshold' in s) and (s['score'] <= s['threshold'])]
+        self.recheckQueue.addNearMisses(camera, timestamp, nearMisses, segments)
+        return None
+
+
+    def _drawFireBox(self, imgPath, imgArray, fireSegment):
         """Draw bounding box with fire detection with score on image
 
-        Stores the resulting annotated image as new file
+        The annotations are drawn on a copy of the decoded image and encoded
+        in memory
 
         Args:
             imgPath (str): filepath of the image
+            imgArray (numpy array): decoded image
+            fireSegment (dictionary): dictionary with information for the segment with fire/smoke
 
         Returns:
-            filepath of new image file
+            Tuple of file name and JPEG bytes of the annotated image
         """
-        img = Image.open(imgPath)
-        imgDraw = ImageDraw.Draw(img)
-        x0 = fireSegment['MinX']
-        y0 = fireSegment['MinY']
-        x1 = fireSegment['MaxX']
-        y1 = fireSegment['MaxY']
-        centerX = (x0 + x1)/2
-        centerY = (y0 + y1)/2
-        color = "red"
-        lineWidth=3
-        self._drawRect(imgDraw, x0, y0, x1, y1, lineWidth, color)
-
-        fontSize=80
-        font = ImageFont.truetype(os.path.join(settings.fuegoRoot, 'lib/Roboto-Regular.ttf'), size=fontSize)
-        scoreStr = '%.2f' % fireSegment['score']
-        textSize = imgDraw.textsize(scoreStr, font=font)
-        imgDraw.text((centerX - textSize[0]/2, centerY - textSize[1]), scoreStr, font=font, fill=color)
-
-        color = "blue"
-        fontSize=70
-        font = ImageFont.truetype(os.path.join(settings.fuegoRoot, 'lib/Roboto-Regular.ttf'), size=fontSize)
-        scoreStr = '%.2f' % fireSegment['HistMax']
-        textSize = imgDraw.textsize(scoreStr, font=font)
-        imgDraw.text((centerX - textSize[0]/2, centerY), scoreStr, font=font, fill=color)
-
-        filePathParts = os.path.splitext(imgPath)
-        annotatedFile = filePathParts[0] + '_Score' + filePathParts[1]
-        img.save(annotatedFile, format="JPEG")
-        del imgDraw
-        img.close()
-        return annotatedFile
-
-
-    def _recordDetection(self, camera, timestamp, imgPath, annotatedFile, fireSegment):
+        jpegBytes = annotation_renderer.renderFireBox(imgArray, fireSegment)
+        return (annotation_renderer.getAnnotatedName(imgPath), jpegBytes)
+
+
+    def _recordDetection(self, camera, timestamp, imgPath, imgData, annotatedImage, fireSegment):
         """Record that a smoke/fire has been detected
 
         Record the detection with useful metrics in 'detections' table in SQL DB.
-        Also, upload image file to google drive
+        Also, queue the image files for upload to google drive.  The ImageID of
+        the detection (and alert) is filled in once the upload finishes.
 
         Args:
             camera (str): camera name
             timestamp (int):
-            imgPath: filepath of the image
-            annotatedFile: filepath of the image with annotated box and score
+            imgPath: filepath (or just name) of the image
+            imgData (bytes): JPEG data of the image
+            annotatedImage (tuple): file name and JPEG bytes of the image with annotated box and score
             fireSegment (dictionary): dictionary with information for the segment with fire/smoke
 
         Returns:
-            List of Google drive IDs for the uploaded image files
+            List of Google drive IDs for the uploaded image files (empty since uploads are pending)
         """
         logging.warning('Fire detected by camera %s, image %s, segment %s', camera, imgPath, str(fireSegment))
-        # upload file to google drive detection dir
-        driveFileIDs = []
-        googleDrive = self.google_services['drive']
-        driveFile = goog_helper.uploadFile(googleDrive, settings.detectionPictures, imgPath)
-        if driveFile:
-            driveFileIDs.append(driveFile['id'])
-        driveFile = goog_helper.uploadFile(googleDrive, settings.detectionPictures, annotatedFile)
-        if driveFile:
-            driveFileIDs.append(driveFile['id'])
-        logging.warning('Uploaded to google drive detections folder %s', str(driveFileIDs))
-
         dbRow = {
             'CameraName': camera,
             'Timestamp': timestamp,
@@ -300,41 +368,114 @@ class InceptionV3AndHistoricalThreshold:
             'HistAvg': fireSegment['HistAvg'],
             'HistMax': fireSegment['HistMax'],
             'HistNumSamples': fireSegment['HistNumSamples'],
-            'ImageID': driveFileIDs[0] if driveFileIDs else ''
+            'ImageID': ''
         }
         self.dbManager.add_data('detections', dbRow)
-        return driveFileIDs
 
+        # upload file to google drive detection dir (spooled to disk first so a restart resumes it).
+        # Queued after the detection is recorded, so the upload can't finish before there's a row to patch
+        self.driveUploader.uploadData(settings.detectionPictures, os.path.basename(imgPath), imgData,
+                                      patch={'CameraName': camera, 'Timestamp': timestamp}, durable=True)
+        self.driveUploader.uploadData(settings.detectionPictures, *annotatedImage, durable=True)
+        return []
 
-    def detect(self, image_spec):
-        # This detection policy only uses a single image, so just take the last one
-        last_image_spec = image_spec[-1]
-        imgPath = last_image_spec['path']
-        timestamp = last_image_spec['timestamp']
-        cameraID = last_image_spec['cameraID']
+
+    def _patchImageIDs(self, patches):
+        """Fill in the drive IDs of uploaded detection images
+
+        Called by the drive uploader with the uploads queued by _recordDetection()
+
+        Args:
+            patches (list): list of (dictionary with CameraName and Timestamp, drive ID)
+        """
+        with self.dbManager.lock: # keep other threads from committing or rolling back part of the updates
+            for (patch, driveID) in patches:
+                for tableName in ['detections', 'alerts']:
+                    sqlTemplate = """UPDATE %s SET ImageID='%s'
+                        WHERE CameraName='%s' and Timestamp=%s and ImageID=''"""
+                    self.dbManager.execute(sqlTemplate % (tableName, driveID, patch['CameraName'], patch['Timestamp']),
+                                           commit=False)
+            self.dbManager.commit()
+        logging.warning('Uploaded %d detections to google drive', len(patches))
+
+
+    def _detectFromSegments(self, cameraID, imgPath, timestamp, imgArray, imgBytes, segments, timeMid,
+                            isRecheck=False):
+        """Record the scores of the classified segments of the given image and check for smoke
+
+        Args:
+            cameraID (str): camera name
+            imgPath (str): filepath of the image
+            timestamp (int):
+            imgArray (numpy array): decoded image
+            imgBytes (bytes): JPEG data of the image if it was given in memory
+            segments (list): List of dictionary containing information on each segment with scores
+            timeMid (float): time when classification finished
+            isRecheck (bool): whether the image was fetched for a re-check
+
+        Returns:
+            Dictionary with the detection results
+        """
         detectionResult = {
-            'annotatedFile': '',
-            'fireSegment': None
+            'annotatedImage': None,
+            'fireSegment': None,
+            'timeMid': timeMid,
         }
-        annotatedFile = None
 
-        segments = self._segmentAndClassify(imgPath)
-        detectionResult['timeMid'] = time.time()
+        if not segments:
+            logging.warning('All segments masked for camera %s', cameraID)
+            return detectionResult
         if self.args.collectPositves:
             self._collectPositves(imgPath, segments)
         if not self.useArchivedImages:
             self._recordScores(cameraID, timestamp, segments)
             fireSegment = self._postFilter(cameraID, timestamp, segments)
+            if self.recheckQueue:
+                fireSegment = self._updateRechecks(cameraID, timestamp, segments, fireSegment, isRecheck)
             if fireSegment:
-                annotatedFile = self._drawFireBox(imgPath, fireSegment)
-                driveFileIDs = self._recordDetection(cameraID, timestamp, imgPath, annotatedFile, fireSegment)
+                annotatedImage = self._drawFireBox(imgPath, imgArray, fireSegment)
+                if imgBytes == None: # image was diffed in memory or read from file
+                    imgBytes = annotation_renderer.encodeJpeg(Image.fromarray(imgArray))
+                driveFileIDs = self._recordDetection(cameraID, timestamp, imgPath, imgBytes, annotatedImage,
+                                                     fireSegment)
                 detectionResult['fireSegment'] = fireSegment
-                detectionResult['annotatedFile'] = annotatedFile
+                detectionResult['annotatedImage'] = annotatedImage
                 detectionResult['driveFileIDs'] = driveFileIDs
         logging.warning('Highest score for camera %s: %f' % (cameraID, segments[0]['score']))
-        for segmentInfo in segments:
-            os.remove(segmentInfo['imgPath'])
 
         return detectionResult
 
 
+    def detectMultiple(self, imageSpecs):
+        """Check the images from multiple cameras for smoke, classifying them as one batch
+
+        Args:
+            imageSpecs (list): list of image_spec (as given to detect()) for each camera
+
+        Returns:
+            List of detection results for each image_spec
+        """
+        # This detection policy only uses a single image, so just take the last one
+        lastImageSpecs = [image_spec[-1] for image_spec in imageSpecs]
+        classifiedImages = self._segmentAndClassify(lastImageSpecs)
+        timeMid = time.time()
+        return [self._detectFromSegments(spec['cameraID'], spec['path'], spec['timestamp'], imgArray, spec.get('imgBytes'),
+                                         segments, timeMid, bool(spec.get('recheck')))
+                for (spec, (imgArray, segments)) in zip(lastImageSpecs, classifiedImages)]
+
+
+    def detect(self, image_spec):
+        """Check the given image for smoke
+
+        Args:
+            image_spec (list): list of dictionaries with 'path', 'timestamp', and 'cameraID' of the images
+                               and optionally the in memory 'imgBytes' (JPEG data) or 'imgArray' (decoded
+                               image).  The path is only read when neither is given.  'recheck' is set
+                               for images fetched for a re-check (see CameraScheduler).
+
+        Returns:
+            Dictionary with the detection results
+        """
+        return self.detectMultiple([image_spec])[0]
+
+
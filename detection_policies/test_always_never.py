@@ -34,3 +34,9 @@ def testAlways():
     assert result['fireSegment']
     assert result['fireSegment']['score']
 
+
+def testDetectMultiple():
+    alwaysPol = detect_always.DetectAlways(None, None, None, None, None, None, None, None)
+    results = alwaysPol.detectMultiple([None, None])
+    assert len(results) == 2
+    assert all(result['fireSegment'] for result in results)
@@ -0,0 +1,151 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test inception_and_threshold policy with a fake classifier
+
+"""
+
+import inception_and_threshold
+import db_manager
+import score_history
+import recheck_queue
+import numpy as np
+import pytest
+import os
+import tempfile
+import time
+import types
+
+DAY = 24*60*60
+NOW = score_history.getBucketStart(time.time()) + 450 # middle of a bucket
+SEGMENT_KEY = (0, 0, 299, 299)
+
+
+class FakeClassifier(object):
+    def __init__(self):
+        self.scores = {}
+        self.classified = []
+
+    def classifySegmentArrays(self, segments):
+        for segmentInfo in segments:
+            segmentKey = recheck_queue.getSegmentKey(segmentInfo)
+            self.classified.append(segmentKey)
+            segmentInfo['score'] = self.scores.get(segmentKey, 0.1)
+
+
+class InstantUploader(object):
+    """Fake drive uploader whose uploads finish as soon as they are queued"""
+    def __init__(self, patchFn):
+        self.patchFn = patchFn
+
+    def uploadData(self, dirID, fileName, data, patch=None, durable=False):
+        if patch:
+            self.patchFn([(patch, 'id-' + fileName)])
+
+
+@pytest.fixture
+def policy():
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        dbManager = db_manager.DbManager(sqliteFile=os.path.join(tmpDirName, 'test.db'))
+        # history max of 0.6 gives the segment a threshold of 0.8
+        segment = {'MinX': 0, 'MinY': 0, 'MaxX': 299, 'MaxY': 299, 'score': 0.6}
+        dbManager.upsertScoreRollups(score_history.getRollupRows('cam1', NOW - DAY, [segment]))
+        settings = types.SimpleNamespace(upload_spool_dir=os.path.join(tmpDirName, 'spool'))
+        args = types.SimpleNamespace(inferenceSocket=os.path.join(tmpDirName, 'unused'), recheck='2',
+                                     changeThreshold=None, rescoreFrames=None, collectPositves=False)
+        policy = inception_and_threshold.InceptionV3AndHistoricalThreshold(settings, args, None, dbManager, None,
+                                                                           None, 0, False)
+        policy.classifier = FakeClassifier()
+        driveUploader = policy.driveUploader
+        yield policy
+        driveUploader.stop()
+
+
+def detect(policy, timestamp, imgArray, recheck=False):
+    spec = {'cameraID': 'cam1', 'path': 'cam1.jpg', 'timestamp': timestamp, 'imgArray': imgArray, 'recheck': recheck}
+    return policy.detect([spec])
+
+
+def testChangedFrameWithRecheck(policy):
+    classifier = policy.classifier
+    imgArray = np.random.RandomState(0).randint(0, 256, (598, 1495, 3), dtype=np.uint8)
+    classifier.scores[SEGMENT_KEY] = 0.7
+    assert not detect(policy, NOW, imgArray)['fireSegment']
+    allKeys = list(classifier.classified)
+    assert policy.recheckQueue.getStats()['started'] == 1
+
+    # re-check of unchanged image classifies the near miss and its neighbors despite the change gate
+    del classifier.classified[:]
+    detect(policy, NOW + 20, imgArray, recheck=True)
+    assert SEGMENT_KEY in classifier.classified
+    assert len(classifier.classified) < len(allKeys)
+    assert policy.changeGate.cameraStates['cam1']['frameCount'] == 1
+
+    # changed segment of next regular frame is rescored, the others reuse their scores
+    del classifier.classified[:]
+    imgArray2 = imgArray.copy()
+    imgArray2[:100, :100] = 0
+    classifier.scores[SEGMENT_KEY] = 0.75
+    detect(policy, NOW + 60, imgArray2)
+    assert classifier.classified == [SEGMENT_KEY]
+    assert policy.changeGate.cameraStates['cam1']['frameCount'] == 2
+
+    # all frames are recorded in the history (seen a day later), including reused scores
+    policy.scoreBuffer.flush()
+    history = policy.scoreHistory.getHistory('cam1', NOW + DAY, SEGMENT_KEY)
+    assert history['cnt'] == 1 + 3 # seeded history and the 3 frames
+    assert history['maxs'] == pytest.approx(0.75)
+    farKey = max(allKeys)
+    assert farKey not in classifier.classified
+    assert policy.scoreHistory.getHistory('cam1', NOW + DAY, farKey)['cnt'] == 2
+
+
+def testSteadyNearMissNotConfirmed(policy):
+    # steady 0.7 under a threshold of 0.8 (e.g., static haze) doesn't get past the threshold by repetition
+    policy.classifier.scores[SEGMENT_KEY] = 0.7
+    imgArray = np.random.RandomState(0).randint(0, 256, (598, 1495, 3), dtype=np.uint8)
+    assert not detect(policy, NOW, imgArray)['fireSegment']
+    assert not detect(policy, NOW + 20, imgArray, recheck=True)['fireSegment']
+    assert not detect(policy, NOW + 40, imgArray, recheck=True)['fireSegment']
+    assert policy.recheckQueue.getStats()['rejected'] == 1
+
+
+def testImageIDOfFastUpload(policy):
+    policy.driveUploader = InstantUploader(policy._patchImageIDs)
+    fireSegment = {'MinX': 0, 'MinY': 0, 'MaxX': 299, 'MaxY': 299, 'score': 0.9,
+                   'HistAvg': 0.3, 'HistMax': 0.6, 'HistNumSamples': 4}
+    policy._recordDetection('cam1', NOW, 'cam1.jpg', b'jpeg', ('cam1_Score.jpg', b'jpeg'), fireSegment)
+    dbResult = policy.dbManager.query('SELECT ImageID FROM detections')
+    assert dbResult[0]['imageid'] == 'id-cam1.jpg'
+
+
+def testPrefilteredNotRecorded(policy):
+    classifier = policy.classifier
+    classifySegmentArrays = classifier.classifySegmentArrays
+    def prefilterOthers(segments):
+        classifySegmentArrays(segments)
+        for segmentInfo in segments:
+            if recheck_queue.getSegmentKey(segmentInfo) != SEGMENT_KEY:
+                segmentInfo['prefiltered'] = True
+    classifier.classifySegmentArrays = prefilterOthers
+    imgArray = np.random.RandomState(0).randint(0, 256, (598, 1495, 3), dtype=np.uint8)
+    detect(policy, NOW, imgArray)
+    # unchanged frame reuses the prefiltered scores, which still aren't recorded
+    detect(policy, NOW + 60, imgArray)
+    policy.scoreBuffer.flush()
+    dbResult = policy.dbManager.query('SELECT MinX, MinY, count(*) as cnt FROM scores GROUP BY MinX, MinY')
+    assert [(row['minx'], row['miny'], row['cnt']) for row in dbResult] == [(0, 0, 2)]
+    assert policy.scoreHistory.getHistory('cam1', NOW + DAY, max(classifier.classified)) == None
@@ -0,0 +1,294 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Send alerts in the background from a durable local spool
+
+Detection only adds the alert to the AlertSpool, which writes the alert
+images into the spool directory and records one delivery per channel and
+recipient in a local sqlite file.  The AlertDispatcher thread picks up due
+deliveries and sends them concurrently using a thread pool per channel.
+Failed deliveries are retried with exponential backoff.  Since the spool is
+on disk, deliveries still pending when a process exits are sent after it
+restarts.  Multiple processes can share the same spool directory.
+Deliveries are claimed before sending, and claims of processes that died
+expire.  Each dispatcher only claims as many deliveries of a channel as it
+has idle workers for that channel, so claims don't sit in the thread pool
+queue until they expire and get sent again.
+
+"""
+
+import concurrent.futures
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+class AlertSpool(object):
+    def __init__(self, spoolDir, staleSeconds=10*60):
+        """Alert spool constructor
+
+        Args:
+            spoolDir (str): directory for the spool DB and alert images
+            staleSeconds (int): claims older than this are considered abandoned
+        """
+        os.makedirs(spoolDir, exist_ok=True)
+        self.spoolDir = spoolDir
+        self.staleSeconds = staleSeconds
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(spoolDir, 'alerts.db'), timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        with self.lock:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS alerts (
+                AlertID TEXT PRIMARY KEY, CameraName TEXT, Timestamp INT, Score REAL,
+                ImgPath TEXT, AnnotatedPath TEXT)""")
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS deliveries (
+                DeliveryID INTEGER PRIMARY KEY, AlertID TEXT, Channel TEXT, Recipient TEXT,
+                Status TEXT, Attempts INT, NextAttempt REAL, ClaimedBy TEXT, ClaimedAt REAL, LastError TEXT)""")
+            self.conn.commit()
+
+
+    def _writeData(self, alertID, fileName, data):
+        spoolPath = os.path.join(self.spoolDir, alertID + '_' + fileName)
+        with open(spoolPath, 'wb') as dataFile:
+            dataFile.write(data)
+        return spoolPath
+
+
+    def addAlert(self, cameraID, timestamp, score, image, annotatedImage, deliveries):
+        """Add an alert to the spool
+
+        Args:
+            cameraID (str): camera name
+            timestamp (int): time the image was taken
+            score (float): smoke score
+            image (tuple): (file name, JPEG bytes) of the original image
+            annotatedImage (tuple): optional (file name, JPEG bytes) of the annotated image
+            deliveries (list): list of (channel, recipient) tuples
+
+        Returns:
+            ID of the alert
+        """
+        alertID = uuid.uuid4().hex
+        spoolImgPath = self._writeData(alertID, *image)
+        spoolAnnotatedPath = self._writeData(alertID, *annotatedImage) if annotatedImage else ''
+        timeNow = time.time()
+        with self.lock:
+            self.conn.execute('INSERT INTO alerts VALUES (?, ?, ?, ?, ?, ?)',
+                              (alertID, cameraID, int(timestamp), float(score), spoolImgPath, spoolAnnotatedPath))
+            self.conn.executemany("""INSERT INTO deliveries (AlertID, Channel, Recipient, Status, Attempts, NextAttempt)
+                VALUES (?, ?, ?, 'pending', 0, ?)""",
+                [(alertID, channel, recipient, timeNow) for (channel, recipient) in deliveries])
+            self.conn.commit()
+        if not deliveries:
+            self._removeIfDone(alertID)
+        return alertID
+
+
+    def claimDue(self, owner, timeNow, channelLimits=None):
+        """Claim the deliveries that are due to be sent
+
+        Args:
+            owner (str): ID of the claiming dispatcher
+            timeNow (float): current time
+            channelLimits (dict): optional channel -> maximum number of deliveries to claim.
+                                  Only the given channels are claimed (default all)
+
+        Returns:
+            List of dictionaries with the delivery and alert information
+        """
+        with self.lock:
+            self.conn.execute("""UPDATE deliveries SET Status='pending'
+                WHERE Status='sending' AND ClaimedAt < ?""", (timeNow - self.staleSeconds,))
+            if channelLimits == None:
+                self.conn.execute("""UPDATE deliveries SET Status='sending', ClaimedBy=?, ClaimedAt=?
+                    WHERE Status='pending' AND NextAttempt <= ?""", (owner, timeNow, timeNow))
+            for (channel, limit) in (channelLimits or {}).items():
+                if limit > 0:
+                    self.conn.execute("""UPDATE deliveries SET Status='sending', ClaimedBy=?, ClaimedAt=?
+                        WHERE DeliveryID IN (SELECT DeliveryID FROM deliveries
+                        WHERE Status='pending' AND NextAttempt <= ? AND Channel=? ORDER BY NextAttempt LIMIT ?)""",
+                        (owner, timeNow, timeNow, channel, limit))
+            self.conn.commit()
+            rows = self.conn.execute("""SELECT * FROM deliveries JOIN alerts USING (AlertID)
+                WHERE Status='sending' AND ClaimedBy=? AND ClaimedAt=?""", (owner, timeNow)).fetchall()
+        return [dict(row) for row in rows]
+
+
+    def markSent(self, deliveryID, alertID):
+        with self.lock:
+            self.conn.execute("UPDATE deliveries SET Status='sent' WHERE DeliveryID=?", (deliveryID,))
+            self.conn.commit()
+        self._removeIfDone(alertID)
+
+
+    def markFailed(self, deliveryID, alertID, error, nextAttempt=None):
+        """Record a failed delivery attempt
+
+        Args:
+            deliveryID (int):
+            alertID (str):
+            error (str): description of the failure
+            nextAttempt (float): time of the next attempt, or None to give up
+        """
+        with self.lock:
+            self.conn.execute("""UPDATE deliveries SET Status=?, Attempts=Attempts+1, NextAttempt=?, LastError=?
+                WHERE DeliveryID=?""",
+                ('pending' if nextAttempt else 'failed', nextAttempt or 0, error, deliveryID))
+            self.conn.commit()
+        if not nextAttempt:
+            self._removeIfDone(alertID)
+
+
+    def _removeIfDone(self, alertID):
+        """Remove the alert and its files once all its deliveries were sent or failed
+        """
+        with self.lock:
+            remaining = self.conn.execute("""SELECT COUNT(*) FROM deliveries
+                WHERE AlertID=? AND Status IN ('pending', 'sending')""", (alertID,)).fetchone()[0]
+            if remaining:
+                return
+            alert = self.conn.execute('SELECT * FROM alerts WHERE AlertID=?', (alertID,)).fetchone()
+            self.conn.execute('DELETE FROM deliveries WHERE AlertID=?', (alertID,))
+            self.conn.execute('DELETE FROM alerts WHERE AlertID=?', (alertID,))
+            self.conn.commit()
+        if alert:
+            for filePath in [alert['ImgPath'], alert['AnnotatedPath']]:
+                if filePath and os.path.exists(filePath):
+                    os.remove(filePath)
+
+
+    def getStats(self):
+        """Get the number of deliveries in each status
+
+        Returns:
+            Dictionary of status -> count
+        """
+        with self.lock:
+            rows = self.conn.execute('SELECT Status, COUNT(*) as cnt FROM deliveries GROUP BY Status').fetchall()
+        return {row['Status']: row['cnt'] for row in rows}
+
+
+class AlertDispatcher(object):
+    def __init__(self, spool, sendFns, channelWorkers=None, maxAttempts=5, retrySeconds=30, pollSeconds=5):
+        """Alert dispatcher constructor
+
+        Args:
+            spool (AlertSpool):
+            sendFns (dict): channel -> function that sends given delivery dictionary, returning True on success
+            channelWorkers (dict): optional channel -> number of concurrent sends (default 1)
+            maxAttempts (int): maximum number of attempts per delivery
+            retrySeconds (int): delay before first retry, doubled for each later retry
+            pollSeconds (int): how often to check the spool for due deliveries
+        """
+        self.spool = spool
+        self.sendFns = sendFns
+        self.maxAttempts = maxAttempts
+        self.retrySeconds = retrySeconds
+        self.pollSeconds = pollSeconds
+        self.owner = '%s:%d:%s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.channelWorkers = {channel: (channelWorkers or {}).get(channel, 1) for channel in sendFns}
+        self.executors = {channel: concurrent.futures.ThreadPoolExecutor(max_workers=self.channelWorkers[channel],
+                                                                         thread_name_prefix='alert-' + channel)
+                          for channel in sendFns}
+        self.lock = threading.Lock()
+        self.inFlight = {channel: set() for channel in sendFns} # delivery IDs submitted but not finished
+        self.wakeEvent = threading.Event()
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+
+    def _deliver(self, delivery):
+        try:
+            self._attempt(delivery)
+        finally:
+            with self.lock:
+                self.inFlight[delivery['Channel']].discard(delivery['DeliveryID'])
+            self.wakeEvent.set() # a worker is idle, so claim the next due delivery
+
+
+    def _attempt(self, delivery):
+        try:
+            if self.sendFns[delivery['Channel']](delivery):
+                self.spool.markSent(delivery['DeliveryID'], delivery['AlertID'])
+                return
+            error = 'send failed'
+        except Exception as e:
+            error = str(e)
+        attempts = delivery['Attempts'] + 1
+        nextAttempt = None
+        if attempts < self.maxAttempts:
+            nextAttempt = time.time() + self.retrySeconds * 2 ** (attempts - 1)
+        logging.error('Alert %s delivery to %s attempt %d failed (%s). %s', delivery['Channel'], delivery['Recipient'],
+                      attempts, error, 'Will retry' if nextAttempt else 'Giving up')
+        self.spool.markFailed(delivery['DeliveryID'], delivery['AlertID'], error, nextAttempt)
+
+
+    def dispatchDue(self):
+        """Submit due deliveries to the channel thread pools, up to the number of idle workers per channel
+
+        Returns:
+            list of futures for the submitted deliveries
+        """
+        with self.lock:
+            channelLimits = {channel: self.channelWorkers[channel] - len(self.inFlight[channel])
+                             for channel in self.executors}
+        futures = []
+        for delivery in self.spool.claimDue(self.owner, time.time(), channelLimits):
+            with self.lock:
+                inFlight = self.inFlight[delivery['Channel']]
+                if delivery['DeliveryID'] in inFlight:
+                    continue # claim went stale while still being sent
+                inFlight.add(delivery['DeliveryID'])
+            futures.append(self.executors[delivery['Channel']].submit(self._deliver, delivery))
+        return futures
+
+
+    def _run(self):
+        while not self.stopEvent.is_set():
+            try:
+                self.dispatchDue()
+            except Exception as e:
+                logging.error('Alert dispatch error: %s', str(e))
+            self.wakeEvent.wait(self.pollSeconds)
+            self.wakeEvent.clear()
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='alert-dispatcher', daemon=True)
+        self.thread.start()
+
+
+    def wakeup(self):
+        """Check the spool now (e.g., after adding an alert)
+        """
+        self.wakeEvent.set()
+
+
+    def stop(self):
+        """Stop dispatching after the sends in progress finish
+
+        Deliveries not yet sent stay in the spool for the next run
+        """
+        self.stopEvent.set()
+        self.wakeEvent.set()
+        if self.thread:
+            self.thread.join()
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
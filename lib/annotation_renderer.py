@@ -0,0 +1,111 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Render the fire detection annotations (bounding box and scores) in memory
+
+Works on the already decoded frame array and returns the JPEG bytes, so
+detections don't re-read the image or write annotated files.  Fonts are
+loaded once per size.
+
+"""
+
+import functools
+import io
+import os
+from PIL import Image, ImageDraw, ImageFont
+
+FONT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Roboto-Regular.ttf')
+
+
+@functools.lru_cache(maxsize=None)
+def getFont(fontSize):
+    """Get the annotation font of given size (cached)
+
+    Args:
+        fontSize (int): font size in pixels
+
+    Returns:
+        PIL FreeTypeFont
+    """
+    return ImageFont.truetype(FONT_FILE, size=fontSize)
+
+
+def drawCenteredText(imgDraw, centerX, y, text, fontSize, color):
+    font = getFont(fontSize)
+    (left, top, right, bottom) = imgDraw.textbbox((0, 0), text, font=font)
+    imgDraw.text((centerX - (right - left)/2, y), text, font=font, fill=color)
+
+
+def drawFireBox(img, fireSegment, lineWidth=3):
+    """Draw bounding box of fire detection with its score (red) and historical max (blue) on given image
+
+    Args:
+        img (PIL Image): image to draw on
+        fireSegment (dictionary): dictionary with information for the segment with fire/smoke
+        lineWidth (int): width of the bounding box lines
+    """
+    imgDraw = ImageDraw.Draw(img)
+    x0 = fireSegment['MinX']
+    y0 = fireSegment['MinY']
+    x1 = fireSegment['MaxX']
+    y1 = fireSegment['MaxY']
+    centerX = (x0 + x1)/2
+    centerY = (y0 + y1)/2
+    imgDraw.rectangle((x0, y0, x1, y1), outline='red', width=lineWidth)
+    scoreStr = '%.2f' % fireSegment['score']
+    textHeight = imgDraw.textbbox((0, 0), scoreStr, font=getFont(80))[3]
+    drawCenteredText(imgDraw, centerX, centerY - textHeight, scoreStr, 80, 'red')
+    drawCenteredText(imgDraw, centerX, centerY, '%.2f' % fireSegment['HistMax'], 70, 'blue')
+
+
+def encodeJpeg(img, quality=90):
+    """Encode given image as JPEG in memory
+
+    Args:
+        img (PIL Image):
+        quality (int): JPEG quality
+
+    Returns:
+        bytes of the JPEG file
+    """
+    jpegBuffer = io.BytesIO()
+    img.save(jpegBuffer, format='JPEG', quality=quality)
+    return jpegBuffer.getvalue()
+
+
+def renderFireBox(imgArray, fireSegment, quality=90):
+    """Render the fire detection annotations on a copy of given frame
+
+    Args:
+        imgArray (numpy array): HxWx3 uint8 array of the decoded frame (not modified)
+        fireSegment (dictionary): dictionary with information for the segment with fire/smoke
+        quality (int): JPEG quality
+
+    Returns:
+        bytes of the annotated JPEG
+    """
+    img = Image.fromarray(imgArray).copy() # frame array may be shared with segments and read only
+    drawFireBox(img, fireSegment)
+    jpegBytes = encodeJpeg(img, quality)
+    img.close()
+    return jpegBytes
+
+
+def getAnnotatedName(imgPath):
+    """Get the file name used for the annotated version of given image (e.g., for drive and attachments)
+    """
+    filePathParts = os.path.splitext(os.path.basename(imgPath))
+    return filePathParts[0] + '_Score' + filePathParts[1]
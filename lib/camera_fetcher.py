@@ -0,0 +1,157 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Fetch images from live cameras into memory using pooled HTTP connections.
+
+A single CameraFetcher is shared by all the fetcher threads of a detection
+process (e.g., the fetch stage workers in detect_fire), so N fetches can be
+in flight at once while reusing keep-alive connections and limiting the
+number of concurrent requests to any single camera host.
+
+Unchanged images are skipped as cheaply as possible: conditional requests
+(If-None-Match / If-Modified-Since) are sent to cameras that provide ETag or
+Last-Modified headers, the md5 is computed while the data streams in, and each
+camera's recent hashes are remembered so stale frames are never decoded.
+
+"""
+
+import collections
+import hashlib
+import logging
+import threading
+import time
+import urllib.parse
+import requests
+import requests.adapters
+
+
+class CameraFetcher(object):
+    def __init__(self, cameraScheduler, cameras, maxConnections=8, maxPerHost=2, timeoutSeconds=(5, 20),
+                 numRecentHashes=5):
+        """Camera image fetcher constructor
+
+        Args:
+            cameraScheduler (CameraScheduler): used to pick the next camera
+            cameras (list): list of cameras
+            maxConnections (int): maximum number of pooled connections per host
+            maxPerHost (int): maximum number of concurrent requests to the same host
+            timeoutSeconds (tuple): (connect, read) timeouts for each request
+            numRecentHashes (int): number of recent image hashes to remember per camera
+        """
+        self.cameraScheduler = cameraScheduler
+        self.cameras = cameras
+        self.maxPerHost = maxPerHost
+        self.timeoutSeconds = timeoutSeconds
+        self.session = requests.Session()
+        numHosts = len(set(urllib.parse.urlparse(camera['url']).netloc for camera in cameras))
+        adapter = requests.adapters.HTTPAdapter(pool_connections=max(numHosts, 1), pool_maxsize=maxConnections)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.numRecentHashes = numRecentHashes
+        self.lock = threading.Lock()
+        self.hostSemaphores = {}
+        self.cameraStates = {}
+
+
+    def _getHostSemaphore(self, url):
+        host = urllib.parse.urlparse(url).netloc
+        with self.lock:
+            if host not in self.hostSemaphores:
+                self.hostSemaphores[host] = threading.BoundedSemaphore(self.maxPerHost)
+            return self.hostSemaphores[host]
+
+
+    def _getCameraState(self, camera):
+        """Get the conditional request validators and recent hashes for given camera
+        """
+        with self.lock:
+            if camera['name'] not in self.cameraStates:
+                self.cameraStates[camera['name']] = {
+                    'etag': None,
+                    'lastModified': None,
+                    'recentHashes': collections.deque(maxlen=self.numRecentHashes),
+                }
+            return self.cameraStates[camera['name']]
+
+
+    def _download(self, camera, cameraState):
+        """Download the current image from given camera into memory
+
+        Uses a conditional request if the camera supports it and computes the
+        md5 hash while streaming the data
+
+        Args:
+            camera (dict): camera information
+            cameraState (dict): camera state from _getCameraState()
+
+        Returns:
+            Tuple containing image bytes and md5, or None on failure or if image not modified
+        """
+        headers = {}
+        if cameraState['etag']:
+            headers['If-None-Match'] = cameraState['etag']
+        if cameraState['lastModified']:
+            headers['If-Modified-Since'] = cameraState['lastModified']
+        with self._getHostSemaphore(camera['url']):
+            try:
+                response = self.session.get(camera['url'], headers=headers, timeout=self.timeoutSeconds, stream=True)
+                with response:
+                    if response.status_code == 304:
+                        logging.warning('Camera %s image not modified', camera['name'])
+                        return None
+                    response.raise_for_status()
+                    md5 = hashlib.md5()
+                    imgBytes = bytearray()
+                    for chunk in response.iter_content(chunk_size=64*1024):
+                        md5.update(chunk)
+                        imgBytes += chunk
+                    cameraState['etag'] = response.headers.get('ETag')
+                    cameraState['lastModified'] = response.headers.get('Last-Modified')
+                    return (bytes(imgBytes), md5.hexdigest())
+            except Exception as e:
+                logging.error('Error fetching image from %s %s', camera['name'], str(e))
+                return None
+
+
+    def fetchNext(self):
+        """Fetch the next changed image from the cameras
+
+        Cameras whose image failed to download, was not modified, or matches
+        one of the recent images are skipped.  Gives up after a full rotation
+        of skipped cameras or if no camera is due, so callers can check whether
+        to stop.  Safe to call from multiple threads.
+
+        Returns:
+            Tuple containing camera name, current timestamp, image bytes, md5 of the image, and
+            whether the camera was fetched for a re-check, or None if no changed image was found
+        """
+        for numSkipped in range(len(self.cameras)):
+            camera = self.cameraScheduler.getNextCamera()
+            if not camera:
+                return None
+            timestamp = int(time.time())
+            cameraState = self._getCameraState(camera)
+            downloaded = self._download(camera, cameraState)
+            if downloaded:
+                (imgBytes, md5) = downloaded
+                if md5 not in cameraState['recentHashes']:
+                    self.cameraScheduler.releaseCamera(camera)
+                    cameraState['recentHashes'].append(md5)
+                    return (camera['name'], timestamp, imgBytes, md5, bool(camera.get('recheck')))
+                logging.warning('Camera %s image unchanged', camera['name'])
+            self.cameraScheduler.releaseCamera(camera, changed=False)
+        time.sleep(1) # all cameras are down or unchanged, so avoid spinning
+        return None
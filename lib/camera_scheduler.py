@@ -0,0 +1,133 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Distribute cameras across cooperating detection processes using time limited leases.
+
+Each process claims a small batch of cameras at a time from the camera_leases
+table.  Cameras are released once their images have been fetched, together
+with the next claim.  Cameras held by a process that died become available
+again when their leases expire.  Compared to the shared sources counter, this
+needs DB round trips only once per batch instead of once per image, and claims
+by different processes don't conflict.
+
+With a ScanPriority, each released camera isn't claimable again until its
+next due time, so cameras are scanned at different rates based on their
+priorities instead of round robin.
+
+With affinitySeconds, each process claims the cameras it leased before ahead
+of the cameras last leased by other processes, so cameras mostly stay with the
+same process.  Live image difference detection needs this because the earlier
+frames are only buffered in the memory of the process that fetched them.
+Cameras that the owner didn't reclaim within affinitySeconds are claimed by
+others as usual, so cameras of processes that died are picked up.
+
+With a RecheckQueue, cameras due for a re-check are returned first, without
+claiming their leases, since re-checks are brief.  These cameras are tagged
+with 'recheck' so the detection policy can tell re-check frames apart from
+frames of the regular rotation.
+
+"""
+
+import collections
+import logging
+import os
+import socket
+import threading
+import time
+
+
+class CameraScheduler(object):
+    def __init__(self, dbManager, cameras, batchSize=4, leaseSeconds=5*60, scanPriority=None, recheckQueue=None,
+                 affinitySeconds=None):
+        """Camera scheduler constructor
+
+        Args:
+            dbManager (DbManager):
+            cameras (list): list of cameras this process may scan
+            batchSize (int): number of cameras to claim at a time
+            leaseSeconds (int): number of seconds before an unreleased lease expires
+            scanPriority (ScanPriority): optional adaptive scan intervals (default round robin)
+            recheckQueue (RecheckQueue): optional queue of cameras to re-check promptly
+            affinitySeconds (int): optional time other processes get to reclaim their cameras first
+        """
+        self.dbManager = dbManager
+        self.cameras = {camera['name']: camera for camera in cameras}
+        self.batchSize = batchSize
+        self.leaseSeconds = leaseSeconds
+        self.owner = '%s:%d' % (socket.gethostname(), os.getpid())
+        self.lock = threading.Lock()
+        self.claimed = collections.deque()
+        self.released = []
+        self.nextDueTimes = {}
+        self.scanPriority = scanPriority
+        self.recheckQueue = recheckQueue
+        self.affinitySeconds = affinitySeconds
+        dbManager.initCameraLeases(list(self.cameras.keys()))
+
+
+    def getNextCamera(self):
+        """Get the next camera to scan, claiming a new batch of leases if needed
+
+        Waits a second and returns None if all cameras are leased by other
+        processes (or not due yet), so callers can check whether to stop.
+        Safe to call from multiple threads.
+
+        Returns:
+            camera (dict, with 'recheck' set if due for a re-check) or None if no camera is available
+        """
+        if self.recheckQueue:
+            cameraName = self.recheckQueue.popDueCamera(time.time())
+            if cameraName in self.cameras:
+                return dict(self.cameras[cameraName], recheck=True)
+        with self.lock:
+            if not self.claimed:
+                if self.released:
+                    self.dbManager.releaseCameraLeases(self.owner, self.released, self.nextDueTimes)
+                    self.released = []
+                    self.nextDueTimes = {}
+                cameraNames = self.dbManager.claimCameraLeases(self.owner, list(self.cameras.keys()),
+                                                               self.batchSize, self.leaseSeconds, self.affinitySeconds)
+                self.claimed.extend(cameraNames)
+            if self.claimed:
+                return self.cameras[self.claimed.popleft()]
+        if not self.scanPriority:
+            logging.warning('All cameras leased by other processes. Waiting')
+        time.sleep(1)
+        return None
+
+
+    def releaseCamera(self, camera, changed=True):
+        """Release the lease on the given camera after it has been scanned
+
+        The release is sent to the DB along with the next claim
+
+        Args:
+            camera (dict)
+            changed (bool): False if the download failed or the image was unchanged
+        """
+        if camera.get('recheck'):
+            if not changed:
+                self.recheckQueue.retry(camera['name'], time.time())
+            return
+        nextDueTime = None
+        if self.scanPriority:
+            self.scanPriority.recordFetch(camera['name'], changed)
+            timeNow = time.time()
+            nextDueTime = timeNow + self.scanPriority.getInterval(camera['name'], timeNow)
+        with self.lock:
+            self.released.append(camera['name'])
+            if nextDueTime:
+                self.nextDueTimes[camera['name']] = nextDueTime
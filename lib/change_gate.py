@@ -0,0 +1,182 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Skip classification of image segments that haven't changed
+
+Each segment is reduced to a small grayscale thumbnail (block averages), and
+compared with the thumbnail of the same segment the last time it was scored.
+Segments whose mean absolute difference is below the change threshold reuse
+the previous score.  Comparing against the last scored thumbnail (vs. the
+previous frame) means slow changes such as a growing smoke plume still
+accumulate until the segment is rescored.  Every N frames of a camera all
+segments are rescored regardless.
+
+The forced rescores also measure how far the reused scores had drifted from
+the actual scores, which together with the skip rate shows the trade-off
+between CPU saved and accuracy.
+
+"""
+
+import logging
+import threading
+import numpy as np
+
+
+def getThumbnail(imgArray, blockSize):
+    """Reduce the given image array to grayscale averages of blockSize x blockSize blocks
+
+    Args:
+        imgArray (numpy array): HxWxC array of the image segment
+        blockSize (int): size of each block
+
+    Returns:
+        float32 numpy array of shape (H // blockSize, W // blockSize)
+    """
+    height = (imgArray.shape[0] // blockSize) * blockSize
+    width = (imgArray.shape[1] // blockSize) * blockSize
+    blocks = imgArray[:height, :width].reshape(height // blockSize, blockSize, width // blockSize, blockSize, -1)
+    return blocks.mean(axis=(1, 3, 4), dtype=np.float32)
+
+
+class SegmentChangeGate(object):
+    def __init__(self, changeThreshold=2.0, rescoreFrames=10, blockSize=13):
+        """Segment change gate constructor
+
+        Args:
+            changeThreshold (float): mean absolute difference of thumbnails (0-255 scale)
+                                     below which the previous score is reused.  0 disables the gate
+            rescoreFrames (int): rescore all segments of a camera every this many frames
+            blockSize (int): size of the blocks averaged in the thumbnails
+        """
+        self.changeThreshold = changeThreshold
+        self.rescoreFrames = rescoreFrames
+        self.blockSize = blockSize
+        self.lock = threading.Lock()
+        self.cameraStates = {}
+        self.resetStats()
+
+
+    def resetStats(self):
+        with self.lock:
+            self.stats = {
+                'frames': 0,
+                'segments': 0,
+                'skipped': 0,
+                'driftSamples': 0,
+                'driftSum': 0.0,
+                'driftMax': 0.0,
+            }
+
+
+    def _getCameraState(self, camera):
+        with self.lock:
+            if camera not in self.cameraStates:
+                self.cameraStates[camera] = {
+                    'frameCount': 0,
+                    'segments': {}, # coords -> (thumbnail, score, prefiltered) when last scored
+                }
+            return self.cameraStates[camera]
+
+
+    def selectSegments(self, camera, segments):
+        """Select the segments that changed and need to be classified
+
+        Unchanged segments get the previous 'score' and 'prefiltered' flag (see
+        tf_helper.CascadeClassifier), and 'scoreReused'.  After the selected
+        segments are classified, call updateSegments().
+
+        Args:
+            camera (str): camera name
+            segments (list): List of dictionary containing 'imgArray' for each segment
+
+        Returns:
+            Tuple of list of segments to classify and pending state for updateSegments()
+        """
+        if not self.changeThreshold:
+            return (segments, None)
+        cameraState = self._getCameraState(camera)
+        forceRescore = (cameraState['frameCount'] % self.rescoreFrames) == 0
+        cameraState['frameCount'] += 1
+        thumbnails = []
+        unchanged = []
+        toScore = []
+        for segmentInfo in segments:
+            coords = (segmentInfo['MinX'], segmentInfo['MinY'], segmentInfo['MaxX'], segmentInfo['MaxY'])
+            thumbnail = getThumbnail(segmentInfo['imgArray'], self.blockSize)
+            thumbnails.append((coords, thumbnail))
+            previous = cameraState['segments'].get(coords)
+            isUnchanged = (previous != None) and (previous[0].shape == thumbnail.shape) and \
+                (np.abs(thumbnail - previous[0]).mean() < self.changeThreshold)
+            if isUnchanged and not forceRescore:
+                segmentInfo['score'] = previous[1]
+                segmentInfo['scoreReused'] = True
+                if previous[2]:
+                    segmentInfo['prefiltered'] = True
+            else:
+                toScore.append(segmentInfo)
+                if isUnchanged:
+                    unchanged.append((segmentInfo, previous[1]))
+        return (toScore, {'thumbnails': thumbnails, 'unchanged': unchanged, 'numScored': len(toScore)})
+
+
+    def updateSegments(self, camera, segments, pending):
+        """Remember the newly classified segments and update the stats
+
+        Args:
+            camera (str): camera name
+            segments (list): same segments given to selectSegments() with all scores set
+            pending: pending state returned by selectSegments()
+        """
+        if pending == None:
+            with self.lock:
+                self.stats['frames'] += 1
+                self.stats['segments'] += len(segments)
+            return
+        cameraState = self._getCameraState(camera)
+        for (segmentInfo, (coords, thumbnail)) in zip(segments, pending['thumbnails']):
+            if not segmentInfo.get('scoreReused'):
+                cameraState['segments'][coords] = (thumbnail, segmentInfo['score'],
+                                                   segmentInfo.get('prefiltered', False))
+        with self.lock:
+            self.stats['frames'] += 1
+            self.stats['segments'] += len(segments)
+            self.stats['skipped'] += len(segments) - pending['numScored']
+            for (segmentInfo, previousScore) in pending['unchanged']:
+                drift = abs(float(segmentInfo['score']) - float(previousScore))
+                self.stats['driftSamples'] += 1
+                self.stats['driftSum'] += drift
+                self.stats['driftMax'] = max(self.stats['driftMax'], drift)
+
+
+    def getStats(self):
+        """Get the statistics on skipped segments and score drift
+
+        Returns:
+            Dictionary with number of frames and segments, skipRate, and the average
+            and max score drift of unchanged segments measured on forced rescores
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        stats['skipRate'] = stats['skipped'] / stats['segments'] if stats['segments'] else 0
+        stats['driftAvg'] = stats['driftSum'] / stats['driftSamples'] if stats['driftSamples'] else 0
+        return stats
+
+
+    def logStats(self):
+        stats = self.getStats()
+        logging.warning('Change gate: frames %d, segments %d, skip rate %.2f, drift avg %.4f, max %.4f (%d samples)',
+                        stats['frames'], stats['segments'], stats['skipRate'], stats['driftAvg'],
+                        stats['driftMax'], stats['driftSamples'])
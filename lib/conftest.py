@@ -0,0 +1,31 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Fixtures shared by the lib tests
+
+"""
+
+import db_manager
+import pytest
+import os
+import tempfile
+
+
+@pytest.fixture
+def dbManager():
+    """DbManager backed by a fresh sqlite file in a temporary directory"""
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        yield db_manager.DbManager(sqliteFile=os.path.join(tmpDirName, 'test.db'))
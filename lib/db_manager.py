@@ -27,6 +27,7 @@ backends.
 
 import logging
 import sqlite3
+import threading
 import time, datetime
 import psycopg2
 import psycopg2.extras
@@ -53,6 +54,8 @@ class DbManager(object):
         The DB connection and cursors are setup to return a query results
         in dictionory vs. list format for reliable processing.
         To avoid dangling transactions, the default mode is to immediately commit tx.
+        The connection may be shared by multiple threads, so all DB operations
+        are serialized with a lock.
 
         Args:
             sqliteFile (str): file path to SQLite DB (if specified postgres parameters are ignored)
@@ -62,10 +65,11 @@ class DbManager(object):
             psqlPasswd (str): Password for authentication to postgreSQL server
         """
         self.dbType = None
+        self.lock = threading.RLock()
         if sqliteFile:
             logging.warning('using sqlite %s', sqliteFile)
             self.dbType = 'sqlite'
-            self.conn = sqlite3.connect(sqliteFile)
+            self.conn = sqlite3.connect(sqliteFile, check_same_thread=False)
             self.conn.row_factory = _dict_factory
         elif psqlHost:
             logging.warning('using postgres %s', psqlHost)
@@ -193,6 +197,37 @@ class DbManager(object):
             ('PhoneEndTime', 'INT'),
         ]
 
+        # aggregated scores for each camera segment in fixed size time buckets.
+        # BucketStart identifies both the day and the time of day bucket
+        score_rollups_schema = [
+            ('CameraName', 'TEXT'),
+            ('MinX', 'INT'),
+            ('MinY', 'INT'),
+            ('MaxX', 'INT'),
+            ('MaxY', 'INT'),
+            ('BucketStart', 'INT'),
+            ('MaxScore', 'REAL'),
+            ('SumScore', 'REAL'),
+            ('NumSamples', 'INT'),
+        ]
+
+        # camera segments that are skipped by detection (e.g., sky, overlays, obstructions)
+        segment_masks_schema = [
+            ('CameraName', 'TEXT'),
+            ('MinX', 'INT'),
+            ('MinY', 'INT'),
+            ('MaxX', 'INT'),
+            ('MaxY', 'INT'),
+            ('Reason', 'TEXT'),
+        ]
+
+        # lease on each camera held by detection process currently responsible for it
+        camera_leases_schema = [
+            ('CameraName', 'TEXT'),
+            ('LeaseOwner', 'TEXT'),
+            ('LeaseExpires', 'INT'),
+        ]
+
         self.tables = {
             'sources': sources_schema,
             'counters': counters_schema,
@@ -205,6 +240,16 @@ class DbManager(object):
             'alerts': alerts_schema,
             'archive': archive_schema,
             'notifications': notifications_schema,
+            'camera_leases': camera_leases_schema,
+            'score_rollups': score_rollups_schema,
+            'segment_masks': segment_masks_schema,
+        }
+
+        # columns that must have unique values in given tables
+        self.uniqueIndexes = {
+            'camera_leases': ['CameraName'],
+            'score_rollups': ['CameraName', 'MinX', 'MinY', 'MaxX', 'MaxY', 'BucketStart'],
+            'segment_masks': ['CameraName', 'MinX', 'MinY', 'MaxX', 'MaxY'],
         }
 
         self.sources_table_name = 'sources'
@@ -239,11 +284,12 @@ class DbManager(object):
             commit (bool): [default true] - If true, transaction is committed
 
         """
-        cursor = self._getCursor()
-        cursor.execute(sqlCmd)
-        if commit:
-            self.conn.commit()
-        cursor.close()
+        with self.lock:
+            cursor = self._getCursor()
+            cursor.execute(sqlCmd)
+            if commit:
+                self.conn.commit()
+            cursor.close()
 
 
     def add_data(self, tableName, keyValues, commit=True):
@@ -278,8 +324,44 @@ class DbManager(object):
         self.execute(db_command, commit=commit)
 
 
+    def add_rows(self, tableName, rows, commit=True):
+        """Insert given rows into given table using bulk parameterized insert
+
+        Faster than add_data() for many rows: uses execute_values on postgres
+        and executemany on sqlite, without formatting the values into the SQL
+
+        Args:
+            tableName (str):
+            rows (list): list of dictionaries with the same keys
+            commit (bool): [default true] - If true, transaction is committed
+        """
+        if not rows:
+            return
+        columns = list(rows[0].keys())
+        valuesList = [tuple(row[col] for col in columns) for row in rows]
+        sqlTemplate = 'INSERT INTO {table_name} ({fields}) VALUES {values}'
+        with self.lock:
+            cursor = self._getCursor()
+            if self.dbType == 'psql':
+                sqlStr = sqlTemplate.format(table_name=tableName, fields=', '.join(columns), values='%s')
+                psycopg2.extras.execute_values(cursor, sqlStr, valuesList, page_size=1000)
+            else:
+                sqlStr = sqlTemplate.format(table_name=tableName, fields=', '.join(columns),
+                                            values='(%s)' % ', '.join('?' * len(columns)))
+                cursor.executemany(sqlStr, valuesList)
+            if commit:
+                self.conn.commit()
+            cursor.close()
+
+
     def commit(self):
-        self.conn.commit()
+        with self.lock:
+            self.conn.commit()
+
+
+    def rollback(self):
+        with self.lock:
+            self.conn.rollback()
 
 
     def query(self, queryStr):
@@ -292,14 +374,15 @@ class DbManager(object):
             Array of dictionary of name->value pairs
         """
         result = []
-        cursor = self._getCursor()
-        cursor.execute(queryStr)
-        row = cursor.fetchone()
-        while row:
-            result.append(row)
+        with self.lock:
+            cursor = self._getCursor()
+            cursor.execute(queryStr)
             row = cursor.fetchone()
-        self.conn.commit() # stop idle read transacations
-        cursor.close()
+            while row:
+                result.append(row)
+                row = cursor.fetchone()
+            self.conn.commit() # stop idle read transacations
+            cursor.close()
         return result
 
 
@@ -320,6 +403,13 @@ class DbManager(object):
                 )
             )
             cursor.execute(db_command)
+        sql_index_template = 'create unique index if not exists {table_name}_unique on {table_name} ({fields})'
+        for tableName, indexColumns in self.uniqueIndexes.items():
+            db_command = sql_index_template.format(
+                table_name = tableName,
+                fields = ", ".join(indexColumns)
+            )
+            cursor.execute(db_command)
         self.commit()
         cursor.close()
 
@@ -388,19 +478,20 @@ class DbManager(object):
             Old value of the counter
         """
         value = None
-        try:
-            cursor = self._getCursor()
-            (value, updatedRows) = self._incrementCounterInt(cursor, counterName)
-            if updatedRows != 1:
-                raise Exception('Conflict')
-            self.conn.commit()
-            cursor.close()
-            # print("Success", value, updatedRows)
-        except Exception as e:
-            self.conn.rollback()
-            cursor.close()
-            print("Error in increment.  Retrying", value, e)
-            return self.incrementCounter(counterName) # tail-recursive
+        with self.lock:
+            try:
+                cursor = self._getCursor()
+                (value, updatedRows) = self._incrementCounterInt(cursor, counterName)
+                if updatedRows != 1:
+                    raise Exception('Conflict')
+                self.conn.commit()
+                cursor.close()
+                # print("Success", value, updatedRows)
+            except Exception as e:
+                self.conn.rollback()
+                cursor.close()
+                print("Error in increment.  Retrying", value, e)
+                return self.incrementCounter(counterName) # tail-recursive
 
         return value
 
@@ -409,6 +500,155 @@ class DbManager(object):
         return self.incrementCounter('sources')
 
 
+    def upsertScoreRollups(self, rollupRows, commit=True):
+        """Merge the given aggregated scores into the score_rollups table
+
+        Rows for buckets that already exist are combined with the existing values
+        (max of max, sum of sums and counts) in the same statement
+
+        Args:
+            rollupRows (list): list of dictionaries with same keys as score_rollups columns
+            commit (bool): [default true] - If true, transaction is committed
+        """
+        if not rollupRows:
+            return
+        keyColumns = self.uniqueIndexes['score_rollups']
+        columns = keyColumns + ['MaxScore', 'SumScore', 'NumSamples']
+        valuesStr = ', '.join('(%s)' % ', '.join(repr(row[col]) for col in columns) for row in rollupRows)
+        maxFn = 'GREATEST' if self.dbType == 'psql' else 'MAX'
+        sqlTemplate = """INSERT INTO score_rollups ({columns}) VALUES {values}
+        ON CONFLICT ({keys}) DO UPDATE SET
+        MaxScore = {maxFn}(score_rollups.MaxScore, excluded.MaxScore),
+        SumScore = score_rollups.SumScore + excluded.SumScore,
+        NumSamples = score_rollups.NumSamples + excluded.NumSamples"""
+        sqlStr = sqlTemplate.format(columns=', '.join(columns), values=valuesStr,
+                                    keys=', '.join(keyColumns), maxFn=maxFn)
+        self.execute(sqlStr, commit=commit)
+
+
+    def rebuildScoreRollups(self, startTime, endTime, bucketSeconds):
+        """Recompute the score_rollups rows for given time range from the raw scores table
+
+        The existing rollups in the range are replaced in a single transaction.
+        startTime and endTime should be aligned to bucketSeconds.
+
+        Args:
+            startTime (int): start of range (inclusive)
+            endTime (int): end of range (exclusive)
+            bucketSeconds (int): size of each time bucket
+        """
+        deleteTemplate = """DELETE FROM score_rollups WHERE BucketStart >= %s and BucketStart < %s"""
+        insertTemplate = """INSERT INTO score_rollups
+        (CameraName, MinX, MinY, MaxX, MaxY, BucketStart, MaxScore, SumScore, NumSamples)
+        SELECT CameraName, MinX, MinY, MaxX, MaxY, (Timestamp / {bucket}) * {bucket} as bucketstart,
+        max(Score), sum(Score), count(*) FROM scores
+        WHERE Timestamp >= {start} and Timestamp < {end}
+        GROUP BY CameraName, MinX, MinY, MaxX, MaxY, bucketstart"""
+        # hold the lock across both statements so no other thread commits the half done transaction
+        with self.lock:
+            try:
+                self.execute(deleteTemplate % (startTime, endTime), commit=False)
+                self.execute(insertTemplate.format(bucket=bucketSeconds, start=startTime, end=endTime))
+            except Exception:
+                self.conn.rollback()
+                raise
+
+
+    def initCameraLeases(self, cameraNames):
+        """Make sure the camera_leases table has an entry for each of the given cameras
+
+        Args:
+            cameraNames (list): names of cameras
+        """
+        dbResult = self.query('SELECT CameraName FROM camera_leases')
+        existing = set(row['cameraname'] for row in dbResult)
+        for cameraName in cameraNames:
+            if cameraName not in existing:
+                # other processes may be adding same cameras concurrently
+                sqlTemplate = """INSERT INTO camera_leases (CameraName, LeaseOwner, LeaseExpires)
+                VALUES ('%s', '', 0) ON CONFLICT DO NOTHING"""
+                self.execute(sqlTemplate % cameraName)
+
+
+    def claimCameraLeases(self, owner, cameraNames, numCameras, leaseSeconds, affinitySeconds=None):
+        """Claim leases on up to numCameras of the given cameras that aren't leased by others
+
+        Cameras whose lease expired the longest time ago are claimed first, so
+        cameras rotate fairly across all the cooperating processes.  With
+        affinitySeconds, cameras last leased by other processes are only
+        claimed after the owner's own cameras, unless they were not reclaimed
+        within affinitySeconds of their lease expiring (e.g., owner died).
+        On postgres, concurrent claims skip rows locked by other transactions
+        (FOR UPDATE SKIP LOCKED), so they never block or conflict.  Sqlite has no
+        row locks, so the whole DB file is locked (BEGIN IMMEDIATE) for the claim.
+
+        Args:
+            owner (str): ID of the process claiming the leases
+            cameraNames (list): names of cameras eligible to be claimed
+            numCameras (int): maximum number of cameras to claim
+            leaseSeconds (int): number of seconds until the leases expire
+            affinitySeconds (int): optional time other processes get to reclaim their cameras first
+
+        Returns:
+            List of names of claimed cameras
+        """
+        timeNow = int(time.time())
+        namesStr = ', '.join("'%s'" % name for name in cameraNames)
+        orderStr = 'LeaseExpires'
+        if affinitySeconds:
+            orderStr = "CASE WHEN LeaseOwner='%s' OR LeaseExpires < %s THEN 0 ELSE 1 END, LeaseExpires" % (
+                owner, timeNow - affinitySeconds)
+        selectTemplate = """SELECT CameraName FROM camera_leases
+            WHERE LeaseExpires < %s AND CameraName IN (%s)
+            ORDER BY %s LIMIT %s"""
+        selectStr = selectTemplate % (timeNow, namesStr, orderStr, numCameras)
+        updateTemplate = "UPDATE camera_leases SET LeaseOwner='%s', LeaseExpires=%s WHERE CameraName IN (%s)"
+        with self.lock:
+            cursor = self._getCursor()
+            try:
+                if self.dbType == 'psql':
+                    sqlStr = updateTemplate % (owner, timeNow + leaseSeconds, selectStr + ' FOR UPDATE SKIP LOCKED')
+                    cursor.execute(sqlStr + ' RETURNING CameraName')
+                    rows = cursor.fetchall()
+                else:
+                    self.conn.commit() # BEGIN must not be inside another transaction
+                    cursor.execute('BEGIN IMMEDIATE')
+                    cursor.execute(selectStr)
+                    rows = cursor.fetchall()
+                    if rows:
+                        claimedStr = ', '.join("'%s'" % row['cameraname'] for row in rows)
+                        cursor.execute(updateTemplate % (owner, timeNow + leaseSeconds, claimedStr))
+                self.conn.commit()
+            except Exception as e:
+                self.conn.rollback()
+                raise e
+            finally:
+                cursor.close()
+        return [row['cameraname'] for row in rows]
+
+
+    def releaseCameraLeases(self, owner, cameraNames, nextDueTimes=None):
+        """Release the leases on given cameras held by given owner
+
+        The leases are marked as expired now, so the cameras go to the back of
+        the line for the next claimCameraLeases().  Cameras with a next due time
+        expire at that time instead, so they can't be claimed before then.
+
+        Args:
+            owner (str): ID of the process holding the leases
+            cameraNames (list): names of the cameras
+            nextDueTimes (dict): optional map of camera name to time it is next due for scanning
+        """
+        namesStr = ', '.join("'%s'" % name for name in cameraNames)
+        expiresStr = str(int(time.time()))
+        if nextDueTimes:
+            casesStr = ' '.join("WHEN '%s' THEN %s" % (name, int(dueTime)) for (name, dueTime) in nextDueTimes.items())
+            expiresStr = 'CASE CameraName %s ELSE %s END' % (casesStr, expiresStr)
+        sqlTemplate = """UPDATE camera_leases SET LeaseExpires=%s
+        WHERE CameraName IN (%s) AND LeaseOwner='%s'"""
+        self.execute(sqlTemplate % (expiresStr, namesStr, owner))
+
+
     def getNotifications(self, filterActiveEmail = False, filterActivePhone = False):
         """Get all the notifications matching optinal active email and phone filters
 
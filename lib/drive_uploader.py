@@ -0,0 +1,424 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Upload images to Google drive in the background
+
+upload() links (or copies) the file into the spool directory and returns
+immediately.  uploadData() keeps in memory data (e.g., annotated JPEGs) in
+memory unless it has to spill.  A small pool of worker threads, each with its own drive
+service (google API clients are not thread safe), uploads the files.  Up to
+maxQueued uploads are queued in memory, and the rest spill to the spool
+directory as JSON records, which are also picked up after a restart.
+Uploads that must not be lost if the process is killed (e.g., detection
+images whose drive IDs are recorded in the DB) can be made durable, which
+writes their records to the spool right away.
+
+Failed uploads are written back to the spool and retried with exponential
+backoff, up to maxAttempts.  The modification time of each record is the
+time of its next attempt.  Workers claim records by renaming them, and
+claims older than staleSeconds (e.g., of a killed process) are taken over.
+
+Drive batch requests don't support media uploads, so files are uploaded one
+per request.  The callbacks that record the drive IDs (e.g., patching the
+ImageID of DB rows written before the upload finished) are batched instead.
+
+"""
+
+import glob
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+
+import goog_helper
+
+
+class DriveUploader(object):
+    def __init__(self, serviceFactory, spoolDir, numWorkers=2, maxQueued=100, patchFn=None,
+                 patchBatchSize=20, pollSeconds=1, maxAttempts=10, retrySeconds=30, staleSeconds=10*60):
+        """Drive uploader constructor
+
+        Args:
+            serviceFactory (function): returns a new drive service (e.g., getGoogleServices()['drive'])
+            spoolDir (str): directory for the files waiting to be uploaded and the spilled queue
+            numWorkers (int): number of concurrent uploads
+            maxQueued (int): maximum number of uploads queued in memory before spilling to disk
+            patchFn (function): optional function called with list of (patch, driveID) for uploads
+                                given a patch
+            patchBatchSize (int): maximum number of patches given to one call of patchFn
+            pollSeconds (int): how often idle workers check for spilled uploads
+            maxAttempts (int): maximum number of attempts per upload
+            retrySeconds (int): delay before first retry, doubled for each later retry
+            staleSeconds (int): claims of spilled uploads older than this are considered abandoned
+        """
+        os.makedirs(spoolDir, exist_ok=True)
+        self.serviceFactory = serviceFactory
+        self.spoolDir = spoolDir
+        self.patchFn = patchFn
+        self.patchBatchSize = patchBatchSize
+        self.pollSeconds = pollSeconds
+        self.maxAttempts = maxAttempts
+        self.retrySeconds = retrySeconds
+        self.staleSeconds = staleSeconds
+        self.queue = queue.Queue(maxsize=maxQueued)
+        self.lock = threading.Lock()
+        self.pendingPatches = []
+        self.stopEvent = threading.Event()
+        self.stats = {
+            'queued': 0,
+            'spilled': 0,
+            'uploaded': 0,
+            'retried': 0,
+            'failed': 0,
+            'uploadSecondsSum': 0.0,
+            'uploadSecondsMax': 0.0,
+            'waitSecondsSum': 0.0,
+        }
+        self.workers = [threading.Thread(target=self._run, name='drive-upload-%d' % i, daemon=True)
+                        for i in range(numWorkers)]
+        for worker in self.workers:
+            worker.start()
+
+
+    def _spoolFile(self, filePath, move):
+        # separate directory per upload keeps the original file name for drive
+        uploadDir = os.path.join(self.spoolDir, uuid.uuid4().hex)
+        os.mkdir(uploadDir)
+        spoolPath = os.path.join(uploadDir, os.path.basename(filePath))
+        if move:
+            shutil.move(filePath, spoolPath)
+        else:
+            try:
+                os.link(filePath, spoolPath) # caller may delete its file while upload is pending
+            except OSError:
+                shutil.copyfile(filePath, spoolPath)
+        return spoolPath
+
+
+    def upload(self, dirID, filePath, patch=None, move=False, durable=False):
+        """Queue the given file for upload to given drive folder
+
+        Args:
+            dirID (str): destination drive ID of folder
+            filePath (str): path to local file to upload
+            patch: optional JSON serializable value given to patchFn with the drive ID of the upload
+            move (bool): move the file into the spool instead of linking or copying it
+            durable (bool): record the upload in the spool right away so it survives the process
+        """
+        item = {
+            'dirID': dirID,
+            'path': self._spoolFile(filePath, move),
+            'patch': patch,
+            'queuedAt': time.time(),
+        }
+        self._enqueue(item, durable)
+
+
+    def uploadData(self, dirID, fileName, data, patch=None, durable=False):
+        """Queue the given in memory file data for upload to given drive folder
+
+        The data is only written to the spool directory if the queue is full
+        or the upload is durable
+
+        Args:
+            dirID (str): destination drive ID of folder
+            fileName (str): name of the file in drive
+            data (bytes): JPEG file data
+            patch: optional JSON serializable value given to patchFn with the drive ID of the upload
+            durable (bool): record the upload in the spool right away so it survives the process
+        """
+        item = {
+            'dirID': dirID,
+            'name': fileName,
+            'data': data,
+            'patch': patch,
+            'queuedAt': time.time(),
+        }
+        self._enqueue(item, durable)
+
+
+    def _enqueue(self, item, durable):
+        with self.lock:
+            self.stats['queued'] += 1
+        if durable:
+            item = dict(self._writeRecord(item), durable=True)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            if not durable: # durable uploads are picked up from the spool
+                self._spill(item)
+
+
+    def _getRecordPath(self, path):
+        """Get the path of the JSON record for given spooled file or record (claimed or not)
+        """
+        # upload directories and records are named by uuid hex, so the first '.' starts the extension
+        return os.path.join(self.spoolDir, os.path.basename(path).split('.')[0] + '.json')
+
+
+    def _writeRecord(self, item, nextAttempt=None):
+        """Write the JSON record (and any in memory data) of given upload to the spool
+
+        Args:
+            item (dict): upload item
+            nextAttempt (float): optional time of next attempt (default now)
+
+        Returns:
+            upload item referring to the spooled file instead of in memory data
+        """
+        if 'data' in item:
+            uploadDir = os.path.join(self.spoolDir, uuid.uuid4().hex)
+            os.mkdir(uploadDir)
+            item = dict(item, path=os.path.join(uploadDir, item['name']))
+            with open(item['path'], 'wb') as dataFile:
+                dataFile.write(item.pop('data'))
+            del item['name']
+        recordPath = self._getRecordPath(os.path.dirname(item['path']))
+        with open(recordPath + '.tmp', 'w') as jsonFile:
+            json.dump({key: value for (key, value) in item.items() if key not in ['durable', 'claimedPath']},
+                      jsonFile)
+        if nextAttempt:
+            os.utime(recordPath + '.tmp', (nextAttempt, nextAttempt)) # not picked up before then
+        os.rename(recordPath + '.tmp', recordPath)
+        return item
+
+
+    def _spill(self, item):
+        self._writeRecord(item)
+        with self.lock:
+            self.stats['spilled'] += 1
+
+
+    def _getMtime(self, path):
+        try:
+            return os.path.getmtime(path)
+        except OSError: # e.g., claimed by another worker while listing
+            return None
+
+
+    def _getSpillDepth(self, dueTime=None):
+        recordPaths = glob.glob(os.path.join(self.spoolDir, '*.json'))
+        if dueTime == None:
+            return len(recordPaths)
+        return len([path for path in recordPaths if (self._getMtime(path) or dueTime) <= dueTime])
+
+
+    def _claim(self, path):
+        """Claim the given record by renaming it (atomic, so only one worker or process gets it)
+
+        Returns:
+            path of the claimed record, or None if it was claimed by someone else
+        """
+        claimedPath = '%s.%d-%s' % (self._getRecordPath(path), os.getpid(), threading.current_thread().name)
+        try:
+            os.rename(path, claimedPath)
+        except OSError:
+            return None
+        os.utime(claimedPath) # time of claim
+        return claimedPath
+
+
+    def _unspill(self):
+        """Claim the oldest due spilled upload, including uploads whose claims are stale
+
+        Returns:
+            upload item dictionary or None if no uploads are due
+        """
+        timeNow = time.time()
+        candidates = []
+        for path in glob.glob(os.path.join(self.spoolDir, '*.json')):
+            mtime = self._getMtime(path)
+            if (mtime != None) and (mtime <= timeNow):
+                candidates.append((mtime, path))
+        for path in glob.glob(os.path.join(self.spoolDir, '*.json.*')):
+            mtime = self._getMtime(path)
+            if (not path.endswith('.tmp')) and (mtime != None) and (mtime < timeNow - self.staleSeconds):
+                candidates.append((mtime, path))
+        for (mtime, path) in sorted(candidates):
+            claimedPath = self._claim(path)
+            if not claimedPath:
+                continue
+            try:
+                with open(claimedPath) as jsonFile:
+                    item = json.load(jsonFile)
+            except ValueError as e:
+                logging.error('Dropping unreadable spilled upload %s: %s', claimedPath, str(e))
+                os.remove(claimedPath)
+                continue
+            item['claimedPath'] = claimedPath
+            return item
+        return None
+
+
+    def _removeClaim(self, item):
+        if item.get('claimedPath'):
+            try:
+                os.remove(item['claimedPath'])
+            except FileNotFoundError: # claim was taken over as stale
+                pass
+
+
+    def _removeItem(self, item):
+        self._removeClaim(item)
+        if 'path' in item:
+            shutil.rmtree(os.path.dirname(item['path']), ignore_errors=True)
+
+
+    def _retry(self, item):
+        """Write the failed upload back to the spool for a later attempt, or give up after maxAttempts
+        """
+        attempts = item.get('attempts', 0) + 1
+        if attempts >= self.maxAttempts:
+            logging.error('Giving up drive upload of %s after %d attempts', item.get('path', item.get('name')),
+                          attempts)
+            with self.lock:
+                self.stats['failed'] += 1
+            self._removeItem(item)
+            return
+        self._writeRecord(dict(item, attempts=attempts), time.time() + self.retrySeconds * 2 ** (attempts - 1))
+        self._removeClaim(item)
+        with self.lock:
+            self.stats['retried'] += 1
+
+
+    def _uploadItem(self, service, item):
+        timeStart = time.time()
+        try:
+            if 'data' in item:
+                driveFile = goog_helper.uploadBytes(service, item['dirID'], item['name'], item['data'])
+            else:
+                driveFile = goog_helper.uploadFile(service, item['dirID'], item['path'])
+        except Exception as e:
+            logging.error('Drive upload of %s failed: %s', item.get('path', item.get('name')), str(e))
+            driveFile = None
+        uploadSeconds = time.time() - timeStart
+        with self.lock:
+            if driveFile:
+                self.stats['uploaded'] += 1
+                if self.patchFn and item['patch'] != None:
+                    self.pendingPatches.append((item['patch'], driveFile['id']))
+            self.stats['uploadSecondsSum'] += uploadSeconds
+            self.stats['uploadSecondsMax'] = max(self.stats['uploadSecondsMax'], uploadSeconds)
+            self.stats['waitSecondsSum'] += timeStart - item['queuedAt']
+        if driveFile:
+            self._removeItem(item)
+        else:
+            self._retry(item)
+
+
+    def _flushPatches(self, force=False):
+        with self.lock:
+            if not self.pendingPatches or (not force and len(self.pendingPatches) < self.patchBatchSize):
+                return
+            patches = self.pendingPatches[:self.patchBatchSize]
+            self.pendingPatches = self.pendingPatches[self.patchBatchSize:]
+        try:
+            self.patchFn(patches)
+        except Exception as e:
+            logging.error('Failed recording %d drive uploads: %s', len(patches), str(e))
+
+
+    def _run(self):
+        service = None
+        while True:
+            try:
+                item = self.queue.get(timeout=self.pollSeconds)
+            except queue.Empty:
+                self._flushPatches(force=True)
+                if self.stopEvent.is_set():
+                    return
+                try:
+                    item = self._unspill()
+                except OSError as e:
+                    logging.warning('Failed reading spilled upload: %s', str(e))
+                    item = None
+                if not item:
+                    continue
+            if item == None: # stop signal
+                self._flushPatches(force=True)
+                return
+            try:
+                if item.get('durable'):
+                    claimedPath = self._claim(self._getRecordPath(os.path.dirname(item['path'])))
+                    if not claimedPath:
+                        continue # already picked up from the spool
+                    item = dict(item, claimedPath=claimedPath)
+                if not service:
+                    service = self.serviceFactory()
+                self._uploadItem(service, item)
+            except Exception as e: # e.g., failed creating the drive service
+                logging.error('Drive upload of %s failed: %s', item.get('path', item.get('name')), str(e))
+                try:
+                    self._retry(item)
+                except OSError as e:
+                    logging.error('Failed spooling drive upload for retry: %s', str(e))
+                    with self.lock:
+                        self.stats['failed'] += 1
+            self._flushPatches(force=self.queue.empty())
+
+
+    def getStats(self):
+        """Get the upload counts, latencies, and queue depth
+
+        Returns:
+            Dictionary with number of uploads queued, spilled, uploaded, retried, and failed, current
+            queue depth (in memory and in the spool), and average upload, max upload, and average wait seconds
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        stats['depth'] = self.queue.qsize()
+        stats['spillDepth'] = self._getSpillDepth()
+        numDone = stats['uploaded'] + stats['retried'] + stats['failed']
+        stats['uploadSecondsAvg'] = stats['uploadSecondsSum'] / numDone if numDone else 0
+        stats['waitSecondsAvg'] = stats['waitSecondsSum'] / numDone if numDone else 0
+        return stats
+
+
+    def logStats(self):
+        stats = self.getStats()
+        logging.warning('Drive uploads: %d done, %d retried, %d failed, depth %d (%d spilled), ' +
+                        'upload avg %.2f max %.2f sec, wait avg %.2f sec', stats['uploaded'], stats['retried'],
+                        stats['failed'], stats['depth'], stats['spillDepth'], stats['uploadSecondsAvg'],
+                        stats['uploadSecondsMax'], stats['waitSecondsAvg'])
+
+
+    def stop(self, waitSeconds=60):
+        """Stop the workers after the queued and due spilled uploads are done or given time passed
+
+        Uploads still queued in memory are spilled to disk for the next run
+
+        Args:
+            waitSeconds (int): maximum time to wait for queued uploads
+        """
+        deadline = time.time() + waitSeconds
+        while (not self.queue.empty() or self._getSpillDepth(time.time())) and time.time() < deadline:
+            time.sleep(0.1)
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if not item.get('durable'): # durable uploads are already in the spool
+                self._spill(item)
+        self.stopEvent.set()
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
@@ -0,0 +1,125 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+In memory ring buffers of recent decoded frames for each camera
+
+Used by live image difference detection to find the frame from N minutes ago
+without refetching it.  Each camera keeps at most maxFramesPerCamera frames
+no older than maxAgeSeconds.  When the total size of all frames exceeds
+maxBytes, the frames of the least recently updated cameras are evicted.
+
+Cameras are leased by detection processes in batches (see camera_scheduler),
+so a camera that moves to another process starts with an empty buffer there.
+Live diff mode therefore gives the leases affinity to the process that buffered
+the frames, and cameras only move when their process doesn't keep up.
+
+"""
+
+import collections
+import logging
+import threading
+
+
+class FrameRingBuffer(object):
+    def __init__(self, maxFramesPerCamera=10, maxBytes=2*1024*1024*1024, maxAgeSeconds=None):
+        """Frame ring buffer constructor
+
+        Args:
+            maxFramesPerCamera (int): maximum number of frames kept per camera
+            maxBytes (int): maximum total size of the frames of all cameras
+            maxAgeSeconds (int): optional maximum age of frames relative to the newest frame of the camera
+        """
+        self.maxFramesPerCamera = maxFramesPerCamera
+        self.maxBytes = maxBytes
+        self.maxAgeSeconds = maxAgeSeconds
+        self.lock = threading.Lock()
+        self.cameras = collections.OrderedDict() # camera -> deque of (timestamp, imgArray), LRU first
+        self.numBytes = 0
+        self.numEvictedCameras = 0
+
+
+    def _popOldest(self, frames):
+        (_, imgArray) = frames.popleft()
+        self.numBytes -= imgArray.nbytes
+
+
+    def addFrame(self, camera, timestamp, imgArray):
+        """Add the given frame to the buffer of the given camera
+
+        Args:
+            camera (str): camera name
+            timestamp (int): unix time of the frame
+            imgArray (numpy array): decoded frame, must not be modified afterwards
+        """
+        with self.lock:
+            frames = self.cameras.setdefault(camera, collections.deque())
+            self.cameras.move_to_end(camera)
+            frames.append((timestamp, imgArray))
+            self.numBytes += imgArray.nbytes
+            while len(frames) > self.maxFramesPerCamera:
+                self._popOldest(frames)
+            if self.maxAgeSeconds != None:
+                while frames[0][0] < timestamp - self.maxAgeSeconds:
+                    self._popOldest(frames)
+            while self.numBytes > self.maxBytes:
+                (lruCamera, lruFrames) = next(iter(self.cameras.items()))
+                if lruCamera == camera:
+                    # only this camera left, so drop its oldest frames (possibly even the new one)
+                    self._popOldest(frames)
+                    if not frames:
+                        del self.cameras[camera]
+                    continue
+                del self.cameras[lruCamera]
+                self.numBytes -= sum(frame[1].nbytes for frame in lruFrames)
+                self.numEvictedCameras += 1
+                logging.warning('Frame buffer full, evicted camera %s', lruCamera)
+
+
+    def getFrame(self, camera, targetTimestamp, toleranceSeconds):
+        """Get the newest frame of the given camera taken at or before the target time
+
+        Args:
+            camera (str): camera name
+            targetTimestamp (int): unix time of the desired frame
+            toleranceSeconds (int): maximum number of seconds the frame may be older than target
+
+        Returns:
+            Tuple of timestamp and image array of the frame, or (None, None) if not available
+        """
+        with self.lock:
+            frames = self.cameras.get(camera)
+            if frames:
+                for (timestamp, imgArray) in reversed(frames):
+                    if timestamp <= targetTimestamp:
+                        if timestamp >= targetTimestamp - toleranceSeconds:
+                            return (timestamp, imgArray)
+                        break
+        return (None, None)
+
+
+    def getStats(self):
+        """Get the buffer statistics
+
+        Returns:
+            Dictionary with number of cameras, frames, bytes, and evicted cameras
+        """
+        with self.lock:
+            return {
+                'cameras': len(self.cameras),
+                'frames': sum(len(frames) for frames in self.cameras.values()),
+                'bytes': self.numBytes,
+                'evictedCameras': self.numEvictedCameras,
+            }
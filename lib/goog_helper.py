@@ -30,6 +30,7 @@ from httplib2 import Http
 from oauth2client import file, client, tools
 from apiclient.http import MediaIoBaseDownload
 from apiclient.http import MediaFileUpload
+from apiclient.http import MediaIoBaseUpload
 
 import collect_args
 import img_archive
@@ -282,6 +283,29 @@ def uploadFile(service, dirID, localFilePath):
     """
     file_metadata = {'name': pathlib.PurePath(localFilePath).name, 'parents': [dirID]}
     media = MediaFileUpload(localFilePath, mimetype = 'image/jpeg')
+    return _uploadMedia(service, file_metadata, media, localFilePath)
+
+
+def uploadBytes(service, dirID, fileName, data):
+    """Upload given in memory file data to to given Google drive folder ID
+
+    Args:
+        service: Drive service (from getGoogleServices()['drive'])
+        dirID (str): destination drive ID of folder
+        fileName (str): name of the file in drive
+        data (bytes): JPEG file data
+
+    Returns:
+        Drive API upload result
+    """
+    file_metadata = {'name': fileName, 'parents': [dirID]}
+    media = MediaIoBaseUpload(io.BytesIO(data), mimetype = 'image/jpeg')
+    return _uploadMedia(service, file_metadata, media, fileName)
+
+
+def _uploadMedia(service, file_metadata, media, fileName):
+    """Create drive file with given metadata and media, retrying on errors
+    """
     retriesLeft = 5
     while retriesLeft > 0:
         retriesLeft -= 1
@@ -292,7 +316,7 @@ def uploadFile(service, dirID, localFilePath):
                                             fields='id').execute()
             return file
         except Exception as e:
-            logging.warning('Error uploading image %s. %d retries left. %s', localFilePath, retriesLeft, str(e))
+            logging.warning('Error uploading image %s. %d retries left. %s', fileName, retriesLeft, str(e))
             if retriesLeft > 0:
                 time.sleep(5) # wait 5 seconds before retrying
     logging.error('Too many upload failures')
@@ -27,6 +27,7 @@ import time, datetime, dateutil.parser
 from html.parser import HTMLParser
 import requests
 import re
+import numpy as np
 from PIL import Image, ImageMath
 
 
@@ -574,10 +575,70 @@ def getHpwrenImages(googleServices, settings, outputDir, camArchives, cameraID,
     return None
 
 
+def diffImageArrays(arrayA, arrayB, out=None, scratch=None):
+    """Subtract two image arrays (r-r, g-g, b-b) and add 128 to reduce negative values
+       Same results as diffImages(), with out of range values clipped to 0 and 255
+
+    Args:
+        arrayA (numpy array): HxWxC uint8 array of image to subtract from
+        arrayB (numpy array): HxWxC uint8 array of image to subtract
+        out (numpy array): optional uint8 array of same shape to store the result
+        scratch (numpy array): optional int16 array of same shape for intermediate values.
+                               Reusing out and scratch avoids allocations when diffing many frames
+
+    Returns:
+        uint8 numpy array with the results of the subtraction with 128 mean
+    """
+    if scratch is None:
+        scratch = np.empty(arrayA.shape, dtype=np.int16)
+    if out is None:
+        out = np.empty(arrayA.shape, dtype=np.uint8)
+    np.subtract(arrayA, arrayB, out=scratch, dtype=np.int16)
+    scratch += 128
+    np.clip(scratch, 0, 255, out=scratch)
+    np.copyto(out, scratch, casting='unsafe')
+    return out
+
+
+def diffImageSequence(imgArrays, minusFrames=1):
+    """Subtract each frame in the given sequence from the frame minusFrames later
+
+    Args:
+        imgArrays: non-empty sequence (list or NxHxWxC array) of uint8 image arrays of the same shape
+        minusFrames (int): number of frames separating subtracted images
+
+    Returns:
+        (N - minusFrames)xHxWxC uint8 numpy array where entry i is diff of frames i + minusFrames and i
+    """
+    numDiffs = max(len(imgArrays) - minusFrames, 0)
+    out = np.empty((numDiffs,) + tuple(imgArrays[0].shape), dtype=np.uint8)
+    scratch = np.empty(imgArrays[0].shape, dtype=np.int16)
+    for i in range(numDiffs):
+        diffImageArrays(imgArrays[i + minusFrames], imgArrays[i], out=out[i], scratch=scratch)
+    return out
+
+
 def diffImages(imgA, imgB):
     """Subtract two images (r-r, g-g, b-b).  Also add 128 to reduce negative values
        If a pixel is exactly same in both images, then the result will be 128,128,128 gray
-       Out of range values (<0 and > 255) are moved to 0 and 255 by the convert('L') function
+       Out of range values (<0 and > 255) are moved to 0 and 255
+
+    Args:
+        imgA: Pillow image object to subtract from
+        imgB: Pillow image object to subtract
+
+    Returns:
+        Pillow image object containing the results of the subtraction with 128 mean
+    """
+    if imgA.mode != 'RGB' or imgB.mode != 'RGB':
+        raise ValueError('diffImages requires RGB images, got %s and %s' % (imgA.mode, imgB.mode))
+    return Image.fromarray(diffImageArrays(np.asarray(imgA), np.asarray(imgB)))
+
+
+def diffImagesImageMath(imgA, imgB):
+    """Original per band ImageMath implementation of diffImages()
+
+    Much slower than diffImages(), kept as reference for tests and benchmarks
 
     Args:
         imgA: Pillow image object to subtract from
@@ -586,13 +647,13 @@ def diffImages(imgA, imgB):
     Returns:
         Pillow image object containing the results of the subtraction with 128 mean
     """
+    evalFn = getattr(ImageMath, 'unsafe_eval', None) or ImageMath.eval # eval was renamed in newer Pillow
     bandsImgA = imgA.split()
     bandsImgB = imgB.split()
     bandsImgOut = []
 
     for bandNum in range(len(bandsImgA)):
-        # out = ImageMath.eval("convert((128+a/2)-b/2,'L')", a=bandsImgA[bandNum], b=bandsImgB[bandNum])
-        out = ImageMath.eval("convert(128+a-b,'L')", a=bandsImgA[bandNum], b=bandsImgB[bandNum])
+        out = evalFn("convert(128+a-b,'L')", a=bandsImgA[bandNum], b=bandsImgB[bandNum])
         bandsImgOut.append(out)
 
     return Image.merge('RGB', bandsImgOut)
@@ -0,0 +1,213 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Alternative inference runtimes for the smoke classification model
+
+All backends have the same classifySegments() / classifySegmentArrays()
+interface as tf_helper.SegmentClassifier:
+  tf: frozen TF graph (tf_helper.SegmentClassifier)
+  tflite: TFLite model converted from the frozen graph (tflite_runtime or tensorflow)
+  onnx: ONNX model converted from the frozen graph (onnxruntime)
+
+The runtime libraries are only imported when the backend is used.  See
+smoke-classifier/convert_model.py to create the converted models and
+smoke-classifier/benchmark_backends.py to compare the backends.
+
+"""
+
+import numpy as np
+from PIL import Image
+
+BACKENDS = ['tf', 'tflite', 'onnx']
+
+# same preprocessing as tf_helper.SegmentClassifier
+INPUT_SIZE = 299
+INPUT_MEAN = 128
+INPUT_STD = 128
+
+
+def loadLabels(labelsFile):
+    with open(labelsFile) as f:
+        return [line.rstrip() for line in f]
+
+
+def normalizeTiles(tiles, inputSize=INPUT_SIZE):
+    """Resize (if needed) and normalize the given tiles for the model input
+
+    Args:
+        tiles (numpy array): NxHxWx3 uint8 array of tiles
+        inputSize (int): height and width of model input
+
+    Returns:
+        NxSxSx3 float32 numpy array
+    """
+    if tiles.shape[1:3] != (inputSize, inputSize):
+        tiles = np.stack([np.asarray(Image.fromarray(tile).resize((inputSize, inputSize), Image.BILINEAR))
+                          for tile in tiles])
+    return (tiles.astype(np.float32) - INPUT_MEAN) / INPUT_STD
+
+
+class TileBackend(object):
+    def __init__(self, labelsFile):
+        """Base class for backends that score batches of normalized numpy tiles
+
+        Subclasses implement _run()
+
+        Args:
+            labelsFile (str): path to model labels file
+        """
+        self.labels = loadLabels(labelsFile)
+        self.smokeIndex = self.labels.index('smoke')
+
+
+    def _run(self, inputs):
+        """Run the model on the given normalized NxSxSx3 inputs
+
+        Returns:
+            NxC numpy array of class probabilities
+        """
+        raise NotImplementedError()
+
+
+    def classifySegmentArrays(self, segments):
+        """Classify the given in memory segments with one model run per tile size
+
+        Args:
+            segments (list): List of dictionary containing 'imgArray' for each segment
+        """
+        segmentsByShape = {}
+        for segmentInfo in segments:
+            segmentsByShape.setdefault(segmentInfo['imgArray'].shape, []).append(segmentInfo)
+        for shapeSegments in segmentsByShape.values():
+            tiles = np.stack([segmentInfo['imgArray'] for segmentInfo in shapeSegments])
+            results = self._run(normalizeTiles(tiles))
+            for segmentInfo, result in zip(shapeSegments, results):
+                segmentInfo['score'] = result[self.smokeIndex]
+
+
+    def classifySegments(self, segments):
+        """Classify the given segments stored as image files
+
+        Args:
+            segments (list): List of dictionary containing 'imgPath' for each segment
+        """
+        for segmentInfo in segments:
+            img = Image.open(segmentInfo['imgPath'])
+            segmentInfo['imgArray'] = np.asarray(img.convert('RGB'))
+            img.close()
+        self.classifySegmentArrays(segments)
+        for segmentInfo in segments:
+            del segmentInfo['imgArray']
+
+
+    def close(self):
+        pass
+
+
+class TFLiteBackend(TileBackend):
+    def __init__(self, modelFile, labelsFile, numThreads=None):
+        """TFLite interpreter backend
+
+        Args:
+            modelFile (str): path to TFLite model
+            labelsFile (str): path to model labels file
+            numThreads (int): optional number of CPU threads for the interpreter
+        """
+        super().__init__(labelsFile)
+        try:
+            import tflite_runtime.interpreter
+            Interpreter = tflite_runtime.interpreter.Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        kwargs = {'num_threads': numThreads} if numThreads else {}
+        self.interpreter = Interpreter(model_path=modelFile, **kwargs)
+        self.inputDetails = self.interpreter.get_input_details()[0]
+        self.outputDetails = self.interpreter.get_output_details()[0]
+        self.inputShape = None
+
+
+    def _run(self, inputs):
+        if inputs.shape != self.inputShape:
+            # converted models have batch size 1, so resize input to match the batch
+            self.interpreter.resize_tensor_input(self.inputDetails['index'], list(inputs.shape))
+            self.interpreter.allocate_tensors()
+            self.inputShape = inputs.shape
+        self.interpreter.set_tensor(self.inputDetails['index'], inputs)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.outputDetails['index'])
+
+
+class ONNXBackend(TileBackend):
+    def __init__(self, modelFile, labelsFile, numThreads=None):
+        """ONNX Runtime backend
+
+        Args:
+            modelFile (str): path to ONNX model
+            labelsFile (str): path to model labels file
+            numThreads (int): optional number of CPU threads for each model run
+        """
+        super().__init__(labelsFile)
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if numThreads:
+            options.intra_op_num_threads = numThreads
+        self.session = onnxruntime.InferenceSession(modelFile, options, providers=['CPUExecutionProvider'])
+        self.inputName = self.session.get_inputs()[0].name
+
+
+    def _run(self, inputs):
+        return self.session.run(None, {self.inputName: inputs})[0]
+
+
+def getBackendModelFile(settings, backendName):
+    """Get the model file for given backend from settings
+
+    Args:
+        settings: settings module
+        backendName (str): one of BACKENDS
+
+    Returns:
+        path to model file
+    """
+    if backendName == 'tflite':
+        return settings.tflite_model_file
+    if backendName == 'onnx':
+        return settings.onnx_model_file
+    return settings.model_file
+
+
+def createBackend(backendName, modelFile, labelsFile, tfConfig=None, numThreads=None):
+    """Create the smoke classifier for the given backend
+
+    Args:
+        backendName (str): one of BACKENDS
+        modelFile (str): path to model file in the backend's format
+        labelsFile (str): path to model labels file
+        tfConfig: optional tensorflow session config (tf backend only)
+        numThreads (int): optional number of CPU threads (tflite and onnx backends only)
+
+    Returns:
+        classifier with classifySegments() and classifySegmentArrays()
+    """
+    if backendName == 'tf':
+        import tf_helper
+        return tf_helper.SegmentClassifier(modelFile, labelsFile, tfConfig)
+    if backendName == 'tflite':
+        return TFLiteBackend(modelFile, labelsFile, numThreads)
+    if backendName == 'onnx':
+        return ONNXBackend(modelFile, labelsFile, numThreads)
+    raise ValueError('Unknown inference backend %s' % backendName)
@@ -0,0 +1,235 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Share one smoke classifier among multiple detection processes on the same host
+
+The InferenceServer owns the model and serves score requests from
+InferenceClients over a Unix domain socket.  Requests from all clients that
+arrive within a short time of each other are classified together as one
+batch.  InferenceClient has the same classifySegmentArrays() interface as
+tf_helper.SegmentClassifier, so detection policies can use either.
+
+Each request is a header with the number of tiles and their dimensions
+followed by the raw uint8 pixels.  Each response is the number of scores
+followed by the float32 smoke scores.  Scores of segments rejected by a
+cascade prefilter (see tf_helper.CascadeClassifier) are sent as -1 - score, so
+the client can mark them 'prefiltered'.
+
+"""
+
+import logging
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import numpy as np
+
+_REQUEST_HEADER = struct.Struct('!IIII') # numTiles, height, width, channels
+_RESPONSE_HEADER = struct.Struct('!I') # numScores
+
+
+def _recvExactly(sock, numBytes):
+    """Receive exactly numBytes from given socket
+
+    Returns:
+        bytearray with the data, or None if the connection was closed before any data
+    """
+    data = bytearray(numBytes)
+    view = memoryview(data)
+    received = 0
+    while received < numBytes:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise ConnectionError('Connection closed in middle of message')
+        received += count
+    return data
+
+
+class InferenceServer(object):
+    def __init__(self, classifier, socketPath, maxBatchTiles=512, maxWaitSeconds=0.05):
+        """Inference server constructor
+
+        Args:
+            classifier: classifier with classifySegmentArrays() (e.g., tf_helper.SegmentClassifier)
+            socketPath (str): file path of the Unix domain socket to listen on
+            maxBatchTiles (int): maximum number of tiles classified together
+            maxWaitSeconds (float): maximum time to wait for more requests after the first one of a batch
+        """
+        self.classifier = classifier
+        self.socketPath = socketPath
+        self.maxBatchTiles = maxBatchTiles
+        self.maxWaitSeconds = maxWaitSeconds
+        self.requests = queue.Queue()
+        self.listenSocket = None
+        self.numBatches = 0
+        self.numTiles = 0
+
+
+    def _handleClient(self, conn):
+        try:
+            with conn:
+                while True:
+                    header = _recvExactly(conn, _REQUEST_HEADER.size)
+                    if header == None:
+                        break
+                    shape = _REQUEST_HEADER.unpack(header)
+                    data = _recvExactly(conn, int(np.prod(shape)))
+                    request = {
+                        'tiles': np.frombuffer(data, dtype=np.uint8).reshape(shape),
+                        'done': threading.Event(),
+                        'scores': None,
+                    }
+                    self.requests.put(request)
+                    request['done'].wait()
+                    if request['scores'] is None:
+                        break # classification failed, closing connection informs client
+                    conn.sendall(_RESPONSE_HEADER.pack(len(request['scores'])))
+                    conn.sendall(request['scores'].tobytes())
+        except Exception as e:
+            logging.error('Inference client error: %s', str(e))
+
+
+    def _runBatch(self, requests):
+        segments = [{'imgArray': tile} for request in requests for tile in request['tiles']]
+        try:
+            self.classifier.classifySegmentArrays(segments)
+            offset = 0
+            for request in requests:
+                numTiles = len(request['tiles'])
+                requestSegments = segments[offset:offset + numTiles]
+                request['scores'] = np.array([-1 - s['score'] if s.get('prefiltered') else s['score']
+                                              for s in requestSegments], dtype=np.float32)
+                offset += numTiles
+        except Exception as e:
+            logging.error('Inference batch failed: %s', str(e))
+        finally:
+            for request in requests:
+                request['done'].set()
+        self.numBatches += 1
+        self.numTiles += len(segments)
+        if self.numBatches % 100 == 0:
+            logging.warning('Inference server: %d batches, avg %.1f tiles per batch',
+                            self.numBatches, self.numTiles / self.numBatches)
+
+
+    def _batcher(self):
+        while True:
+            requests = [self.requests.get()]
+            numTiles = len(requests[0]['tiles'])
+            deadline = time.time() + self.maxWaitSeconds
+            while numTiles < self.maxBatchTiles:
+                try:
+                    request = self.requests.get(timeout=max(deadline - time.time(), 0.001))
+                except queue.Empty:
+                    break
+                requests.append(request)
+                numTiles += len(request['tiles'])
+            self._runBatch(requests)
+
+
+    def serveForever(self):
+        """Accept client connections and serve their requests until shutdown() is called
+        """
+        if os.path.exists(self.socketPath):
+            os.remove(self.socketPath) # stale socket from previous run
+        self.listenSocket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listenSocket.bind(self.socketPath)
+        self.listenSocket.listen()
+        threading.Thread(target=self._batcher, name='batcher', daemon=True).start()
+        logging.warning('Inference server listening on %s', self.socketPath)
+        while True:
+            try:
+                (conn, _) = self.listenSocket.accept()
+            except OSError:
+                break # listening socket was closed
+            threading.Thread(target=self._handleClient, args=(conn,), daemon=True).start()
+
+
+    def shutdown(self):
+        self.listenSocket.shutdown(socket.SHUT_RDWR) # wakes up accept()
+        self.listenSocket.close()
+        os.remove(self.socketPath)
+
+
+class InferenceClient(object):
+    def __init__(self, socketPath, timeoutSeconds=60):
+        """Inference client constructor
+
+        Args:
+            socketPath (str): file path of the Unix domain socket of the InferenceServer
+            timeoutSeconds (int): maximum time to wait for each response
+        """
+        self.socketPath = socketPath
+        self.timeoutSeconds = timeoutSeconds
+        self.sock = None
+        self.lock = threading.Lock()
+
+
+    def _request(self, tiles):
+        if not self.sock:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeoutSeconds)
+            self.sock.connect(self.socketPath)
+        self.sock.sendall(_REQUEST_HEADER.pack(*tiles.shape))
+        self.sock.sendall(tiles.tobytes())
+        header = _recvExactly(self.sock, _RESPONSE_HEADER.size)
+        if header == None:
+            raise ConnectionError('Inference server closed connection')
+        (numScores,) = _RESPONSE_HEADER.unpack(header)
+        return np.frombuffer(_recvExactly(self.sock, numScores * 4), dtype=np.float32)
+
+
+    def _scoreTiles(self, tiles):
+        """Get the smoke scores for given NxHxWx3 array of tiles, reconnecting once on failure
+        """
+        with self.lock:
+            try:
+                return self._request(tiles)
+            except OSError as e:
+                logging.warning('Inference request failed, reconnecting: %s', str(e))
+                self.close()
+                return self._request(tiles)
+
+
+    def classifySegmentArrays(self, segments):
+        """Classify the given in memory segments using the inference server
+
+        Same interface as tf_helper.SegmentClassifier.classifySegmentArrays()
+
+        Args:
+            segments (list): List of dictionary containing 'imgArray' for each segment
+        """
+        segmentsByShape = {}
+        for segmentInfo in segments:
+            segmentsByShape.setdefault(segmentInfo['imgArray'].shape, []).append(segmentInfo)
+        for shapeSegments in segmentsByShape.values():
+            tiles = np.stack([segmentInfo['imgArray'] for segmentInfo in shapeSegments])
+            scores = self._scoreTiles(tiles)
+            for segmentInfo, score in zip(shapeSegments, scores):
+                if score < 0:
+                    segmentInfo['prefiltered'] = True
+                    score = -1 - score
+                segmentInfo['score'] = score
+
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,288 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Simple staged pipeline with worker threads connected by bounded queues.
+
+The first stage is the source and produces items by repeatedly calling its
+function with no arguments.  Every later stage calls its function on each
+item received from the previous stage and passes on the returned value
+(None means nothing to pass on).  Batched stages instead call their function
+on a list of up to batchSize items, collected for at most maxWaitSeconds after
+the first one, and pass on each value of the returned list.  Bounded queues
+provide backpressure so fast stages can't run too far ahead of slow ones.
+
+On stop(), the source stops producing and the remaining stages drain all
+queued items before exiting.  On an unexpected error in any stage, the
+whole pipeline is aborted and the error is reported by run().
+
+"""
+
+import logging
+import queue
+import threading
+import time
+
+_STOP_ITEM = object() # marks end of stream in queues
+
+class PipelineStage(object):
+    def __init__(self, pipeline, name, workFn, inQueue, outQueue, numWorkers, batchSize=None, maxWaitSeconds=0):
+        """Stage of the pipeline running workFn in numWorkers threads
+
+        Args:
+            pipeline (Pipeline): pipeline that owns this stage
+            name (str): name of stage for logging
+            workFn (function): function to process each item
+            inQueue (Queue): queue to get items from (None for source stage)
+            outQueue (Queue): queue to put results into (None for last stage)
+            numWorkers (int): number of worker threads
+            batchSize (int): if set, workFn is called with lists of up to batchSize items
+            maxWaitSeconds (float): maximum time to wait for more items after the first item of a batch
+        """
+        self.pipeline = pipeline
+        self.name = name
+        self.workFn = workFn
+        self.inQueue = inQueue
+        self.outQueue = outQueue
+        self.numWorkers = numWorkers
+        self.batchSize = batchSize
+        self.maxWaitSeconds = maxWaitSeconds
+        self.lock = threading.Lock()
+        self.activeWorkers = 0
+        self.threads = []
+        self.count = 0
+        self.totalTime = 0.0
+
+
+    def start(self):
+        self.activeWorkers = self.numWorkers
+        for i in range(self.numWorkers):
+            thread = threading.Thread(target=self._worker, name='%s-%d' % (self.name, i), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+
+    def _put(self, outQueue, item):
+        """Put item in given queue, but give up if pipeline has been aborted
+
+        Returns:
+            True if item was queued, False otherwise
+        """
+        while not self.pipeline.abortEvent.is_set():
+            try:
+                outQueue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+
+    def _get(self):
+        """Get next item from input queue, or _STOP_ITEM if pipeline has been aborted
+        """
+        while not self.pipeline.abortEvent.is_set():
+            try:
+                return self.inQueue.get(timeout=1)
+            except queue.Empty:
+                pass
+        return _STOP_ITEM
+
+
+    def _getItems(self):
+        """Get the next item, or batch of items for batched stages, from input queue
+
+        Returns:
+            Tuple of list of items and flag whether end of stream was reached
+        """
+        item = self._get()
+        if item is _STOP_ITEM:
+            return ([], True)
+        items = [item]
+        deadline = time.time() + self.maxWaitSeconds
+        while len(items) < (self.batchSize or 1):
+            try:
+                item = self.inQueue.get(timeout=max(deadline - time.time(), 0.001))
+            except queue.Empty:
+                break
+            if item is _STOP_ITEM:
+                return (items, True)
+            items.append(item)
+        return (items, False)
+
+
+    def _process(self, items):
+        """Run workFn on given items (None for source stage) and queue the results
+
+        Returns:
+            True if all results were queued, False if pipeline has been aborted
+        """
+        timeStart = time.time()
+        if items is None:
+            results = [self.workFn()]
+        elif self.batchSize:
+            results = self.workFn(items)
+        else:
+            results = [self.workFn(items[0])]
+        with self.lock:
+            self.count += len(items) if items else 1
+            self.totalTime += time.time() - timeStart
+        for result in results:
+            if (result is not None) and self.outQueue:
+                if not self._put(self.outQueue, result):
+                    return False
+        return True
+
+
+    def _worker(self):
+        try:
+            while True:
+                if self.inQueue:
+                    (items, stopped) = self._getItems()
+                    if items and not self._process(items):
+                        break
+                    if stopped:
+                        self._put(self.inQueue, _STOP_ITEM) # let sibling workers see it too
+                        break
+                else:
+                    if self.pipeline.stopEvent.is_set() or self.pipeline.abortEvent.is_set():
+                        break
+                    if not self._process(None):
+                        break
+        except Exception as e:
+            logging.error('Pipeline stage %s failed: %s', self.name, str(e))
+            self.pipeline.abort(e)
+        finally:
+            with self.lock:
+                self.activeWorkers -= 1
+                lastWorker = (self.activeWorkers == 0)
+            if lastWorker and self.outQueue:
+                self._put(self.outQueue, _STOP_ITEM)
+
+
+    def getStats(self):
+        """Get the processing statistics for this stage
+
+        Returns:
+            Dictionary with number of items processed, average time per item,
+            and current depth of the input queue
+        """
+        with self.lock:
+            return {
+                'name': self.name,
+                'count': self.count,
+                'avgTime': self.totalTime / self.count if self.count else 0,
+                'queueDepth': self.inQueue.qsize() if self.inQueue else 0,
+            }
+
+
+class Pipeline(object):
+    def __init__(self, queueSize=4):
+        """Pipeline of stages connected by queues holding at most queueSize items
+
+        Args:
+            queueSize (int): maximum number of items waiting between stages
+        """
+        self.queueSize = queueSize
+        self.stages = []
+        self.stopEvent = threading.Event()
+        self.abortEvent = threading.Event()
+        self.error = None
+
+
+    def addStage(self, name, workFn, numWorkers=1, batchSize=None, maxWaitSeconds=0):
+        """Append a new stage to the end of the pipeline
+
+        Args:
+            name (str): name of stage for logging
+            workFn (function): function to process each item (no arguments for first stage)
+            numWorkers (int): number of worker threads for this stage
+            batchSize (int): if set, workFn processes a list of up to batchSize items and returns a list
+            maxWaitSeconds (float): maximum time to wait for more items after the first item of a batch
+        """
+        inQueue = None
+        if self.stages:
+            inQueue = queue.Queue(self.queueSize)
+            self.stages[-1].outQueue = inQueue
+        assert inQueue or not batchSize # source stage can't be batched
+        self.stages.append(PipelineStage(self, name, workFn, inQueue, None, numWorkers, batchSize, maxWaitSeconds))
+
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+
+    def stop(self):
+        """Stop producing new items and let the queued items drain through
+        """
+        self.stopEvent.set()
+
+
+    def abort(self, error=None):
+        """Stop all stages as quickly as possible without draining
+        """
+        if error and not self.error:
+            self.error = error
+        self.abortEvent.set()
+
+
+    def join(self):
+        for stage in self.stages:
+            stage.join()
+
+
+    def isAlive(self):
+        return any(thread.is_alive() for stage in self.stages for thread in stage.threads)
+
+
+    def getStats(self):
+        return [stage.getStats() for stage in self.stages]
+
+
+    def logStats(self):
+        statsStrs = ['%s: n=%d, avg=%.2f, queued=%d' % (s['name'], s['count'], s['avgTime'], s['queueDepth'])
+                     for s in self.getStats()]
+        logging.warning('Pipeline stats: %s', ', '.join(statsStrs))
+
+
+    def run(self, statsIntervalSeconds=None):
+        """Start the pipeline and wait until all stages finish
+
+        A KeyboardInterrupt stops the source and drains the queued items.
+
+        Args:
+            statsIntervalSeconds (int): if set, log stage statistics this often
+
+        Returns:
+            The error that aborted the pipeline or None
+        """
+        self.start()
+        lastStatsTime = time.time()
+        while self.isAlive():
+            try:
+                time.sleep(1)
+                if statsIntervalSeconds and (time.time() - lastStatsTime > statsIntervalSeconds):
+                    self.logStats()
+                    lastStatsTime = time.time()
+            except KeyboardInterrupt:
+                logging.warning('Stopping pipeline')
+                self.stop()
+        self.join()
+        return self.error
@@ -0,0 +1,248 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Prompt re-checks of cameras with segments scoring just below their thresholds
+
+When a segment scores above 0.5 but below its historical threshold (a near
+miss), the camera is queued to be refetched after a short delay, ahead of the
+regular camera rotation.  The re-check frames only score the near miss
+segments and their neighbors (smoke drifts).  After the given number of
+re-checks, a near miss segment is confirmed as smoke if it scored above 0.5
+in every frame of the sequence, its average score over the sequence is above
+the midpoint between 0.5 and its threshold, and the scores show the segment
+changing over time: either they rose in every frame (growing smoke), or a
+re-check frame reached the threshold.  Static haze or glare re-scores at about
+the same value every frame, so a steady score below the threshold is rejected
+rather than getting past the historical threshold by repetition.
+Cameras aren't re-checked again for a cooldown period after a re-check
+finishes, so persistent haze doesn't keep triggering re-checks.
+
+"""
+
+import heapq
+import logging
+import threading
+
+
+def getSegmentKey(segmentInfo):
+    return (segmentInfo['MinX'], segmentInfo['MinY'], segmentInfo['MaxX'], segmentInfo['MaxY'])
+
+
+def getNeighborKeys(segments, centerSegments, distanceFactor=1.5):
+    """Get the keys of the given center segments and the segments around them
+
+    Args:
+        segments (list): all segments of the image
+        centerSegments (list): segments whose neighbors to find
+        distanceFactor (float): max distance between centers as multiple of segment size
+
+    Returns:
+        set of segment keys
+    """
+    keys = set(getSegmentKey(segmentInfo) for segmentInfo in centerSegments)
+    for center in centerSegments:
+        centerX = (center['MinX'] + center['MaxX']) / 2
+        centerY = (center['MinY'] + center['MaxY']) / 2
+        maxDistX = (center['MaxX'] - center['MinX']) * distanceFactor
+        maxDistY = (center['MaxY'] - center['MinY']) * distanceFactor
+        for segmentInfo in segments:
+            if (abs((segmentInfo['MinX'] + segmentInfo['MaxX']) / 2 - centerX) <= maxDistX) and \
+               (abs((segmentInfo['MinY'] + segmentInfo['MaxY']) / 2 - centerY) <= maxDistY):
+                keys.add(getSegmentKey(segmentInfo))
+    return keys
+
+
+class RecheckQueue(object):
+    def __init__(self, numRechecks=2, delaySeconds=20, expireSeconds=5*60, cooldownSeconds=10*60, minRise=0.05):
+        """Re-check queue constructor
+
+        Args:
+            numRechecks (int): number of re-check frames after the near miss
+            delaySeconds (int): delay before each re-check (to give camera time to refresh)
+            expireSeconds (int): drop re-checks that didn't finish within this time
+            cooldownSeconds (int): minimum time after a re-check finishes before the next one of same camera
+            minRise (float): minimum total rise of a rising score sequence to confirm it
+        """
+        self.numRechecks = numRechecks
+        self.minRise = minRise
+        self.delaySeconds = delaySeconds
+        self.expireSeconds = expireSeconds
+        self.cooldownSeconds = cooldownSeconds
+        self.lastFinished = {} # camera -> timestamp
+        self.lock = threading.Lock()
+        self.rechecks = {} # camera -> recheck state
+        self.dueQueue = [] # heap of (dueTime, camera)
+        self.stats = {
+            'started': 0,
+            'confirmed': 0,
+            'rejected': 0,
+            'expired': 0,
+        }
+
+
+    def _schedule(self, camera, dueTime):
+        self.rechecks[camera]['dueTime'] = dueTime
+        heapq.heappush(self.dueQueue, (dueTime, camera))
+
+
+    def addNearMisses(self, camera, timestamp, nearMisses, segments):
+        """Queue a re-check of given camera for the given near miss segments
+
+        Cameras that already have a re-check in progress or finished one
+        within the cooldown period are not requeued
+
+        Args:
+            camera (str): camera name
+            timestamp (int): time of the image with the near misses
+            nearMisses (list): near miss segments with 'score' and 'threshold'
+            segments (list): all segments of the image
+        """
+        with self.lock:
+            if (camera in self.rechecks) or not nearMisses:
+                return
+            if timestamp - self.lastFinished.get(camera, 0) < self.cooldownSeconds:
+                return
+            self.rechecks[camera] = {
+                'startTime': timestamp,
+                'lastTimestamp': timestamp,
+                'remaining': self.numRechecks,
+                'segmentKeys': getNeighborKeys(segments, nearMisses),
+                'candidates': {getSegmentKey(s): {'threshold': s['threshold'], 'scores': [s['score']]}
+                               for s in nearMisses},
+            }
+            self._schedule(camera, timestamp + self.delaySeconds)
+            self.stats['started'] += 1
+        logging.warning('Queued re-check of camera %s for %d near misses', camera, len(nearMisses))
+
+
+    def popDueCamera(self, timeNow):
+        """Get the next camera whose re-check is due
+
+        Args:
+            timeNow (float): current time
+
+        Returns:
+            camera name or None
+        """
+        with self.lock:
+            while self.dueQueue and self.dueQueue[0][0] <= timeNow:
+                (dueTime, camera) = heapq.heappop(self.dueQueue)
+                recheck = self.rechecks.get(camera)
+                if (not recheck) or (recheck['dueTime'] != dueTime):
+                    continue # finished or rescheduled
+                if timeNow - recheck['startTime'] > self.expireSeconds:
+                    del self.rechecks[camera]
+                    self.lastFinished[camera] = timeNow
+                    self.stats['expired'] += 1
+                    continue
+                recheck['dueTime'] = None # being fetched
+                return camera
+        return None
+
+
+    def retry(self, camera, timeNow):
+        """Schedule another attempt of a re-check whose fetch didn't get a new image
+        """
+        with self.lock:
+            if camera in self.rechecks:
+                self._schedule(camera, timeNow + self.delaySeconds)
+
+
+    def getRecheckSegmentKeys(self, camera, timestamp):
+        """Get the keys of segments to score if the given image is part of a re-check
+
+        Args:
+            camera (str): camera name
+            timestamp (int): time of the image
+
+        Returns:
+            set of segment keys, or None if all segments should be scored
+        """
+        with self.lock:
+            recheck = self.rechecks.get(camera)
+            if recheck and (timestamp > recheck['lastTimestamp']):
+                return recheck['segmentKeys']
+        return None
+
+
+    def _isChanging(self, candidate):
+        """Check if the scores of the candidate show temporal evidence of smoke
+
+        Args:
+            candidate (dict): candidate with 'scores' of the near miss followed by the re-checks and 'threshold'
+
+        Returns:
+            True if scores rose in every frame by minRise in total, or a re-check reached the threshold
+        """
+        scores = candidate['scores']
+        if max(scores[1:]) >= candidate['threshold']:
+            return True
+        isRising = all(scores[i] < scores[i + 1] for i in range(len(scores) - 1))
+        return isRising and (scores[-1] - scores[0] >= self.minRise)
+
+
+    def addScores(self, camera, timestamp, segments):
+        """Add the scores of a re-check frame and check if the sequence confirms smoke
+
+        Args:
+            camera (str): camera name
+            timestamp (int): time of the image
+            segments (list): scored segments of the image
+
+        Returns:
+            segment confirmed as smoke (with sequence scores in 'recheckScores'), or None
+        """
+        with self.lock:
+            recheck = self.rechecks.get(camera)
+            if (not recheck) or (timestamp <= recheck['lastTimestamp']):
+                return None
+            scores = {getSegmentKey(segmentInfo): segmentInfo for segmentInfo in segments}
+            for (segmentKey, candidate) in recheck['candidates'].items():
+                segmentInfo = scores.get(segmentKey)
+                candidate['scores'].append(float(segmentInfo['score']) if segmentInfo else 0.0)
+                candidate['segment'] = segmentInfo
+            recheck['lastTimestamp'] = timestamp
+            recheck['remaining'] -= 1
+            viable = {key: candidate for (key, candidate) in recheck['candidates'].items()
+                      if min(candidate['scores']) > .5}
+            if viable and recheck['remaining'] > 0:
+                recheck['candidates'] = viable
+                self._schedule(camera, timestamp + self.delaySeconds)
+                return None
+            del self.rechecks[camera]
+            self.lastFinished[camera] = timestamp
+            confirmed = None
+            maxAverage = 0
+            for candidate in viable.values():
+                if not self._isChanging(candidate):
+                    continue
+                average = sum(candidate['scores']) / len(candidate['scores'])
+                if (average > (.5 + candidate['threshold']) / 2) and (average > maxAverage):
+                    maxAverage = average
+                    confirmed = candidate['segment']
+                    confirmed['recheckScores'] = candidate['scores']
+            self.stats['confirmed' if confirmed else 'rejected'] += 1
+        if confirmed:
+            logging.warning('Re-check of camera %s confirmed segment %s with scores %s',
+                            camera, getSegmentKey(confirmed), confirmed['recheckScores'])
+        return confirmed
+
+
+    def getStats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['active'] = len(self.rechecks)
+        return stats
@@ -167,6 +167,24 @@ def getSegmentRanges(fullSize, segmentSize):
     return ranges
 
 
+def getCropImgPath(outputDirectory, imageFileName, coords):
+    """Generate the file path for the segment of given image with given coordinates
+       E.g.: lo-s-mobo-c__2018-06-06T11;12;23_Crop_627x632x1279x931.jpg
+
+    Args:
+        outputDirectory (str): name of directory to store the segment
+        imageFileName (str): nane of image file (used as segment file prefix)
+        coords (tuple): (x0, y0, x1, y1) coordinates of the segment
+
+    Returns:
+        String to full path name
+    """
+    imgName = pathlib.PurePath(imageFileName).name
+    imgNameNoExt = str(os.path.splitext(imgName)[0])
+    cropImgName = imgNameNoExt + '_Crop_' + 'x'.join(list(map(lambda x: str(x), coords))) + '.jpg'
+    return os.path.join(outputDirectory, cropImgName)
+
+
 def cutBoxesFixed(imgOrig, outputDirectory, imageFileName, callBackFn=None):
     """Cut the given image into fixed size boxes
 
@@ -186,8 +204,6 @@ def cutBoxesFixed(imgOrig, outputDirectory, imageFileName, callBackFn=None):
     """
     segmentSize = 299
     segments = []
-    imgName = pathlib.PurePath(imageFileName).name
-    imgNameNoExt = str(os.path.splitext(imgName)[0])
     xRanges = getSegmentRanges(imgOrig.size[0], segmentSize)
     yRanges = getSegmentRanges(imgOrig.size[1], segmentSize)
 
@@ -199,8 +215,7 @@ def cutBoxesFixed(imgOrig, outputDirectory, imageFileName, callBackFn=None):
                 if skip:
                     continue
             # output cropped image
-            cropImgName = imgNameNoExt + '_Crop_' + 'x'.join(list(map(lambda x: str(x), coords))) + '.jpg'
-            cropImgPath = os.path.join(outputDirectory, cropImgName)
+            cropImgPath = getCropImgPath(outputDirectory, imageFileName, coords)
             cropped_img = imgOrig.crop(coords)
             cropped_img.save(cropImgPath, format='JPEG')
             cropped_img.close()
@@ -214,8 +229,44 @@ def cutBoxesFixed(imgOrig, outputDirectory, imageFileName, callBackFn=None):
     return segments
 
 
+def cutBoxesArray(imgArray, callBackFn=None):
+    """Cut the given image array into fixed size boxes without writing any files
+
+    In memory variant of cutBoxesFixed() above using the same segment
+    coordinates.  Each segment references a slice (view) of imgArray,
+    so no pixel data is copied or encoded.
+
+    Args:
+        imgArray (numpy array): HxWxC array of the original image
+        callBackFn (function): callback function that's called for each square
+
+    Returns:
+        (list): list of segments with image array and coordinates
+    """
+    segmentSize = 299
+    segments = []
+    xRanges = getSegmentRanges(imgArray.shape[1], segmentSize)
+    yRanges = getSegmentRanges(imgArray.shape[0], segmentSize)
+
+    for yRange in yRanges:
+        for xRange in xRanges:
+            coords = (xRange[0], yRange[0], xRange[1], yRange[1])
+            if callBackFn != None:
+                skip = callBackFn(coords)
+                if skip:
+                    continue
+            segments.append({
+                'imgArray': imgArray[yRange[0]:yRange[1], xRange[0]:xRange[1]],
+                'MinX': coords[0],
+                'MinY': coords[1],
+                'MaxX': coords[2],
+                'MaxY': coords[3]
+            })
+    return segments
+
+
 def cutBoxes(imgOrig, outputDirectory, imageFileName, callBackFn=None):
-    return cutBoxesFixed(imgOrig, outputDirectory, imageFileName, callBackFn=None)
+    return cutBoxesFixed(imgOrig, outputDirectory, imageFileName, callBackFn=callBackFn)
 
 
 def test():
@@ -0,0 +1,188 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Adaptive scan intervals for cameras based on how likely they are to show smoke
+
+Each camera gets a weight that is the product of these factors:
+  recent high scores: cameras whose max score in the last hour was high
+      (but maybe below detection thresholds) are scanned up to 4x as often
+  time of day: cameras are scanned 4x less often at night
+  fire weather: cameras are scanned 2x as often during fire weather months
+  historical variance: cameras whose scores barely varied over the last few
+      days (nothing ever looks like smoke) are scanned 2x less often
+  frozen feeds: each consecutive unchanged or failed fetch halves the weight (up to 16x)
+
+Scan intervals are inversely proportional to the weights, with a weight of
+1 meaning a scan every minIntervalSeconds (cameras don't refresh faster).
+When scanning all cameras at those intervals would take more than the CPU
+budget, all intervals are scaled up to fit.  The capacity comes from the
+detection busy time per image (batch time divided by the batch size, as
+measured by detect_fire's time tracker), with each process detecting one
+batch at a time.  Fetch time, queue waits, and idle time while no camera is
+due are excluded, since counting them would shrink the capacity whenever
+the intervals grow.  So high weights matter when the cameras
+compete for CPU, and low weights (e.g., at night) save CPU.  Intervals are
+clamped between minIntervalSeconds and maxIntervalSeconds.
+
+The score statistics come from the score_rollups table, so they include the
+scores recorded by all detection processes.
+
+"""
+
+import datetime
+import logging
+import threading
+import numpy as np
+
+HIGH_SCORE_MIN = 0.3 # recent max scores above this increase the weight
+HIGH_SCORE_BOOST = 3.0 # extra weight at score 1.0
+NIGHT_FACTOR = 0.25
+FIRE_WEATHER_FACTOR = 2.0
+LOW_VARIANCE_STD = 0.02 # cameras with std of max scores below this are considered quiet
+LOW_VARIANCE_FACTOR = 0.5
+FROZEN_FACTOR = 0.5
+MAX_FROZEN_COUNT = 4
+
+
+class ScanPriority(object):
+    def __init__(self, dbManager, cameraNames, cpuBudget=0.9, numProcesses=1, minIntervalSeconds=60,
+                 maxIntervalSeconds=30*60, dayHours=(6, 20), fireWeatherMonths=(), recentSeconds=60*60,
+                 historySeconds=3*24*60*60, refreshSeconds=10*60):
+        """Scan priority constructor
+
+        Args:
+            dbManager (DbManager):
+            cameraNames (list): names of the cameras being scanned
+            cpuBudget (float): fraction of the processing capacity to use
+            numProcesses (int): number of detection processes sharing the cameras
+            minIntervalSeconds (int): minimum time between scans of a camera
+            maxIntervalSeconds (int): maximum time between scans of a camera
+            dayHours (tuple): local hours (start, end) considered daytime
+            fireWeatherMonths (list): months (1-12) considered fire weather
+            recentSeconds (int): time window for recent high scores
+            historySeconds (int): time window for historical variance
+            refreshSeconds (int): how often to reload score statistics from DB
+        """
+        self.dbManager = dbManager
+        self.cameraNames = list(cameraNames)
+        self.cpuBudget = cpuBudget
+        self.numProcesses = numProcesses
+        self.minIntervalSeconds = minIntervalSeconds
+        self.maxIntervalSeconds = maxIntervalSeconds
+        self.dayHours = dayHours
+        self.fireWeatherMonths = set(fireWeatherMonths)
+        self.recentSeconds = recentSeconds
+        self.historySeconds = historySeconds
+        self.refreshSeconds = refreshSeconds
+        self.lock = threading.Lock()
+        self.timePerImage = 3 # same initial estimate as detect_fire's time tracker
+        self.recentMax = {}
+        self.historyStd = {}
+        self.frozenCounts = {}
+        self.lastRefresh = None
+
+
+    def setTimePerImage(self, timePerImage):
+        """Update the measured detection busy time per image (e.g., timeTracker['timePerSample'])
+
+        Args:
+            timePerImage (float): seconds the detect stage is busy per image, excluding any waits
+        """
+        with self.lock:
+            self.timePerImage = timePerImage
+
+
+    def recordFetch(self, cameraName, changed):
+        """Record whether the latest fetch of the camera got a new image
+
+        Args:
+            cameraName (str): camera name
+            changed (bool): False if the download failed or the image was unchanged
+        """
+        with self.lock:
+            self.frozenCounts[cameraName] = 0 if changed else self.frozenCounts.get(cameraName, 0) + 1
+
+
+    def refresh(self, timestamp):
+        """Reload the recent max and historical variance of scores of all cameras from score_rollups
+
+        Args:
+            timestamp (int): current time
+        """
+        sqlTemplate = """SELECT CameraName, BucketStart, MAX(MaxScore) as maxs FROM score_rollups
+        WHERE BucketStart >= %s GROUP BY CameraName, BucketStart"""
+        bucketMaxes = {}
+        recentMax = {}
+        for row in self.dbManager.query(sqlTemplate % int(timestamp - self.historySeconds)):
+            bucketMaxes.setdefault(row['cameraname'], []).append(row['maxs'])
+            if row['bucketstart'] >= timestamp - self.recentSeconds:
+                recentMax[row['cameraname']] = max(recentMax.get(row['cameraname'], 0), row['maxs'])
+        with self.lock:
+            self.recentMax = recentMax
+            self.historyStd = {camera: float(np.std(maxes)) for (camera, maxes) in bucketMaxes.items()
+                               if len(maxes) > 1}
+            self.lastRefresh = timestamp
+
+
+    def _getWeight(self, cameraName, timestamp):
+        weight = 1.0
+        recentMax = self.recentMax.get(cameraName, 0)
+        if recentMax > HIGH_SCORE_MIN:
+            weight *= 1 + HIGH_SCORE_BOOST * (recentMax - HIGH_SCORE_MIN) / (1 - HIGH_SCORE_MIN)
+        dt = datetime.datetime.fromtimestamp(timestamp)
+        if not (self.dayHours[0] <= dt.hour < self.dayHours[1]):
+            weight *= NIGHT_FACTOR
+        if dt.month in self.fireWeatherMonths:
+            weight *= FIRE_WEATHER_FACTOR
+        if self.historyStd.get(cameraName, 1) < LOW_VARIANCE_STD:
+            weight *= LOW_VARIANCE_FACTOR
+        weight *= FROZEN_FACTOR ** min(self.frozenCounts.get(cameraName, 0), MAX_FROZEN_COUNT)
+        return weight
+
+
+    def getWeight(self, cameraName, timestamp):
+        """Get the relative scan frequency weight of the given camera at given time
+        """
+        with self.lock:
+            return self._getWeight(cameraName, timestamp)
+
+
+    def getInterval(self, cameraName, timestamp):
+        """Get the number of seconds until the given camera should be scanned again
+
+        Cameras are scanned at rates proportional to their weights, with the
+        total rate of all cameras limited to the capacity within the CPU budget
+
+        Args:
+            cameraName (str): camera name
+            timestamp (int): current time
+
+        Returns:
+            interval in seconds
+        """
+        if (self.lastRefresh == None) or (timestamp - self.lastRefresh >= self.refreshSeconds):
+            try:
+                self.refresh(timestamp)
+            except Exception as e:
+                logging.error('Failed to refresh scan priorities: %s', str(e))
+                self.lastRefresh = timestamp # try again later
+        with self.lock:
+            totalWeight = sum(self._getWeight(name, timestamp) for name in self.cameraNames)
+            # one batch is detected at a time per process, so busy time per image gives the throughput
+            capacity = self.cpuBudget * self.numProcesses / self.timePerImage # images per second
+            demand = totalWeight / self.minIntervalSeconds # images per second
+            interval = self.minIntervalSeconds / self._getWeight(cameraName, timestamp) * max(demand / capacity, 1)
+        return min(max(interval, self.minIntervalSeconds), self.maxIntervalSeconds)
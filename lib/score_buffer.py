@@ -0,0 +1,162 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Write-behind buffer for the segment scores
+
+Score rows of many frames are collected in memory and written to the scores
+table with one bulk insert (DbManager.add_rows) and one commit when the
+buffer reaches maxRows or its oldest row is maxSeconds old.  The DB
+connection is shared by all threads, so the DbManager lock is held for the
+whole transaction (including any rollback) so other threads can't commit
+part of a flush or lose their uncommitted work to its rollback.  The
+score_rollups rows are merged in memory by bucket so each flush upserts
+each bucket once.  The caller must flush() at shutdown.
+
+The in-memory ScoreHistoryCache is updated separately by the caller, so the
+historical thresholds see new scores immediately.
+
+"""
+
+import logging
+import threading
+import time
+
+
+class ScoreWriteBuffer(object):
+    def __init__(self, dbManager, maxRows=5000, maxSeconds=30, maxRetainedRows=100000):
+        """Score write buffer constructor
+
+        Args:
+            dbManager (DbManager):
+            maxRows (int): flush when this many score rows are buffered
+            maxSeconds (int): flush when the oldest buffered row is this old
+            maxRetainedRows (int): maximum rows kept for retry when flushes fail (oldest are dropped)
+        """
+        self.dbManager = dbManager
+        self.maxRows = maxRows
+        self.maxSeconds = maxSeconds
+        self.maxRetainedRows = maxRetainedRows
+        self.keyColumns = dbManager.uniqueIndexes['score_rollups']
+        self.lock = threading.Lock()
+        self.flushLock = threading.Lock() # keeps flushes in order
+        self.scoreRows = []
+        self.rollups = {}
+        self.oldestTime = None
+        self.stats = {
+            'rows': 0,
+            'flushes': 0,
+            'flushSeconds': 0.0,
+            'failures': 0,
+            'dropped': 0,
+        }
+
+
+    def _mergeRollup(self, rollups, row):
+        key = tuple(row[col] for col in self.keyColumns)
+        existing = rollups.get(key)
+        if existing:
+            existing['MaxScore'] = max(existing['MaxScore'], row['MaxScore'])
+            existing['SumScore'] += row['SumScore']
+            existing['NumSamples'] += row['NumSamples']
+        else:
+            rollups[key] = dict(row)
+
+
+    def add(self, scoreRows, rollupRows, timeNow=None):
+        """Add the scores of a frame, flushing if the size or time threshold is reached
+
+        Args:
+            scoreRows (list): list of dictionaries for scores table
+            rollupRows (list): list of dictionaries for score_rollups table (see score_history.getRollupRows())
+            timeNow (float): current time (default time.time())
+        """
+        timeNow = timeNow or time.time()
+        with self.lock:
+            self.scoreRows += scoreRows
+            for row in rollupRows:
+                self._mergeRollup(self.rollups, row)
+            if self.oldestTime == None:
+                self.oldestTime = timeNow
+            needFlush = (len(self.scoreRows) >= self.maxRows) or (timeNow - self.oldestTime >= self.maxSeconds)
+        if needFlush:
+            self.flush()
+
+
+    def flush(self):
+        """Write all buffered rows to the DB in one transaction
+
+        On failure the rows are kept for the next flush
+        """
+        with self.flushLock:
+            with self.lock:
+                scoreRows = self.scoreRows
+                rollups = self.rollups
+                self.scoreRows = []
+                self.rollups = {}
+                self.oldestTime = None
+            if not scoreRows and not rollups:
+                return
+            timeStart = time.time()
+            with self.dbManager.lock:
+                try:
+                    self.dbManager.add_rows('scores', scoreRows, commit=False)
+                    self.dbManager.upsertScoreRollups(list(rollups.values()), commit=False)
+                    self.dbManager.commit()
+                except Exception as e:
+                    logging.error('Failed writing %d score rows: %s', len(scoreRows), str(e))
+                    self._retain(scoreRows, rollups)
+                    return
+            with self.lock:
+                self.stats['rows'] += len(scoreRows)
+                self.stats['flushes'] += 1
+                self.stats['flushSeconds'] += time.time() - timeStart
+
+
+    def _retain(self, scoreRows, rollups):
+        """Roll back a failed flush and put back its rows ahead of the rows added since
+
+        Must be called with the DbManager lock held since the failed flush started
+        """
+        try:
+            self.dbManager.rollback()
+        except Exception as e:
+            logging.error('Failed rollback: %s', str(e))
+        with self.lock:
+            self.stats['failures'] += 1
+            self.scoreRows = scoreRows + self.scoreRows
+            for row in self.rollups.values():
+                self._mergeRollup(rollups, row)
+            self.rollups = rollups
+            if len(self.scoreRows) > self.maxRetainedRows:
+                numDropped = len(self.scoreRows) - self.maxRetainedRows
+                self.scoreRows = self.scoreRows[numDropped:]
+                self.stats['dropped'] += numDropped
+                logging.error('Dropped %d score rows after repeated write failures', numDropped)
+            self.oldestTime = time.time()
+
+
+    def getStats(self):
+        """Get the number of rows written and buffered and the flush times
+
+        Returns:
+            Dictionary with rows written, flushes, failures, dropped rows,
+            currently buffered rows, and average flush seconds
+        """
+        with self.lock:
+            stats = dict(self.stats)
+            stats['buffered'] = len(self.scoreRows)
+        stats['flushSecondsAvg'] = stats['flushSeconds'] / stats['flushes'] if stats['flushes'] else 0
+        return stats
@@ -0,0 +1,229 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+In memory cache of historical smoke scores for each camera segment
+
+Scores are aggregated (max, sum, count) into fixed time buckets (15 minutes
+by default) per camera and segment, stored in per camera numpy ring buffers
+covering the history window.  Looking up the historical scores for the same
+time of day on previous days is then a handful of array lookups vs. a SQL
+GROUP BY over the raw scores.
+
+The same buckets are persisted in the score_rollups table, which is kept up
+to date incrementally as scores are recorded (see getRollupRows()), so the
+cost of loading the history doesn't depend on the size of the scores table.
+
+The cache is updated immediately with the scores recorded by this process,
+and periodically refreshed from the score_rollups table so it also includes
+scores recorded by other detection processes.  Buckets are always replaced
+as a whole during refresh, so scores are never double counted.
+
+"""
+
+import math
+import numpy as np
+
+BUCKET_SECONDS = 15*60
+
+
+def getBucketStart(timestamp, bucketSeconds=BUCKET_SECONDS):
+    return (int(timestamp) // bucketSeconds) * bucketSeconds
+
+
+def getRollupRows(camera, timestamp, segments, bucketSeconds=BUCKET_SECONDS):
+    """Get the score_rollups rows for the given segment scores
+
+    Args:
+        camera (str): camera name
+        timestamp (int):
+        segments (list): List of dictionary containing information on each segment
+        bucketSeconds (int): size of each time bucket
+
+    Returns:
+        List of dictionaries for DbManager.upsertScoreRollups()
+    """
+    bucketStart = getBucketStart(timestamp, bucketSeconds)
+    return [{
+        'CameraName': camera,
+        'MinX': segmentInfo['MinX'],
+        'MinY': segmentInfo['MinY'],
+        'MaxX': segmentInfo['MaxX'],
+        'MaxY': segmentInfo['MaxY'],
+        'BucketStart': bucketStart,
+        'MaxScore': float(segmentInfo['score']),
+        'SumScore': float(segmentInfo['score']),
+        'NumSamples': 1,
+    } for segmentInfo in segments]
+
+
+class ScoreHistoryCache(object):
+    def __init__(self, bucketSeconds=BUCKET_SECONDS, historySeconds=int(3.5*24*60*60), excludeSeconds=12*60*60,
+                 windowSeconds=60*60):
+        """Historical score cache constructor
+
+        Args:
+            bucketSeconds (int): size of each time bucket (must divide evenly into an hour)
+            historySeconds (int): how far back the history goes
+            excludeSeconds (int): most recent period excluded from the history
+            windowSeconds (int): time of day window (+/-) on each previous day
+        """
+        self.bucketSeconds = bucketSeconds
+        self.historySeconds = historySeconds
+        self.excludeSeconds = excludeSeconds
+        self.windowSeconds = windowSeconds
+        self.numSlots = int(math.ceil(historySeconds / bucketSeconds)) + 2
+        self.cameras = {}
+        self.refreshedUpTo = None
+
+
+    def _getCameraData(self, camera):
+        if camera not in self.cameras:
+            self.cameras[camera] = {
+                'segmentIndexes': {},
+                'slotStarts': np.full(self.numSlots, -1, dtype=np.int64),
+                'maxs': np.zeros((0, self.numSlots), dtype=np.float32),
+                'sums': np.zeros((0, self.numSlots), dtype=np.float32),
+                'counts': np.zeros((0, self.numSlots), dtype=np.int32),
+            }
+        return self.cameras[camera]
+
+
+    def _getSegmentIndex(self, cameraData, segmentKey):
+        segmentIndexes = cameraData['segmentIndexes']
+        if segmentKey not in segmentIndexes:
+            segmentIndexes[segmentKey] = len(segmentIndexes)
+            for name in ['maxs', 'sums', 'counts']:
+                newRow = np.zeros((1, self.numSlots), dtype=cameraData[name].dtype)
+                cameraData[name] = np.concatenate((cameraData[name], newRow))
+        return segmentIndexes[segmentKey]
+
+
+    def _getSlot(self, cameraData, bucketStart):
+        """Get the ring buffer slot for given bucket, resetting the slot if it held an older bucket
+
+        Returns:
+            slot index or None if the slot already holds a newer bucket
+        """
+        slot = (bucketStart // self.bucketSeconds) % self.numSlots
+        slotStart = cameraData['slotStarts'][slot]
+        if slotStart != bucketStart:
+            if slotStart > bucketStart:
+                return None
+            cameraData['slotStarts'][slot] = bucketStart
+            cameraData['maxs'][:, slot] = 0
+            cameraData['sums'][:, slot] = 0
+            cameraData['counts'][:, slot] = 0
+        return slot
+
+
+    def _update(self, camera, segmentKey, bucketStart, maxScore, sumScores, count, replace=False):
+        cameraData = self._getCameraData(camera)
+        segmentIndex = self._getSegmentIndex(cameraData, segmentKey)
+        slot = self._getSlot(cameraData, bucketStart)
+        if slot == None:
+            return
+        if replace:
+            cameraData['maxs'][segmentIndex, slot] = maxScore
+            cameraData['sums'][segmentIndex, slot] = sumScores
+            cameraData['counts'][segmentIndex, slot] = count
+        else:
+            cameraData['maxs'][segmentIndex, slot] = max(cameraData['maxs'][segmentIndex, slot], maxScore)
+            cameraData['sums'][segmentIndex, slot] += sumScores
+            cameraData['counts'][segmentIndex, slot] += count
+
+
+    def addScores(self, camera, timestamp, segments):
+        """Add the given segment scores to the cache
+
+        Args:
+            camera (str): camera name
+            timestamp (int):
+            segments (list): List of dictionary containing information on each segment
+        """
+        bucketStart = getBucketStart(timestamp, self.bucketSeconds)
+        for segmentInfo in segments:
+            segmentKey = (segmentInfo['MinX'], segmentInfo['MinY'], segmentInfo['MaxX'], segmentInfo['MaxY'])
+            self._update(camera, segmentKey, bucketStart, segmentInfo['score'], segmentInfo['score'], 1)
+
+
+    def getHistory(self, camera, timestamp, segmentKey):
+        """Get the historical scores for given segment around the same time of day on previous days
+
+        Equivalent to aggregating the scores with timestamps between historySeconds
+        and excludeSeconds ago that are within windowSeconds of the same time of day,
+        at the granularity of the time buckets.
+
+        Args:
+            camera (str): camera name
+            timestamp (int):
+            segmentKey (tuple): (MinX, MinY, MaxX, MaxY) of the segment
+
+        Returns:
+            Dictionary with maxs, avgs, and cnt (same as the old SQL query), or None if no history
+        """
+        cameraData = self.cameras.get(camera)
+        if not cameraData or segmentKey not in cameraData['segmentIndexes']:
+            return None
+        segmentIndex = cameraData['segmentIndexes'][segmentKey]
+        oldestTime = timestamp - self.historySeconds
+        newestTime = timestamp - self.excludeSeconds
+        bucketStarts = []
+        for daysBack in range(1, int(math.ceil(self.historySeconds / (24*60*60))) + 1):
+            center = timestamp - daysBack * 24*60*60
+            firstBucket = ((center - self.windowSeconds) // self.bucketSeconds) * self.bucketSeconds
+            for bucketStart in range(firstBucket, center + self.windowSeconds, self.bucketSeconds):
+                if (bucketStart >= oldestTime) and (bucketStart + self.bucketSeconds <= newestTime):
+                    bucketStarts.append(bucketStart)
+        if not bucketStarts:
+            return None
+        bucketStarts = np.array(bucketStarts, dtype=np.int64)
+        slots = (bucketStarts // self.bucketSeconds) % self.numSlots
+        slots = slots[cameraData['slotStarts'][slots] == bucketStarts]
+        counts = cameraData['counts'][segmentIndex, slots]
+        count = int(counts.sum())
+        if count == 0:
+            return None
+        return {
+            'maxs': float(cameraData['maxs'][segmentIndex, slots][counts > 0].max()),
+            'avgs': float(cameraData['sums'][segmentIndex, slots].sum()) / count,
+            'cnt': count,
+        }
+
+
+    def refresh(self, dbManager, timestamp):
+        """Load aggregated scores from score_rollups table for all buckets that have aged into the history window
+
+        The first call loads the full history window.  Later calls only load the
+        buckets that became older than excludeSeconds since the previous call.
+
+        Args:
+            dbManager (DbManager):
+            timestamp (int): current time
+        """
+        horizon = getBucketStart(timestamp - self.excludeSeconds, self.bucketSeconds)
+        if self.refreshedUpTo == None:
+            self.refreshedUpTo = getBucketStart(timestamp - self.historySeconds, self.bucketSeconds)
+        if horizon <= self.refreshedUpTo:
+            return
+        sqlTemplate = """SELECT CameraName, MinX, MinY, MaxX, MaxY, BucketStart,
+        NumSamples as cnt, SumScore as sums, MaxScore as maxs FROM score_rollups
+        WHERE BucketStart >= %s and BucketStart < %s"""
+        sqlStr = sqlTemplate % (self.refreshedUpTo, horizon)
+        for row in dbManager.query(sqlStr):
+            segmentKey = (row['minx'], row['miny'], row['maxx'], row['maxy'])
+            self._update(row['cameraname'], segmentKey, row['bucketstart'], row['maxs'], row['sums'], row['cnt'],
+                         replace=True)
+        self.refreshedUpTo = horizon
@@ -0,0 +1,143 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Per camera masks of segments that are skipped by detection
+
+Masked segments (e.g., sky, camera overlays and timestamps, permanently
+obstructed areas) are stored in the segment_masks table and skipped via the
+callBackFn of rect_to_squares cutBoxes functions, so they are never scored.
+Masks are keyed by the exact segment coordinates, so they don't apply anymore
+if the image size of a camera changes.
+
+Candidate masks can be generated from the historical scores with
+findMaskCandidates() (see segment_mask_mgmt.py)
+
+"""
+
+import logging
+import time
+
+# segments whose scores barely change and are far from smoke are considered static
+STATIC_MAX_SCORE = 0.1
+STATIC_MAX_STDDEV = 0.02
+# segments that score as smoke most of the time are considered noisy
+NOISY_MIN_AVG_SCORE = 0.5
+
+
+class SegmentMasks(object):
+    def __init__(self, dbManager, reloadSeconds=10*60):
+        """Segment masks constructor
+
+        Args:
+            dbManager (DbManager):
+            reloadSeconds (int): how often to reload the masks from DB
+        """
+        self.dbManager = dbManager
+        self.reloadSeconds = reloadSeconds
+        self.masks = {}
+        self.lastLoadTime = None
+
+
+    def _load(self):
+        masks = {}
+        for row in self.dbManager.query('SELECT CameraName, MinX, MinY, MaxX, MaxY FROM segment_masks'):
+            coords = (row['minx'], row['miny'], row['maxx'], row['maxy'])
+            masks.setdefault(row['cameraname'], set()).add(coords)
+        self.masks = masks
+        self.lastLoadTime = time.time()
+        logging.warning('Loaded segment masks for %d cameras', len(masks))
+
+
+    def getSkipFn(self, camera):
+        """Get the callBackFn for cutBoxes functions that skips the masked segments of given camera
+
+        Args:
+            camera (str): camera name
+
+        Returns:
+            callback function returning True for masked coordinates, or None if camera has no masks
+        """
+        if (self.lastLoadTime == None) or (time.time() - self.lastLoadTime > self.reloadSeconds):
+            self._load()
+        masked = self.masks.get(camera)
+        if not masked:
+            return None
+        return lambda coords: tuple(coords) in masked
+
+
+def findMaskCandidates(dbManager, camera, startTime, endTime, minSamples=100):
+    """Find segments of given camera that are static or noisy based on historical scores
+
+    Args:
+        dbManager (DbManager):
+        camera (str): camera name
+        startTime (int): start of the history to analyze
+        endTime (int): end of the history to analyze
+        minSamples (int): minimum number of scores for a segment to be considered
+
+    Returns:
+        List of dictionaries with segment coordinates, stats, and Reason ('static' or 'noisy')
+    """
+    sqlTemplate = """SELECT MinX, MinY, MaxX, MaxY, count(*) as cnt, max(Score) as maxs,
+    avg(Score) as avgs, avg(Score * Score) as sqavgs FROM scores
+    WHERE CameraName = '%s' and Timestamp >= %d and Timestamp < %d
+    GROUP BY MinX, MinY, MaxX, MaxY"""
+    sqlStr = sqlTemplate % (camera, startTime, endTime)
+    candidates = []
+    for row in dbManager.query(sqlStr):
+        if row['cnt'] < minSamples:
+            continue
+        stddev = max(row['sqavgs'] - row['avgs'] * row['avgs'], 0) ** 0.5
+        if (row['maxs'] < STATIC_MAX_SCORE) and (stddev < STATIC_MAX_STDDEV):
+            reason = 'static'
+        elif row['avgs'] >= NOISY_MIN_AVG_SCORE:
+            reason = 'noisy'
+        else:
+            continue
+        candidates.append({
+            'MinX': row['minx'],
+            'MinY': row['miny'],
+            'MaxX': row['maxx'],
+            'MaxY': row['maxy'],
+            'Reason': reason,
+            'cnt': row['cnt'],
+            'maxs': row['maxs'],
+            'avgs': row['avgs'],
+            'stddev': stddev,
+        })
+    return candidates
+
+
+def saveMasks(dbManager, camera, segments):
+    """Replace the masks of given camera with given segments
+
+    Args:
+        dbManager (DbManager):
+        camera (str): camera name
+        segments (list): list of dictionaries with segment coordinates and Reason
+    """
+    dbManager.execute("DELETE FROM segment_masks WHERE CameraName = '%s'" % camera, commit=False)
+    dbRows = [{
+        'CameraName': camera,
+        'MinX': segment['MinX'],
+        'MinY': segment['MinY'],
+        'MaxX': segment['MaxX'],
+        'MaxY': segment['MaxY'],
+        'Reason': segment['Reason'],
+    } for segment in segments]
+    if dbRows:
+        dbManager.add_data('segment_masks', dbRows, commit=False)
+    dbManager.commit()
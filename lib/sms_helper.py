@@ -20,7 +20,7 @@ from twilio.rest import Client
 import logging
 import time
 
-def sendSms(settings, toNumber, message, attachments=[]):
+def sendSms(settings, toNumber, message, attachments=[], retries=5):
     """Send SMS (phone text) message to given number using Twilio API
 
     Args:
@@ -28,14 +28,15 @@ def sendSms(settings, toNumber, message, attachments=[]):
         toNumber (str): Phone number in '+1...' format
         message (str): Message body
         attachments (list): optional list of attachements files
+        retries (int): number of attempts before giving up
 
     Returns:
-        Twilio API result
+        Twilio API result, or None if all attempts failed
     """
     if not sendSms.client:
         sendSms.client = Client(settings.twilioAccountSid, settings.twilioAuthToken)
 
-    retriesLeft = 5
+    retriesLeft = retries
     while retriesLeft > 0:
         retriesLeft -= 1
         try:
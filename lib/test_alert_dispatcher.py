@@ -0,0 +1,144 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test alert_dispatcher
+
+"""
+
+import os
+import threading
+import time
+import alert_dispatcher
+
+
+def addTestAlert(spool, deliveries):
+    return spool.addAlert('cam1', 1000, 0.9, ('img.jpg', b'jpeg'), ('img_Score.jpg', b'annotated'), deliveries)
+
+
+def dispatchAll(dispatcher):
+    for future in dispatcher.dispatchDue():
+        future.result()
+
+
+def testSendAll(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'))
+    sent = []
+    def sendFn(delivery):
+        sent.append((delivery['Channel'], delivery['Recipient'], delivery['CameraName']))
+        assert os.path.basename(delivery['ImgPath']).endswith('_img.jpg')
+        with open(delivery['ImgPath'], 'rb') as f:
+            assert f.read() == b'jpeg'
+        with open(delivery['AnnotatedPath'], 'rb') as f:
+            assert f.read() == b'annotated'
+        return True
+    dispatcher = alert_dispatcher.AlertDispatcher(spool, {'email': sendFn, 'sms': sendFn}, {'sms': 2})
+    addTestAlert(spool, [('email', 'a@b.c'), ('sms', '1'), ('sms', '2')])
+    dispatchAll(dispatcher)
+    assert sorted(sent) == [('email', 'a@b.c', 'cam1'), ('sms', '1', 'cam1'), ('sms', '2', 'cam1')]
+    assert spool.getStats() == {}
+    assert os.listdir(tmp_path / 'spool') == ['alerts.db'] # spooled image removed
+    dispatcher.stop()
+
+
+def testRetry(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'))
+    results = [False, True]
+    def sendFn(delivery):
+        return results.pop(0)
+    dispatcher = alert_dispatcher.AlertDispatcher(spool, {'email': sendFn}, retrySeconds=0)
+    addTestAlert(spool, [('email', 'a@b.c')])
+    dispatchAll(dispatcher)
+    assert spool.getStats() == {'pending': 1}
+    dispatchAll(dispatcher)
+    assert spool.getStats() == {}
+    assert results == []
+
+
+def testGiveUp(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'))
+    attempts = []
+    def sendFn(delivery):
+        attempts.append(delivery['Attempts'])
+        raise Exception('boom')
+    dispatcher = alert_dispatcher.AlertDispatcher(spool, {'email': sendFn}, maxAttempts=3, retrySeconds=0)
+    addTestAlert(spool, [('email', 'a@b.c')])
+    for i in range(5):
+        dispatchAll(dispatcher)
+    assert attempts == [0, 1, 2]
+    assert spool.getStats() == {}
+    assert os.listdir(tmp_path / 'spool') == ['alerts.db']
+
+
+def testBackoff(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'))
+    dispatcher = alert_dispatcher.AlertDispatcher(spool, {'email': lambda delivery: False}, retrySeconds=100)
+    addTestAlert(spool, [('email', 'a@b.c')])
+    dispatchAll(dispatcher)
+    dispatchAll(dispatcher) # not due yet
+    assert spool.getStats() == {'pending': 1}
+    assert spool.claimDue('other', 1e12)[0]['Attempts'] == 1
+
+
+def testStaleClaims(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'), staleSeconds=60)
+    addTestAlert(spool, [('sms', '1')])
+    assert len(spool.claimDue('dead', 2e9)) == 1
+    assert spool.claimDue('other', 2e9 + 30) == [] # still claimed
+    # pending deliveries survive restarts and abandoned claims are reclaimed
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'), staleSeconds=60)
+    deliveries = spool.claimDue('other', 2e9 + 61)
+    assert [(delivery['Recipient'], delivery['CameraName']) for delivery in deliveries] == [('1', 'cam1')]
+
+
+def testClaimIdleWorkersOnly(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'))
+    release = threading.Event()
+    sent = []
+    def sendFn(delivery):
+        release.wait()
+        sent.append(delivery['Recipient'])
+        return True
+    dispatcher = alert_dispatcher.AlertDispatcher(spool, {'email': sendFn})
+    addTestAlert(spool, [('email', 'a@b.c'), ('email', 'd@e.f')])
+    futures = dispatcher.dispatchDue()
+    assert len(futures) == 1
+    assert dispatcher.dispatchDue() == [] # single email worker is busy
+    assert spool.getStats() == {'pending': 1, 'sending': 1}
+    release.set()
+    futures[0].result()
+    dispatchAll(dispatcher)
+    assert sorted(sent) == ['a@b.c', 'd@e.f']
+    dispatcher.stop()
+
+
+def testStaleClaimInFlight(tmp_path):
+    spool = alert_dispatcher.AlertSpool(str(tmp_path / 'spool'), staleSeconds=0)
+    release = threading.Event()
+    sent = []
+    def sendFn(delivery):
+        release.wait()
+        sent.append(delivery['Recipient'])
+        return True
+    dispatcher = alert_dispatcher.AlertDispatcher(spool, {'sms': sendFn}, {'sms': 2})
+    addTestAlert(spool, [('sms', '1')])
+    futures = dispatcher.dispatchDue()
+    time.sleep(0.01)
+    assert dispatcher.dispatchDue() == [] # stale claim reclaimed, but send is still in progress
+    release.set()
+    futures[0].result()
+    assert sent == ['1']
+    assert spool.getStats() == {}
+    dispatcher.stop()
@@ -0,0 +1,48 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test annotation_renderer
+
+"""
+
+import io
+import numpy as np
+from PIL import Image
+import annotation_renderer
+
+FIRE_SEGMENT = {'MinX': 100, 'MinY': 50, 'MaxX': 399, 'MaxY': 349, 'score': 0.93, 'HistMax': 0.41}
+
+
+def testRenderFireBox():
+    imgArray = np.zeros((480, 640, 3), dtype=np.uint8)
+    imgArray.setflags(write=False) # decoded frames are read only
+    jpegBytes = annotation_renderer.renderFireBox(imgArray, FIRE_SEGMENT)
+    assert not imgArray.any() # original frame untouched
+    img = Image.open(io.BytesIO(jpegBytes))
+    assert img.format == 'JPEG'
+    assert img.size == (640, 480)
+    annotated = np.asarray(img.convert('RGB')).astype(int)
+    # 3 pixel red outline
+    assert annotated[200, 100:103, 0].min() > 150 and annotated[200, 100:103, 2].max() < 60
+    assert annotated[200, 104:110].max() < 60
+    # red score above center and blue historical max below
+    assert (annotated[100:200, 150:350, 0] > 150).sum() > 100
+    assert (annotated[200:300, 150:350, 2] > 150).sum() > 100
+
+
+def testFontsCached():
+    assert annotation_renderer.getFont(80) is annotation_renderer.getFont(80)
+    assert annotation_renderer.getAnnotatedName('/tmp/cam1__2019.jpg') == 'cam1__2019_Score.jpg'
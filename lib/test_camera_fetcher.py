@@ -0,0 +1,127 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test camera_fetcher
+
+"""
+
+import camera_fetcher
+import pytest
+import hashlib
+
+
+class FakeScheduler(object):
+    def __init__(self, cameras):
+        self.cameras = cameras
+        self.counter = 0
+        self.unchanged = []
+
+    def getNextCamera(self):
+        self.counter += 1
+        return self.cameras[(self.counter - 1) % len(self.cameras)]
+
+    def releaseCamera(self, camera, changed=True):
+        if not changed:
+            self.unchanged.append(camera['name'])
+
+
+class FakeResponse(object):
+    def __init__(self, content, headers, requestHeaders):
+        self.content = content
+        self.headers = headers
+        self.status_code = 200
+        if headers.get('ETag') and (requestHeaders.get('If-None-Match') == headers['ETag']):
+            self.status_code = 304
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        if self.content is None:
+            raise Exception('HTTP error')
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i+chunk_size]
+
+
+class FakeSession(object):
+    def __init__(self, contents):
+        self.contents = contents
+        self.etags = {}
+        self.numGets = 0
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.numGets += 1
+        etag = self.etags.get(url)
+        return FakeResponse(self.contents[url], {'ETag': etag} if etag else {}, headers)
+
+
+def getFetcher(contents):
+    cameras = [{'name': 'cam%d' % i, 'url': 'http://host/%d.jpg' % i} for i in range(len(contents))]
+    fetcher = camera_fetcher.CameraFetcher(FakeScheduler(cameras), cameras)
+    fetcher.session = FakeSession({cameras[i]['url']: contents[i] for i in range(len(contents))})
+    return fetcher
+
+
+def testFetchNext():
+    fetcher = getFetcher([b'img0', b'img1'])
+    (cameraName, timestamp, imgBytes, md5, isRecheck) = fetcher.fetchNext()
+    assert cameraName == 'cam0'
+    assert imgBytes == b'img0'
+    assert md5 == hashlib.md5(b'img0').hexdigest()
+    assert not isRecheck
+
+
+def testSkipsFailedAndUnchanged():
+    fetcher = getFetcher([b'img0', None, b'img2'])
+    assert fetcher.fetchNext()[0] == 'cam0'
+    assert fetcher.fetchNext()[0] == 'cam2' # cam1 failed
+    fetcher.session.contents['http://host/2.jpg'] = b'img2new'
+    assert fetcher.fetchNext()[0] == 'cam2' # cam0 unchanged, cam1 failed again
+    assert fetcher.cameraScheduler.unchanged == ['cam1', 'cam0', 'cam1']
+
+
+def testConditionalRequest():
+    fetcher = getFetcher([b'img0', b'img1'])
+    fetcher.session.etags['http://host/0.jpg'] = 'v1'
+    assert fetcher.fetchNext()[0] == 'cam0'
+    assert fetcher.fetchNext()[0] == 'cam1'
+    fetcher.session.contents['http://host/1.jpg'] = b'img1new'
+    assert fetcher.fetchNext()[0] == 'cam1' # cam0 not modified (304)
+    assert fetcher.session.numGets == 4
+
+
+def testSkipsRecentFrames():
+    fetcher = getFetcher([b'img0', b'img1'])
+    assert fetcher.fetchNext()[0] == 'cam0'
+    assert fetcher.fetchNext()[0] == 'cam1'
+    fetcher.session.contents['http://host/0.jpg'] = b'img0new'
+    assert fetcher.fetchNext()[0] == 'cam0'
+    fetcher.session.contents['http://host/0.jpg'] = b'img0' # camera flips back to stale frame
+    fetcher.session.contents['http://host/1.jpg'] = b'img1new'
+    assert fetcher.fetchNext()[0] == 'cam1'
+
+
+def testGivesUpAfterRotation():
+    fetcher = getFetcher([None, None])
+    assert fetcher.fetchNext() == None
+    assert fetcher.cameraScheduler.unchanged == ['cam0', 'cam1']
+    fetcher.session.contents['http://host/0.jpg'] = b'img0'
+    assert fetcher.fetchNext()[0] == 'cam0'
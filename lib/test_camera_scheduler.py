@@ -0,0 +1,146 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test camera_scheduler
+
+"""
+
+import camera_scheduler
+import time
+
+
+def getCameras(num):
+    return [{'name': 'cam%d' % i, 'url': 'http://host/%d.jpg' % i} for i in range(num)]
+
+
+def testClaimsAreDisjoint(dbManager):
+    cameras = getCameras(6)
+    schedulerA = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=3)
+    schedulerB = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=3)
+    schedulerB.owner = 'otherProcess'
+    namesA = [schedulerA.getNextCamera()['name'] for i in range(3)]
+    namesB = [schedulerB.getNextCamera()['name'] for i in range(3)]
+    assert len(set(namesA + namesB)) == 6
+
+
+def testReleasedCamerasAreReclaimed(dbManager):
+    cameras = getCameras(3)
+    scheduler = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=3)
+    firstRound = [scheduler.getNextCamera() for i in range(3)]
+    assert sorted(camera['name'] for camera in firstRound) == ['cam0', 'cam1', 'cam2']
+    assert not dbManager.claimCameraLeases('otherProcess', ['cam0', 'cam1', 'cam2'], 3, 60)
+    for camera in firstRound:
+        scheduler.releaseCamera(camera)
+    dbManager.releaseCameraLeases(scheduler.owner, scheduler.released)
+    dbManager.execute('UPDATE camera_leases SET LeaseExpires=LeaseExpires-1') # simulate passing time
+    assert len(dbManager.claimCameraLeases('otherProcess', ['cam0', 'cam1', 'cam2'], 3, 60)) == 3
+
+
+def testInitIsIdempotent(dbManager):
+    cameras = getCameras(2)
+    camera_scheduler.CameraScheduler(dbManager, cameras)
+    camera_scheduler.CameraScheduler(dbManager, cameras)
+    assert len(dbManager.query('SELECT * FROM camera_leases')) == 2
+
+
+def testReleaseWithNextDueTimes(dbManager):
+    cameras = getCameras(2)
+    scheduler = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=2)
+    names = [scheduler.getNextCamera()['name'] for i in range(2)]
+    dueTime = int(time.time()) + 600
+    dbManager.releaseCameraLeases(scheduler.owner, names, {'cam0': dueTime})
+    rows = dbManager.query('SELECT CameraName, LeaseExpires FROM camera_leases ORDER BY CameraName')
+    assert rows[0]['leaseexpires'] == dueTime
+    assert rows[1]['leaseexpires'] <= time.time()
+    dbManager.execute('UPDATE camera_leases SET LeaseExpires=LeaseExpires-1') # simulate passing time
+    assert dbManager.claimCameraLeases('otherProcess', ['cam0', 'cam1'], 2, 60) == ['cam1']
+
+
+def testAffinity(dbManager):
+    cameras = getCameras(4)
+    names = [camera['name'] for camera in cameras]
+    camera_scheduler.CameraScheduler(dbManager, cameras)
+    ownNames = dbManager.claimCameraLeases('self', names, 2, 60, affinitySeconds=300)
+    otherNames = dbManager.claimCameraLeases('other', names, 2, 60)
+    timeNow = int(time.time())
+    # other cameras have been claimable for longer, but own cameras go first
+    dbManager.releaseCameraLeases('other', otherNames, {name: timeNow - 20 for name in otherNames})
+    dbManager.releaseCameraLeases('self', ownNames, {name: timeNow - 10 for name in ownNames})
+    assert sorted(dbManager.claimCameraLeases('self', names, 2, 60, affinitySeconds=300)) == sorted(ownNames)
+    # unless they weren't reclaimed by their owner in time
+    dbManager.releaseCameraLeases('self', ownNames, {name: timeNow - 10 for name in ownNames})
+    dbManager.releaseCameraLeases('other', otherNames, {name: timeNow - 400 for name in otherNames})
+    assert sorted(dbManager.claimCameraLeases('self', names, 2, 60, affinitySeconds=300)) == sorted(otherNames)
+
+
+class FakeScanPriority(object):
+    def __init__(self):
+        self.fetches = []
+
+    def recordFetch(self, cameraName, changed):
+        self.fetches.append((cameraName, changed))
+
+    def getInterval(self, cameraName, timestamp):
+        return 300
+
+
+def testReleaseWithScanPriority(dbManager):
+    cameras = getCameras(2)
+    scanPriority = FakeScanPriority()
+    scheduler = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=1, scanPriority=scanPriority)
+    camera = scheduler.getNextCamera()
+    scheduler.releaseCamera(camera, changed=False)
+    assert scanPriority.fetches == [(camera['name'], False)]
+    assert scheduler.nextDueTimes[camera['name']] > time.time() + 290
+    otherCamera = scheduler.getNextCamera() # releases first camera until due
+    assert otherCamera['name'] != camera['name']
+    row = dbManager.query("SELECT LeaseExpires FROM camera_leases WHERE CameraName='%s'" % camera['name'])[0]
+    assert row['leaseexpires'] > time.time() + 290
+
+
+class FakeRecheckQueue(object):
+    def __init__(self, cameraName):
+        self.cameraName = cameraName
+        self.retries = []
+
+    def popDueCamera(self, timeNow):
+        (cameraName, self.cameraName) = (self.cameraName, None)
+        return cameraName
+
+    def retry(self, cameraName, timeNow):
+        self.retries.append(cameraName)
+
+
+def testRecheckFirst(dbManager):
+    cameras = getCameras(3)
+    recheckQueue = FakeRecheckQueue('cam2')
+    scheduler = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=1, recheckQueue=recheckQueue)
+    camera = scheduler.getNextCamera()
+    assert camera['name'] == 'cam2'
+    assert camera['recheck']
+    scheduler.releaseCamera(camera, changed=False)
+    assert recheckQueue.retries == ['cam2']
+    assert scheduler.released == []
+    camera = scheduler.getNextCamera()
+    assert camera['name'] == 'cam0'
+    assert not camera.get('recheck')
+
+
+def testNoneWhenAllLeased(dbManager):
+    cameras = getCameras(1)
+    scheduler = camera_scheduler.CameraScheduler(dbManager, cameras, batchSize=1)
+    assert dbManager.claimCameraLeases('otherProcess', ['cam0'], 1, 60) == ['cam0']
+    assert scheduler.getNextCamera() == None
@@ -0,0 +1,123 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test change_gate
+
+"""
+
+import change_gate
+import rect_to_squares
+import numpy as np
+
+
+class FakeClassifier(object):
+    def __init__(self):
+        self.numClassified = 0
+        self.scoreOffset = 0.0
+
+    def classify(self, segments):
+        self.numClassified += len(segments)
+        for segmentInfo in segments:
+            segmentInfo['score'] = float(segmentInfo['imgArray'].mean()) / 255 + self.scoreOffset
+
+
+def getSegments(imgArray):
+    return rect_to_squares.cutBoxesArray(imgArray)
+
+
+def scoreSegments(gate, camera, segments, classifier):
+    # same sequence as the detection policy
+    (toScore, pending) = gate.selectSegments(camera, segments)
+    classifier.classify(toScore)
+    gate.updateSegments(camera, segments, pending)
+
+
+def testThumbnail():
+    imgArray = np.zeros((299, 299, 3), dtype=np.uint8)
+    imgArray[:13, :13] = 255
+    thumbnail = change_gate.getThumbnail(imgArray, 13)
+    assert thumbnail.shape == (23, 23)
+    assert thumbnail[0, 0] == 255
+    assert thumbnail[0, 1] == 0
+
+
+def testSkipsUnchangedSegments():
+    gate = change_gate.SegmentChangeGate(changeThreshold=2.0, rescoreFrames=3)
+    classifier = FakeClassifier()
+    imgArray = np.random.randint(0, 256, (598, 598, 3), dtype=np.uint8)
+    numSegments = len(getSegments(imgArray))
+    scoreSegments(gate, 'cam1', getSegments(imgArray), classifier)
+    assert classifier.numClassified == numSegments
+
+    # change only the top left corner
+    imgArray2 = imgArray.copy()
+    imgArray2[:100, :100] = 0
+    segments = getSegments(imgArray2)
+    scoreSegments(gate, 'cam1', segments, classifier)
+    assert classifier.numClassified == numSegments + 1
+    assert all('score' in segmentInfo for segmentInfo in segments)
+    assert sum(1 for segmentInfo in segments if segmentInfo.get('scoreReused')) == numSegments - 1
+
+    # different camera is scored in full
+    scoreSegments(gate, 'cam2', getSegments(imgArray2), classifier)
+    assert classifier.numClassified == 2 * numSegments + 1
+
+    # third frame of cam1 is forced rescore and measures drift
+    classifier.scoreOffset = 0.1
+    scoreSegments(gate, 'cam1', getSegments(imgArray2), classifier)
+    scoreSegments(gate, 'cam1', getSegments(imgArray2), classifier)
+    assert classifier.numClassified == 3 * numSegments + 1
+    stats = gate.getStats()
+    assert stats['frames'] == 5
+    assert stats['skipped'] == 2 * numSegments - 1
+    assert stats['driftSamples'] == numSegments
+    assert abs(stats['driftMax'] - 0.1) < 1e-6
+
+
+def testSlowChangesAccumulate():
+    gate = change_gate.SegmentChangeGate(changeThreshold=2.0, rescoreFrames=100)
+    classifier = FakeClassifier()
+    imgArray = np.full((299, 299, 3), 100, dtype=np.uint8)
+    scoreSegments(gate, 'cam1', getSegments(imgArray), classifier)
+    for i in range(1, 4):
+        scoreSegments(gate, 'cam1', getSegments(imgArray + i), classifier)
+    # each step changes by 1, but the 3rd step differs by 3 from the scored frame
+    assert classifier.numClassified == 2
+
+
+def testDisabled():
+    gate = change_gate.SegmentChangeGate(changeThreshold=0)
+    classifier = FakeClassifier()
+    imgArray = np.zeros((299, 299, 3), dtype=np.uint8)
+    for i in range(3):
+        scoreSegments(gate, 'cam1', getSegments(imgArray), classifier)
+    assert classifier.numClassified == 3
+    assert gate.getStats()['skipRate'] == 0
+
+
+def testReusesPrefiltered():
+    gate = change_gate.SegmentChangeGate(changeThreshold=2.0, rescoreFrames=100)
+    imgArray = np.zeros((299, 299, 3), dtype=np.uint8)
+    segments = getSegments(imgArray)
+    (toScore, pending) = gate.selectSegments('cam1', segments)
+    for segmentInfo in toScore:
+        segmentInfo['score'] = 0.01
+        segmentInfo['prefiltered'] = True
+    gate.updateSegments('cam1', segments, pending)
+    segments = getSegments(imgArray)
+    (toScore, pending) = gate.selectSegments('cam1', segments)
+    assert not toScore
+    assert segments[0]['scoreReused'] and segments[0]['prefiltered']
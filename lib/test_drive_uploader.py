@@ -0,0 +1,171 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test drive_uploader
+
+"""
+
+import os
+import threading
+import time
+import drive_uploader
+import goog_helper
+
+
+class FakeDrive(object):
+    def __init__(self, monkeypatch, failNames=[]):
+        self.uploads = []
+        self.failNames = list(failNames) # each entry fails one upload of that name
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+        self.release.set()
+        monkeypatch.setattr(goog_helper, 'uploadFile', self.uploadFile)
+        monkeypatch.setattr(goog_helper, 'uploadBytes', self.uploadBytes)
+
+
+    def uploadFile(self, service, dirID, localFilePath):
+        with open(localFilePath) as f:
+            return self.uploadBytes(service, dirID, os.path.basename(localFilePath), f.read())
+
+
+    def uploadBytes(self, service, dirID, name, content):
+        self.release.wait()
+        if isinstance(content, bytes):
+            content = content.decode()
+        with self.lock:
+            self.uploads.append((dirID, name, content))
+        if name in self.failNames:
+            self.failNames.remove(name)
+            return None
+        return {'id': 'id_' + name}
+
+
+def writeFile(dirPath, name):
+    filePath = os.path.join(str(dirPath), name)
+    with open(filePath, 'w') as f:
+        f.write(name)
+    return filePath
+
+
+def testUploadAndPatch(tmp_path, monkeypatch):
+    drive = FakeDrive(monkeypatch, failNames=['c.jpg', 'c.jpg'])
+    patches = []
+    uploader = drive_uploader.DriveUploader(lambda: 'service', str(tmp_path / 'spool'), numWorkers=2,
+                                            patchFn=patches.extend, pollSeconds=0.05, maxAttempts=2, retrySeconds=0)
+    uploader.upload('dir1', writeFile(tmp_path, 'a.jpg'), patch={'CameraName': 'cam1'})
+    bPath = writeFile(tmp_path, 'b.jpg')
+    uploader.upload('dir1', bPath, move=True)
+    uploader.upload('dir2', writeFile(tmp_path, 'c.jpg'), patch={'CameraName': 'cam2'})
+    assert not os.path.exists(bPath)
+    uploader.stop()
+    assert sorted(drive.uploads) == [('dir1', 'a.jpg', 'a.jpg'), ('dir1', 'b.jpg', 'b.jpg'),
+                                     ('dir2', 'c.jpg', 'c.jpg'), ('dir2', 'c.jpg', 'c.jpg')]
+    assert patches == [({'CameraName': 'cam1'}, 'id_a.jpg')]
+    stats = uploader.getStats()
+    assert (stats['queued'], stats['uploaded'], stats['retried'], stats['failed'], stats['depth']) == (3, 2, 1, 1, 0)
+    assert os.listdir(tmp_path / 'spool') == []
+    assert os.path.exists(tmp_path / 'a.jpg') # only linked
+
+
+def testSpill(tmp_path, monkeypatch):
+    drive = FakeDrive(monkeypatch)
+    drive.release.clear() # block uploads
+    uploader = drive_uploader.DriveUploader(lambda: 'service', str(tmp_path / 'spool'), numWorkers=1,
+                                            maxQueued=2, pollSeconds=0.05)
+    for i in range(6):
+        uploader.upload('dir', writeFile(tmp_path, '%d.jpg' % i))
+    stats = uploader.getStats()
+    assert stats['spilled'] >= 3
+    assert stats['spillDepth'] == stats['spilled']
+    drive.release.set()
+    uploader.stop()
+    assert sorted(name for (_, name, _) in drive.uploads) == ['%d.jpg' % i for i in range(6)]
+    assert uploader.getStats()['spillDepth'] == 0
+
+
+def testResumeSpilled(tmp_path, monkeypatch):
+    drive = FakeDrive(monkeypatch)
+    spoolDir = str(tmp_path / 'spool')
+    uploader = drive_uploader.DriveUploader(lambda: 'service', spoolDir, numWorkers=0)
+    uploader.upload('dir', writeFile(tmp_path, 'a.jpg'))
+    uploader.upload('dir', writeFile(tmp_path, 'b.jpg'))
+    uploader.stop(waitSeconds=0) # pending uploads spilled for the next run
+    assert uploader.getStats()['spillDepth'] == 2
+    uploader = drive_uploader.DriveUploader(lambda: 'service', spoolDir, numWorkers=1, pollSeconds=0.05)
+    uploader.stop()
+    assert sorted(name for (_, name, _) in drive.uploads) == ['a.jpg', 'b.jpg']
+
+
+def testUploadData(tmp_path, monkeypatch):
+    drive = FakeDrive(monkeypatch)
+    drive.release.clear()
+    patches = []
+    uploader = drive_uploader.DriveUploader(lambda: 'service', str(tmp_path / 'spool'), numWorkers=1, maxQueued=1,
+                                            patchFn=patches.extend, pollSeconds=0.05)
+    for i in range(3):
+        uploader.uploadData('dir', '%d_Score.jpg' % i, b'data%d' % i, patch=i)
+    assert uploader.getStats()['spilled'] >= 1 # spilled data is written to the spool
+    drive.release.set()
+    uploader.stop()
+    assert sorted(drive.uploads) == [('dir', '%d_Score.jpg' % i, 'data%d' % i) for i in range(3)]
+    assert sorted(patches) == [(i, 'id_%d_Score.jpg' % i) for i in range(3)]
+    assert os.listdir(tmp_path / 'spool') == []
+
+
+def testRetryFailed(tmp_path, monkeypatch):
+    drive = FakeDrive(monkeypatch, failNames=['a.jpg'])
+    patches = []
+    uploader = drive_uploader.DriveUploader(lambda: 'service', str(tmp_path / 'spool'), numWorkers=1,
+                                            patchFn=patches.extend, pollSeconds=0.05, retrySeconds=100)
+    uploader.uploadData('dir', 'a.jpg', b'a', patch=1)
+    deadline = time.time() + 5
+    while not uploader.getStats()['retried'] and time.time() < deadline:
+        time.sleep(0.05)
+    stats = uploader.getStats()
+    assert (stats['retried'], stats['spillDepth']) == (1, 1) # retry not due yet
+    uploader.stop(waitSeconds=0)
+    assert patches == []
+    uploader = drive_uploader.DriveUploader(lambda: 'service', str(tmp_path / 'spool'), numWorkers=1,
+                                            patchFn=patches.extend, pollSeconds=0.05)
+    for jsonPath in (tmp_path / 'spool').glob('*.json'):
+        os.utime(jsonPath, (time.time(), time.time())) # pass the retry time
+    uploader.stop()
+    assert drive.uploads == [('dir', 'a.jpg', 'a'), ('dir', 'a.jpg', 'a')]
+    assert patches == [(1, 'id_a.jpg')]
+    assert os.listdir(tmp_path / 'spool') == []
+
+
+def testDurableUploads(tmp_path, monkeypatch):
+    drive = FakeDrive(monkeypatch)
+    spoolDir = str(tmp_path / 'spool')
+    uploader = drive_uploader.DriveUploader(lambda: 'service', spoolDir, numWorkers=0)
+    uploader.uploadData('dir', 'a.jpg', b'a', patch=1, durable=True)
+    uploader.uploadData('dir', 'b.jpg', b'b')
+    assert uploader.getStats()['spillDepth'] == 1 # on disk before the process could be killed
+    # process killed while uploading: its claim is taken over once stale
+    jsonPath = str(next((tmp_path / 'spool').glob('*.json')))
+    os.rename(jsonPath, jsonPath + '.1-dead')
+    os.utime(jsonPath + '.1-dead', (time.time() - 3600, time.time() - 3600))
+    patches = []
+    uploader = drive_uploader.DriveUploader(lambda: 'service', spoolDir, numWorkers=1, patchFn=patches.extend,
+                                            pollSeconds=0.05)
+    deadline = time.time() + 5
+    while not patches and time.time() < deadline:
+        time.sleep(0.05)
+    uploader.stop()
+    assert drive.uploads == [('dir', 'a.jpg', 'a')]
+    assert patches == [(1, 'id_a.jpg')]
+    assert os.listdir(tmp_path / 'spool') == []
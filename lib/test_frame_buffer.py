@@ -0,0 +1,90 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test frame_buffer
+
+"""
+
+import frame_buffer
+import numpy as np
+
+
+def getFrame(value):
+    return np.full((10, 10, 3), value, dtype=np.uint8) # 300 bytes
+
+
+def testGetFrame():
+    frameBuffer = frame_buffer.FrameRingBuffer()
+    for minute in range(5):
+        frameBuffer.addFrame('cam1', 1000 + minute * 60, getFrame(minute))
+    (timestamp, imgArray) = frameBuffer.getFrame('cam1', 1000 + 4 * 60 - 180, 60)
+    assert timestamp == 1060
+    assert imgArray[0, 0, 0] == 1
+    (timestamp, imgArray) = frameBuffer.getFrame('cam1', 1000 + 4 * 60 - 170, 60)
+    assert timestamp == 1060
+    assert frameBuffer.getFrame('cam1', 990, 60) == (None, None)
+    assert frameBuffer.getFrame('cam2', 1000, 60) == (None, None)
+
+
+def testTolerance():
+    frameBuffer = frame_buffer.FrameRingBuffer()
+    frameBuffer.addFrame('cam1', 1000, getFrame(0))
+    frameBuffer.addFrame('cam1', 1300, getFrame(1))
+    assert frameBuffer.getFrame('cam1', 1200, 60) == (None, None)
+    assert frameBuffer.getFrame('cam1', 1200, 300)[0] == 1000
+
+
+def testDepth():
+    frameBuffer = frame_buffer.FrameRingBuffer(maxFramesPerCamera=3)
+    for minute in range(5):
+        frameBuffer.addFrame('cam1', 1000 + minute * 60, getFrame(minute))
+    assert frameBuffer.getStats()['frames'] == 3
+    assert frameBuffer.getStats()['bytes'] == 900
+    assert frameBuffer.getFrame('cam1', 1060, 60) == (None, None)
+    assert frameBuffer.getFrame('cam1', 1120, 60)[0] == 1120
+
+
+def testMaxAge():
+    frameBuffer = frame_buffer.FrameRingBuffer(maxAgeSeconds=120)
+    for minute in range(5):
+        frameBuffer.addFrame('cam1', 1000 + minute * 60, getFrame(minute))
+    assert frameBuffer.getStats()['frames'] == 3
+
+
+def testEvictLRUCamera():
+    frameBuffer = frame_buffer.FrameRingBuffer(maxBytes=1000)
+    frameBuffer.addFrame('cam1', 1000, getFrame(0))
+    frameBuffer.addFrame('cam2', 1000, getFrame(0))
+    frameBuffer.addFrame('cam3', 1000, getFrame(0))
+    frameBuffer.addFrame('cam1', 1060, getFrame(0)) # cam1 now most recently used
+    stats = frameBuffer.getStats()
+    assert stats['cameras'] == 2
+    assert stats['evictedCameras'] == 1
+    assert stats['bytes'] == 900
+    assert frameBuffer.getFrame('cam2', 1000, 60) == (None, None)
+    assert frameBuffer.getFrame('cam1', 1000, 60)[0] == 1000
+    assert frameBuffer.getFrame('cam3', 1000, 60)[0] == 1000
+
+
+def testSingleCameraOverLimit():
+    frameBuffer = frame_buffer.FrameRingBuffer(maxBytes=700)
+    for minute in range(4):
+        frameBuffer.addFrame('cam1', 1000 + minute * 60, getFrame(minute))
+    stats = frameBuffer.getStats()
+    assert stats['frames'] == 2
+    assert stats['bytes'] == 600
+    assert stats['evictedCameras'] == 0
+    assert frameBuffer.getFrame('cam1', 1120, 60)[0] == 1120
@@ -0,0 +1,76 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test img_archive
+
+"""
+
+import img_archive
+import numpy as np
+import pytest
+from PIL import Image
+
+
+def getRandomImage(seed, height=64, width=96):
+    randomState = np.random.RandomState(seed)
+    return Image.fromarray(randomState.randint(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def testDiffImagesIdentical():
+    imgA = getRandomImage(1)
+    imgB = getRandomImage(2)
+    # include exact matches and both clipping extremes
+    arrayA = np.array(imgA)
+    arrayB = np.array(imgB)
+    arrayA[0, :3] = [[255, 255, 255], [0, 0, 0], [100, 100, 100]]
+    arrayB[0, :3] = [[0, 0, 0], [255, 255, 255], [100, 100, 100]]
+    imgA = Image.fromarray(arrayA)
+    imgB = Image.fromarray(arrayB)
+    imgDiff = img_archive.diffImages(imgA, imgB)
+    imgDiffRef = img_archive.diffImagesImageMath(imgA, imgB)
+    assert imgDiff.mode == imgDiffRef.mode
+    assert imgDiff.size == imgDiffRef.size
+    assert imgDiff.tobytes() == imgDiffRef.tobytes()
+    assert list(np.asarray(imgDiff)[0, :3, 0]) == [255, 0, 128]
+
+
+def testDiffImagesRequiresRGB():
+    imgA = getRandomImage(5)
+    for imgB in [imgA.convert('RGBA'), imgA.convert('L')]:
+        with pytest.raises(ValueError):
+            img_archive.diffImages(imgA, imgB)
+        with pytest.raises(ValueError):
+            img_archive.diffImages(imgB, imgA)
+
+
+def testDiffImageArraysOut():
+    arrayA = np.asarray(getRandomImage(3))
+    arrayB = np.asarray(getRandomImage(4))
+    out = np.zeros(arrayA.shape, dtype=np.uint8)
+    scratch = np.empty(arrayA.shape, dtype=np.int16)
+    result = img_archive.diffImageArrays(arrayA, arrayB, out=out, scratch=scratch)
+    assert result is out
+    expected = np.clip(arrayA.astype(np.int32) - arrayB + 128, 0, 255)
+    assert np.array_equal(out, expected)
+
+
+def testDiffImageSequence():
+    frames = [np.asarray(getRandomImage(seed)) for seed in range(5)]
+    diffs = img_archive.diffImageSequence(frames, minusFrames=2)
+    assert diffs.shape == (3,) + frames[0].shape
+    for i in range(3):
+        assert np.array_equal(diffs[i], img_archive.diffImageArrays(frames[i + 2], frames[i]))
+    assert img_archive.diffImageSequence(frames[:2], minusFrames=2).shape == (0,) + frames[0].shape
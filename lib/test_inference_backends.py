@@ -0,0 +1,82 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test inference_backends
+
+"""
+
+import inference_backends
+import numpy as np
+import pytest
+import os
+import tempfile
+from PIL import Image
+
+
+class FakeBackend(inference_backends.TileBackend):
+    def __init__(self, labelsFile):
+        super().__init__(labelsFile)
+        self.runShapes = []
+
+    def _run(self, inputs):
+        self.runShapes.append(inputs.shape)
+        smoke = (inputs.mean(axis=(1, 2, 3)) + 1) / 2
+        return np.stack([1 - smoke, smoke], axis=1)
+
+
+@pytest.fixture
+def labelsFile():
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        labelsPath = os.path.join(tmpDirName, 'labels.txt')
+        with open(labelsPath, 'w') as f:
+            f.write('other\nsmoke\n')
+        yield labelsPath
+
+
+def testNormalizeTiles():
+    tiles = np.full((2, 299, 299, 3), 255, dtype=np.uint8)
+    normalized = inference_backends.normalizeTiles(tiles)
+    assert normalized.dtype == np.float32
+    assert normalized.max() == pytest.approx(127 / 128)
+    resized = inference_backends.normalizeTiles(np.zeros((1, 100, 150, 3), dtype=np.uint8))
+    assert resized.shape == (1, 299, 299, 3)
+    assert resized.min() == -1
+
+
+def testClassifySegmentArrays(labelsFile):
+    backend = FakeBackend(labelsFile)
+    assert backend.smokeIndex == 1
+    segments = [{'imgArray': np.full((299, 299, 3), value, dtype=np.uint8)} for value in [0, 128, 255]]
+    segments.append({'imgArray': np.full((100, 299, 3), 128, dtype=np.uint8)})
+    backend.classifySegmentArrays(segments)
+    assert len(backend.runShapes) == 2
+    assert [s['score'] for s in segments] == pytest.approx([0, 0.5, 1, 0.5], abs=0.01)
+
+
+def testClassifySegments(labelsFile):
+    backend = FakeBackend(labelsFile)
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        imgPath = os.path.join(tmpDirName, 'seg.png')
+        Image.fromarray(np.full((299, 299, 3), 255, dtype=np.uint8)).save(imgPath)
+        segments = [{'imgPath': imgPath}]
+        backend.classifySegments(segments)
+    assert segments[0]['score'] == pytest.approx(1, abs=0.01)
+    assert 'imgArray' not in segments[0]
+
+
+def testUnknownBackend(labelsFile):
+    with pytest.raises(ValueError):
+        inference_backends.createBackend('bad', 'model', labelsFile)
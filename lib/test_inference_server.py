@@ -0,0 +1,107 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test inference_server
+
+"""
+
+import inference_server
+import numpy as np
+import pytest
+import os
+import tempfile
+import threading
+import time
+
+
+class FakeClassifier(object):
+    def __init__(self):
+        self.batchSizes = []
+
+    def classifySegmentArrays(self, segments):
+        self.batchSizes.append(len(segments))
+        for segmentInfo in segments:
+            if segmentInfo['imgArray'][0, 0, 0] == 255:
+                raise ValueError('bad tile')
+            segmentInfo['score'] = float(segmentInfo['imgArray'].mean()) / 255
+            if segmentInfo['imgArray'][0, 0, 0] == 1:
+                segmentInfo['prefiltered'] = True # as rejected by a cascade prefilter
+
+
+@pytest.fixture
+def server():
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        server = inference_server.InferenceServer(FakeClassifier(), os.path.join(tmpDirName, 'inference.sock'),
+                                                  maxWaitSeconds=0.2)
+        thread = threading.Thread(target=server.serveForever, daemon=True)
+        thread.start()
+        while not os.path.exists(server.socketPath):
+            time.sleep(0.01)
+        yield server
+        server.shutdown()
+        thread.join()
+
+
+def getSegments(values, size=299):
+    return [{'imgArray': np.full((size, size, 3), value, dtype=np.uint8)} for value in values]
+
+
+def testClassify(server):
+    client = inference_server.InferenceClient(server.socketPath)
+    segments = getSegments([0, 51, 102]) + getSegments([204], size=100)
+    client.classifySegmentArrays(segments)
+    assert [s['score'] for s in segments] == pytest.approx([0, 0.2, 0.4, 0.8])
+    client.close()
+
+
+def testPrefiltered(server):
+    client = inference_server.InferenceClient(server.socketPath)
+    segments = getSegments([1, 100])
+    client.classifySegmentArrays(segments)
+    assert segments[0]['prefiltered']
+    assert segments[0]['score'] == pytest.approx(1 / 255, abs=1e-6) # float32 of -1 - score
+    assert 'prefiltered' not in segments[1]
+    assert segments[1]['score'] == pytest.approx(100 / 255)
+    client.close()
+
+
+def testBatchAcrossClients(server):
+    clients = [inference_server.InferenceClient(server.socketPath) for i in range(3)]
+    results = {}
+
+    def classify(index):
+        segments = getSegments([index * 10] * 5)
+        clients[index].classifySegmentArrays(segments)
+        results[index] = [s['score'] for s in segments]
+
+    threads = [threading.Thread(target=classify, args=(i,)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for i in range(3):
+        assert results[i] == pytest.approx([i * 10 / 255] * 5)
+    assert max(server.classifier.batchSizes) > 5
+
+
+def testClassifierError(server):
+    client = inference_server.InferenceClient(server.socketPath)
+    with pytest.raises(OSError):
+        client.classifySegmentArrays(getSegments([255]))
+    # client reconnects for later requests
+    segments = getSegments([51])
+    client.classifySegmentArrays(segments)
+    assert segments[0]['score'] == pytest.approx(0.2)
@@ -0,0 +1,93 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test pipeline
+
+"""
+
+import pipeline
+import pytest
+import itertools
+import threading
+
+
+def testStagesProcessAllItems():
+    testPipeline = pipeline.Pipeline(queueSize=2)
+    counter = itertools.count()
+    lock = threading.Lock()
+    results = []
+
+    def source():
+        with lock:
+            value = next(counter)
+        if value >= 20:
+            testPipeline.stop()
+            return None
+        return value
+
+    def collect(value):
+        results.append(value)
+
+    testPipeline.addStage('source', source, numWorkers=3)
+    testPipeline.addStage('double', lambda x: 2 * x, numWorkers=2)
+    testPipeline.addStage('collect', collect)
+    error = testPipeline.run()
+    assert error is None
+    assert sorted(results) == [2 * x for x in range(20)]
+    stats = testPipeline.getStats()
+    assert [s['name'] for s in stats] == ['source', 'double', 'collect']
+    assert stats[1]['count'] == 20
+    assert stats[2]['count'] == 20
+
+
+def testErrorAbortsPipeline():
+    testPipeline = pipeline.Pipeline()
+
+    def fail(value):
+        raise ValueError('bad value %d' % value)
+
+    testPipeline.addStage('source', lambda: 1)
+    testPipeline.addStage('fail', fail)
+    error = testPipeline.run()
+    assert isinstance(error, ValueError)
+
+
+def testBatchedStage():
+    testPipeline = pipeline.Pipeline(queueSize=10)
+    counter = itertools.count()
+    batchSizes = []
+    results = []
+
+    def source():
+        value = next(counter)
+        if value >= 25:
+            testPipeline.stop()
+            return None
+        return value
+
+    def doubleBatch(values):
+        batchSizes.append(len(values))
+        return [2 * x for x in values]
+
+    testPipeline.addStage('source', source)
+    testPipeline.addStage('double', doubleBatch, batchSize=4, maxWaitSeconds=0.5)
+    testPipeline.addStage('collect', results.append)
+    error = testPipeline.run()
+    assert error is None
+    assert sorted(results) == [2 * x for x in range(25)]
+    assert sum(batchSizes) == 25
+    assert max(batchSizes) == 4
+    assert testPipeline.getStats()[1]['count'] == 25
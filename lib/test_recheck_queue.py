@@ -0,0 +1,123 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test recheck_queue
+
+"""
+
+import recheck_queue
+
+
+def getSegments(scores, threshold=0.8):
+    """Get a 4x4 grid of 100 pixel segments with given scores (dict of (row, col) -> score)
+    """
+    segments = []
+    for row in range(4):
+        for col in range(4):
+            segmentInfo = {'MinX': col * 100, 'MinY': row * 100, 'MaxX': col * 100 + 100, 'MaxY': row * 100 + 100,
+                           'score': scores.get((row, col), 0.1)}
+            if segmentInfo['score'] >= .5:
+                segmentInfo['threshold'] = threshold
+            segments.append(segmentInfo)
+    return segments
+
+
+def testNeighborKeys():
+    segments = getSegments({})
+    keys = recheck_queue.getNeighborKeys(segments, [segments[0]])
+    assert keys == {(0, 0, 100, 100), (100, 0, 200, 100), (0, 100, 100, 200), (100, 100, 200, 200)}
+    assert len(recheck_queue.getNeighborKeys(segments, [segments[5]])) == 9
+
+
+def testConfirm():
+    queue = recheck_queue.RecheckQueue(numRechecks=2, delaySeconds=20)
+    segments = getSegments({(1, 1): 0.7})
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    assert queue.popDueCamera(1010) == None
+    assert queue.getRecheckSegmentKeys('cam1', 1000) == None
+    assert queue.popDueCamera(1020) == 'cam1'
+    assert len(queue.getRecheckSegmentKeys('cam1', 1025)) == 9
+    assert queue.addScores('cam1', 1025, getSegments({(1, 1): 0.73})) == None
+    assert queue.popDueCamera(1050) == 'cam1'
+    confirmed = queue.addScores('cam1', 1050, getSegments({(1, 1): 0.76}))
+    assert confirmed['MinX'] == 100
+    assert confirmed['recheckScores'] == [0.7, 0.73, 0.76]
+    assert queue.getStats()['confirmed'] == 1
+    assert queue.getStats()['active'] == 0
+
+
+def testConfirmReachingThreshold():
+    queue = recheck_queue.RecheckQueue(numRechecks=2, delaySeconds=20)
+    segments = getSegments({(1, 1): 0.7})
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    queue.addScores('cam1', 1025, getSegments({(1, 1): 0.82}))
+    confirmed = queue.addScores('cam1', 1050, getSegments({(1, 1): 0.75}))
+    assert confirmed['recheckScores'] == [0.7, 0.82, 0.75]
+
+
+def testFlatScoresNotConfirmed():
+    # static haze scores about the same every frame, even with an average above the midpoint
+    queue = recheck_queue.RecheckQueue(numRechecks=2, delaySeconds=20)
+    segments = getSegments({(1, 1): 0.7})
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    assert queue.addScores('cam1', 1025, getSegments({(1, 1): 0.7})) == None
+    assert queue.addScores('cam1', 1050, getSegments({(1, 1): 0.7})) == None
+    assert queue.getStats()['rejected'] == 1
+    # barely rising scores are noise too
+    queue = recheck_queue.RecheckQueue(numRechecks=2, delaySeconds=20, cooldownSeconds=0)
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    queue.addScores('cam1', 1025, getSegments({(1, 1): 0.71}))
+    assert queue.addScores('cam1', 1050, getSegments({(1, 1): 0.72})) == None
+    assert queue.getStats()['rejected'] == 1
+
+
+def testReject():
+    queue = recheck_queue.RecheckQueue(numRechecks=2, delaySeconds=20)
+    segments = getSegments({(1, 1): 0.7})
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    assert queue.popDueCamera(1020) == 'cam1'
+    # score dropped below .5, so no need for further re-checks
+    assert queue.addScores('cam1', 1025, getSegments({(1, 1): 0.3})) == None
+    assert queue.getStats()['rejected'] == 1
+    assert queue.popDueCamera(2000) == None
+    # low average is also rejected
+    queue = recheck_queue.RecheckQueue(numRechecks=1, delaySeconds=20)
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    assert queue.addScores('cam1', 1025, getSegments({(1, 1): 0.55})) == None
+    assert queue.getStats()['rejected'] == 1
+
+
+def testCooldownAndRetry():
+    queue = recheck_queue.RecheckQueue(numRechecks=1, delaySeconds=20, cooldownSeconds=600)
+    segments = getSegments({(1, 1): 0.7})
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    assert queue.popDueCamera(1020) == 'cam1'
+    queue.retry('cam1', 1030) # camera image wasn't updated yet
+    assert queue.popDueCamera(1040) == None
+    assert queue.popDueCamera(1050) == 'cam1'
+    queue.addScores('cam1', 1055, getSegments({}))
+    queue.addNearMisses('cam1', 1100, [segments[5]], segments)
+    assert queue.getStats()['active'] == 0
+    queue.addNearMisses('cam1', 1700, [segments[5]], segments)
+    assert queue.getStats()['active'] == 1
+
+
+def testExpire():
+    queue = recheck_queue.RecheckQueue(expireSeconds=100)
+    segments = getSegments({(1, 1): 0.7})
+    queue.addNearMisses('cam1', 1000, [segments[5]], segments)
+    assert queue.popDueCamera(1200) == None
+    assert queue.getStats()['expired'] == 1
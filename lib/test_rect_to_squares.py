@@ -0,0 +1,61 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test rect_to_squares
+
+"""
+
+import rect_to_squares
+import pytest
+import tempfile
+import numpy as np
+from PIL import Image
+
+
+def testCutBoxesArrayMatchesFixed():
+    imgArray = np.random.randint(0, 256, (700, 1000, 3), dtype=np.uint8)
+    img = Image.fromarray(imgArray)
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        fixedSegments = rect_to_squares.cutBoxesFixed(img, tmpDirName, 'cam__2019-01-01T00;00;00.jpg')
+    arraySegments = rect_to_squares.cutBoxesArray(imgArray)
+    assert len(arraySegments) == len(fixedSegments)
+    for (fixedSeg, arraySeg) in zip(fixedSegments, arraySegments):
+        for key in ['MinX', 'MinY', 'MaxX', 'MaxY']:
+            assert fixedSeg[key] == arraySeg[key]
+        assert arraySeg['imgArray'].shape == (299, 299, 3)
+        assert np.shares_memory(arraySeg['imgArray'], imgArray)
+
+
+def testCutBoxesArrayCallback():
+    imgArray = np.zeros((600, 600, 3), dtype=np.uint8)
+    allSegments = rect_to_squares.cutBoxesArray(imgArray)
+    segments = rect_to_squares.cutBoxesArray(imgArray, lambda coords: coords[0] == 0)
+    assert len(segments) > 0
+    assert len(segments) < len(allSegments)
+    assert all(segmentInfo['MinX'] != 0 for segmentInfo in segments)
+
+
+def testCutBoxesCallback():
+    img = Image.fromarray(np.zeros((600, 600, 3), dtype=np.uint8))
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        segments = rect_to_squares.cutBoxes(img, tmpDirName, 'cam.jpg', lambda coords: coords[0] == 0)
+    assert len(segments) > 0
+    assert all(segmentInfo['MinX'] != 0 for segmentInfo in segments)
+
+
+def testGetCropImgPath():
+    cropPath = rect_to_squares.getCropImgPath('out', 'dir/cam__2019-01-01T00;00;00.jpg', (1, 2, 300, 301))
+    assert cropPath.endswith('cam__2019-01-01T00;00;00_Crop_1x2x300x301.jpg')
@@ -0,0 +1,83 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test scan_priority
+
+"""
+
+import scan_priority
+import score_history
+import datetime
+import pytest
+
+
+def getTimestamp(hour):
+    return int(datetime.datetime(2019, 7, 1, hour, 5).timestamp())
+
+
+def addScores(dbManager, camera, timestamp, scores):
+    for (i, score) in enumerate(scores):
+        segments = [{'MinX': 0, 'MinY': 0, 'MaxX': 10, 'MaxY': 10, 'score': score}]
+        bucketTime = timestamp - i * score_history.BUCKET_SECONDS
+        dbManager.upsertScoreRollups(score_history.getRollupRows(camera, bucketTime, segments))
+
+
+def testNightAndFireWeather(dbManager):
+    priority = scan_priority.ScanPriority(dbManager, ['cam0'], fireWeatherMonths=[7])
+    priority.refresh(getTimestamp(12))
+    assert priority.getWeight('cam0', getTimestamp(12)) == pytest.approx(2)
+    assert priority.getWeight('cam0', getTimestamp(2)) == pytest.approx(0.5)
+
+
+def testScoreStats(dbManager):
+    timestamp = getTimestamp(12)
+    addScores(dbManager, 'high', timestamp, [0.8, 0.1, 0.3, 0.2])
+    addScores(dbManager, 'quiet', timestamp, [0.05, 0.05, 0.06, 0.05])
+    priority = scan_priority.ScanPriority(dbManager, ['high', 'quiet', 'unknown'])
+    priority.refresh(timestamp)
+    assert priority.getWeight('high', timestamp) == pytest.approx(1 + 3 * 0.5 / 0.7)
+    assert priority.getWeight('quiet', timestamp) == pytest.approx(0.5)
+    assert priority.getWeight('unknown', timestamp) == pytest.approx(1)
+
+
+def testFrozen(dbManager):
+    priority = scan_priority.ScanPriority(dbManager, ['cam0'])
+    timestamp = getTimestamp(12)
+    for i in range(6):
+        priority.recordFetch('cam0', False)
+    assert priority.getWeight('cam0', timestamp) == pytest.approx(1 / 16)
+    priority.recordFetch('cam0', True)
+    assert priority.getWeight('cam0', timestamp) == pytest.approx(1)
+
+
+def testIntervals(dbManager):
+    cameraNames = ['cam%d' % i for i in range(100)]
+    priority = scan_priority.ScanPriority(dbManager, cameraNames, cpuBudget=1.0, numProcesses=2,
+                                          minIntervalSeconds=10, maxIntervalSeconds=2000)
+    timestamp = getTimestamp(12)
+    priority.setTimePerImage(2)
+    # 100 equal cameras, 1 image per second capacity
+    assert priority.getInterval('cam0', timestamp) == pytest.approx(100)
+    for i in range(4):
+        priority.recordFetch('cam1', False)
+    assert priority.getInterval('cam1', timestamp) == pytest.approx(16 * (99 + 1 / 16))
+    # at night the demand is 4x lower
+    assert priority.getInterval('cam0', getTimestamp(2)) == pytest.approx(0.25 * (99 + 1 / 16) * 4)
+    # enough capacity for all cameras at their weights
+    priority.setTimePerImage(0.01)
+    assert priority.getInterval('cam0', timestamp) == 10
+    assert priority.getInterval('cam1', timestamp) == 160
+    assert priority.getInterval('cam0', getTimestamp(2)) == 40
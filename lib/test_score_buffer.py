@@ -0,0 +1,117 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test score_buffer
+
+"""
+
+import score_buffer
+import score_history
+import pytest
+import threading
+
+NOW = 1560000000 - (1560000000 % 900) + 450 # middle of a bucket
+SEGMENTS = [{'MinX': 0, 'MinY': 0, 'MaxX': 299, 'MaxY': 299}, {'MinX': 299, 'MinY': 0, 'MaxX': 598, 'MaxY': 299}]
+
+
+def addFrame(buffer, timestamp, scores, timeNow):
+    segments = [dict(segment, score=score) for (segment, score) in zip(SEGMENTS, scores)]
+    scoreRows = [dict(SEGMENTS[i], CameraName='cam1', Timestamp=timestamp, Score=scores[i],
+                      MinusMinutes=0, SecondsInDay=0) for i in range(len(scores))]
+    buffer.add(scoreRows, score_history.getRollupRows('cam1', timestamp, segments), timeNow=timeNow)
+
+
+def getNumScores(dbManager):
+    return dbManager.query('SELECT count(*) as cnt FROM scores')[0]['cnt']
+
+
+def testAddRows(dbManager):
+    rows = [dict(SEGMENTS[0], CameraName="cam'1", Timestamp=NOW + i, Score=0.1 * i, MinusMinutes=0, SecondsInDay=0)
+            for i in range(5)]
+    dbManager.add_rows('scores', rows)
+    result = dbManager.query('SELECT * FROM scores ORDER BY Timestamp')
+    assert [row['score'] for row in result] == pytest.approx([0.0, 0.1, 0.2, 0.3, 0.4])
+    assert result[0]['cameraname'] == "cam'1"
+
+
+def testFlushOnSize(dbManager):
+    buffer = score_buffer.ScoreWriteBuffer(dbManager, maxRows=5, maxSeconds=1000)
+    addFrame(buffer, NOW, [0.1, 0.2], 0)
+    addFrame(buffer, NOW + 60, [0.3, 0.4], 1)
+    assert getNumScores(dbManager) == 0
+    addFrame(buffer, NOW + 120, [0.5, 0.6], 2)
+    assert getNumScores(dbManager) == 6
+    rollups = dbManager.query('SELECT * FROM score_rollups ORDER BY MinX')
+    assert [(row['numsamples'], row['maxscore']) for row in rollups] == [(3, pytest.approx(0.5)),
+                                                                         (3, pytest.approx(0.6))]
+    assert rollups[0]['sumscore'] == pytest.approx(0.9)
+    stats = buffer.getStats()
+    assert (stats['rows'], stats['flushes'], stats['buffered']) == (6, 1, 0)
+
+
+def testFlushOnTime(dbManager):
+    buffer = score_buffer.ScoreWriteBuffer(dbManager, maxRows=1000, maxSeconds=30)
+    addFrame(buffer, NOW, [0.1, 0.2], 100)
+    addFrame(buffer, NOW + 60, [0.3, 0.4], 120)
+    assert getNumScores(dbManager) == 0
+    addFrame(buffer, NOW + 120, [0.5, 0.6], 130)
+    assert getNumScores(dbManager) == 6
+    addFrame(buffer, NOW + 180, [0.5, 0.6], 150)
+    buffer.flush() # shutdown
+    assert getNumScores(dbManager) == 8
+    rollups = dbManager.query('SELECT * FROM score_rollups WHERE MinX=0')
+    assert rollups[0]['numsamples'] == 4
+
+
+def testRetainOnFailure(dbManager, monkeypatch):
+    buffer = score_buffer.ScoreWriteBuffer(dbManager, maxRows=1000, maxSeconds=30, maxRetainedRows=3)
+    addFrame(buffer, NOW, [0.1, 0.2], 0)
+    def failAddRows(tableName, rows, commit=True):
+        raise Exception('DB down')
+    monkeypatch.setattr(dbManager, 'add_rows', failAddRows)
+    buffer.flush()
+    addFrame(buffer, NOW + 60, [0.3, 0.4], 1)
+    stats = buffer.getStats()
+    assert (stats['failures'], stats['dropped'], stats['buffered']) == (1, 0, 4)
+    buffer.flush()
+    assert buffer.getStats()['dropped'] == 1
+    monkeypatch.undo()
+    buffer.flush()
+    assert [row['score'] for row in dbManager.query('SELECT * FROM scores ORDER BY Timestamp, MinX')] == \
+        pytest.approx([0.2, 0.3, 0.4])
+    rollups = dbManager.query('SELECT * FROM score_rollups WHERE MinX=0')
+    assert rollups[0]['numsamples'] == 2
+
+
+def testFlushHoldsDbLock(dbManager, monkeypatch):
+    buffer = score_buffer.ScoreWriteBuffer(dbManager, maxRows=1000, maxSeconds=30)
+    addFrame(buffer, NOW, [0.1, 0.2], 0)
+    lockResults = []
+    def tryLock():
+        acquired = dbManager.lock.acquire(timeout=0.1)
+        if acquired:
+            dbManager.lock.release()
+        lockResults.append(acquired)
+    upsertScoreRollups = dbManager.upsertScoreRollups
+    def checkedUpsert(rollupRows, commit=True):
+        thread = threading.Thread(target=tryLock) # e.g., fetch thread claiming leases between the writes
+        thread.start()
+        thread.join()
+        upsertScoreRollups(rollupRows, commit)
+    monkeypatch.setattr(dbManager, 'upsertScoreRollups', checkedUpsert)
+    buffer.flush()
+    assert lockResults == [False]
+    assert getNumScores(dbManager) == 2
@@ -0,0 +1,108 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test score_history
+
+"""
+
+import score_history
+import pytest
+
+DAY = 24*60*60
+NOW = 1560000000 - (1560000000 % 900) + 450 # middle of a bucket
+SEGMENT = {'MinX': 0, 'MinY': 0, 'MaxX': 299, 'MaxY': 299}
+SEGMENT_KEY = (0, 0, 299, 299)
+
+
+def addScore(dbManager, timestamp, score, camera='cam1', rollup=True):
+    dbRow = dict(SEGMENT, CameraName=camera, Timestamp=timestamp, Score=score, SecondsInDay=0, MinusMinutes=0)
+    dbManager.add_data('scores', dbRow)
+    if rollup:
+        segment = dict(SEGMENT, score=score)
+        dbManager.upsertScoreRollups(score_history.getRollupRows(camera, timestamp, [segment]))
+
+
+def testHistoryFromDb(dbManager):
+    addScore(dbManager, NOW - 1*DAY, 0.2)
+    addScore(dbManager, NOW - 2*DAY + 20*60, 0.4)
+    addScore(dbManager, NOW - 3*DAY - 20*60, 0.3)
+    addScore(dbManager, NOW - 2*DAY + 3*60*60, 0.9) # different time of day
+    addScore(dbManager, NOW - 4*DAY, 0.9) # too old
+    addScore(dbManager, NOW - 60*60, 0.9) # too recent
+    addScore(dbManager, NOW - 1*DAY, 0.9, camera='cam2') # different camera
+    cache = score_history.ScoreHistoryCache()
+    cache.refresh(dbManager, NOW)
+    history = cache.getHistory('cam1', NOW, SEGMENT_KEY)
+    assert history['cnt'] == 3
+    assert history['maxs'] == pytest.approx(0.4)
+    assert history['avgs'] == pytest.approx(0.3)
+    assert cache.getHistory('cam1', NOW, (1, 1, 300, 300)) == None
+    assert cache.getHistory('cam3', NOW, SEGMENT_KEY) == None
+
+
+def testAddScoresAndRefresh(dbManager):
+    cache = score_history.ScoreHistoryCache()
+    cache.refresh(dbManager, NOW - 1*DAY)
+    segment = dict(SEGMENT, score=0.6)
+    addScore(dbManager, NOW - 1*DAY, 0.6)
+    cache.addScores('cam1', NOW - 1*DAY, [segment])
+    addScore(dbManager, NOW - 1*DAY, 0.1, camera='cam1') # from another process
+    # recorded score is visible right away
+    history = cache.getHistory('cam1', NOW, SEGMENT_KEY)
+    assert history['cnt'] == 1
+    # refresh replaces the bucket with DB values without double counting
+    cache.refresh(dbManager, NOW)
+    history = cache.getHistory('cam1', NOW, SEGMENT_KEY)
+    assert history['cnt'] == 2
+    assert history['maxs'] == pytest.approx(0.6)
+
+
+def testOldBucketsExpire():
+    cache = score_history.ScoreHistoryCache()
+    cache.addScores('cam1', NOW - 1*DAY, [dict(SEGMENT, score=0.7)])
+    assert cache.getHistory('cam1', NOW, SEGMENT_KEY)['cnt'] == 1
+    # same ring buffer slot reused 4 days later
+    cache.addScores('cam1', NOW - 1*DAY + cache.numSlots * cache.bucketSeconds, [dict(SEGMENT, score=0.1)])
+    assert cache.getHistory('cam1', NOW, SEGMENT_KEY) == None
+
+
+def testUpsertRollups(dbManager):
+    addScore(dbManager, NOW, 0.2)
+    addScore(dbManager, NOW + 10, 0.5)
+    addScore(dbManager, NOW + 20, 0.3)
+    addScore(dbManager, NOW + 900, 0.1) # next bucket
+    rows = dbManager.query('SELECT * FROM score_rollups ORDER BY BucketStart')
+    assert len(rows) == 2
+    assert rows[0]['bucketstart'] == score_history.getBucketStart(NOW)
+    assert rows[0]['numsamples'] == 3
+    assert rows[0]['maxscore'] == pytest.approx(0.5)
+    assert rows[0]['sumscore'] == pytest.approx(1.0)
+    assert rows[1]['numsamples'] == 1
+
+
+def testRebuildRollups(dbManager):
+    addScore(dbManager, NOW - 1*DAY, 0.2, rollup=False)
+    addScore(dbManager, NOW - 1*DAY + 60, 0.6, rollup=False)
+    addScore(dbManager, NOW - 1*DAY, 0.5) # already rolled up
+    startTime = score_history.getBucketStart(NOW - 2*DAY)
+    dbManager.rebuildScoreRollups(startTime, score_history.getBucketStart(NOW), score_history.BUCKET_SECONDS)
+    # rebuilding again replaces the range instead of double counting
+    dbManager.rebuildScoreRollups(startTime, score_history.getBucketStart(NOW), score_history.BUCKET_SECONDS)
+    cache = score_history.ScoreHistoryCache()
+    cache.refresh(dbManager, NOW)
+    history = cache.getHistory('cam1', NOW, SEGMENT_KEY)
+    assert history['cnt'] == 3
+    assert history['maxs'] == pytest.approx(0.6)
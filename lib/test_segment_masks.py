@@ -0,0 +1,65 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test segment_masks
+
+"""
+
+import segment_masks
+import rect_to_squares
+import numpy as np
+
+NOW = 1560000000
+
+
+def addScores(dbManager, coords, scores, camera='cam1'):
+    dbRows = [{
+        'CameraName': camera,
+        'Timestamp': NOW - i * 60,
+        'MinX': coords[0],
+        'MinY': coords[1],
+        'MaxX': coords[2],
+        'MaxY': coords[3],
+        'Score': score,
+        'SecondsInDay': 0,
+        'MinusMinutes': 0,
+    } for (i, score) in enumerate(scores)]
+    dbManager.add_data('scores', dbRows)
+
+
+def testFindMaskCandidates(dbManager):
+    addScores(dbManager, (0, 0, 299, 299), [0.01, 0.02] * 10) # sky
+    addScores(dbManager, (299, 0, 598, 299), [0.9, 0.7] * 10) # overlay
+    addScores(dbManager, (0, 299, 299, 598), [0.01, 0.6] * 10) # normal
+    addScores(dbManager, (299, 299, 598, 598), [0.01] * 5) # not enough samples
+    addScores(dbManager, (0, 0, 299, 299), [0.9] * 20, camera='cam2')
+    candidates = segment_masks.findMaskCandidates(dbManager, 'cam1', NOW - 24*60*60, NOW + 1, minSamples=10)
+    reasons = {(c['MinX'], c['MinY'], c['MaxX'], c['MaxY']): c['Reason'] for c in candidates}
+    assert reasons == {(0, 0, 299, 299): 'static', (299, 0, 598, 299): 'noisy'}
+
+
+def testMasksSkipSegments(dbManager):
+    masks = segment_masks.SegmentMasks(dbManager)
+    assert masks.getSkipFn('cam1') == None
+    segment_masks.saveMasks(dbManager, 'cam1', [{'MinX': 0, 'MinY': 0, 'MaxX': 299, 'MaxY': 299, 'Reason': 'static'}])
+    masks = segment_masks.SegmentMasks(dbManager)
+    assert masks.getSkipFn('cam2') == None
+    imgArray = np.zeros((598, 598, 3), dtype=np.uint8)
+    segments = rect_to_squares.cutBoxesArray(imgArray, callBackFn=masks.getSkipFn('cam1'))
+    assert len(segments) == len(rect_to_squares.cutBoxesArray(imgArray)) - 1
+    assert all((s['MinX'], s['MinY']) != (0, 0) for s in segments)
+    segment_masks.saveMasks(dbManager, 'cam1', [])
+    assert dbManager.query('SELECT * FROM segment_masks') == []
@@ -0,0 +1,70 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Test the parts of tf_helper that don't need tensorflow
+
+"""
+
+import tf_helper
+import numpy as np
+
+
+class FakeClassifier(object):
+    def __init__(self, scale):
+        self.scale = scale
+        self.numClassified = 0
+
+    def classifySegmentArrays(self, segments):
+        self.numClassified += len(segments)
+        for segmentInfo in segments:
+            segmentInfo['score'] = float(segmentInfo['imgArray'].mean()) / 255 * self.scale
+
+    def close(self):
+        pass
+
+
+def getSegments(values):
+    return [{'imgArray': np.full((10, 10, 3), value, dtype=np.uint8)} for value in values]
+
+
+def testCascade():
+    prefilter = FakeClassifier(0.5)
+    classifier = FakeClassifier(1.0)
+    cascade = tf_helper.CascadeClassifier(prefilter, classifier, 0.1)
+    segments = getSegments([0, 51, 255])
+    cascade.classifySegmentArrays(segments)
+    assert prefilter.numClassified == 3
+    assert classifier.numClassified == 2
+    # rejected segment keeps prefilter score, but is marked so it isn't recorded into the history
+    assert segments[0]['prefiltered']
+    assert segments[0]['score'] == 0
+    assert [s['prefilterScore'] for s in segments] == [0, 0.1, 0.5]
+    assert [s['score'] for s in segments[1:]] == [0.2, 1.0]
+    assert not any(s.get('prefiltered') for s in segments[1:])
+    assert cascade.getPassRate() == 2 / 3
+
+
+def testDenseCellRange():
+    assert tf_helper.getDenseCellRange(0, 299, 10) == (0, 1)
+    # windows starting at 0, 64, ..., 320 overlap a 598 pixel segment by more than 299 - 64
+    assert tf_helper.getDenseCellRange(0, 598, 10) == (0, 6)
+    assert tf_helper.getDenseCellRange(270, 569, 10) == (4, 6)
+    assert tf_helper.getDenseCellRange(1196, 1495, 20) == (18, 20)
+    # clipped to the dense map
+    assert tf_helper.getDenseCellRange(0, 598, 3) == (0, 3)
+    # segment smaller than a window gets the nearest window
+    assert tf_helper.getDenseCellRange(0, 100, 10) == (0, 1)
+    assert tf_helper.getDenseCellRange(150, 250, 10) == (2, 3)
@@ -16,6 +16,10 @@
 
 Helper functions for tensorflow
 
+Tensorflow is only imported when a tensorflow backed function or classifier
+is used, so processes using other inference backends (or the shared
+inference server) don't need it.
+
 """
 
 from __future__ import absolute_import
@@ -23,14 +27,20 @@ from __future__ import division
 from __future__ import print_function
 
 import numpy as np
-import tensorflow as tf
+import inference_backends
 
-def load_graph(model_file):
-    graph = tf.Graph()
+def load_graph_def(model_file):
+    import tensorflow as tf
     graph_def = tf.GraphDef()
-
     with open(model_file, "rb") as f:
         graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+def load_graph(model_file):
+    import tensorflow as tf
+    graph = tf.Graph()
+    graph_def = load_graph_def(model_file)
     with graph.as_default():
         tf.import_graph_def(graph_def)
 
@@ -38,32 +48,49 @@ def load_graph(model_file):
 
 
 def load_labels(label_file):
+    import tensorflow as tf
     label = []
     proto_as_ascii_lines = tf.gfile.GFile(label_file).readlines()
     for l in proto_as_ascii_lines:
         label.append(l.rstrip())
     return label
 
+# These commented out values are appropriate for tf_retrain
+# https://github.com/tensorflow/hub/raw/master/examples/image_retraining/retrain.py
+
+# INPUT_MEAN = 0
+# INPUT_STD = 255
+# INPUT_LAYER = "Placeholder"
+# OUTPUT_LAYER = "final_result"
+
+# These values we're using now are appropriate for the fine-tuning and full training models
+# https://github.com/tensorflow/models/tree/master/research/slim
+INPUT_HEIGHT = 299
+INPUT_WIDTH = 299
+INPUT_MEAN = 128
+INPUT_STD = 128
+INPUT_LAYER = "input"
+OUTPUT_LAYER = "InceptionV3/Predictions/Reshape_1"
+
+
+def getDefaultConfig():
+    """Get the session config used by the classifiers when none is given
+    """
+    import tensorflow as tf
+    tfConfig = tf.ConfigProto()
+    tfConfig.gpu_options.per_process_gpu_memory_fraction = 0.1 #hopefully reduces segfaults
+    return tfConfig
+
+
 def classifySegments(tfSession, graph, labels, segments):
-    input_height = 299
-    input_width = 299
-    # These commented out values are appropriate for tf_retrain
-    # https://github.com/tensorflow/hub/raw/master/examples/image_retraining/retrain.py
-
-    # input_mean = 0
-    # input_std = 255
-    # input_layer = "Placeholder"
-    # output_layer = "final_result"
-
-    # These values we're using now are appropriate for the fine-tuning and full training models
-    # https://github.com/tensorflow/models/tree/master/research/slim
-    input_mean = 128
-    input_std = 128
-    input_layer = "input"
-    output_layer = "InceptionV3/Predictions/Reshape_1"
-
-    input_name = "import/" + input_layer
-    output_name = "import/" + output_layer
+    import tensorflow as tf
+    input_height = INPUT_HEIGHT
+    input_width = INPUT_WIDTH
+    input_mean = INPUT_MEAN
+    input_std = INPUT_STD
+
+    input_name = "import/" + INPUT_LAYER
+    output_name = "import/" + OUTPUT_LAYER
     input_operation = graph.get_operation_by_name(input_name)
     output_operation = graph.get_operation_by_name(output_name)
 
@@ -95,3 +122,255 @@ def classifySegments(tfSession, graph, labels, segments):
                 smokeIndex = labels.index('smoke')
                 # print(imgPath, results[smokeIndex])
                 segmentInfo['score'] = results[smokeIndex]
+
+
+class SegmentClassifier(object):
+    def __init__(self, modelFile, labelsFile, tfConfig=None, inputSize=INPUT_HEIGHT, outputLayer=OUTPUT_LAYER):
+        """Smoke classifier that is built once and reused for all images
+
+        The JPEG decode, resize and normalize preprocessing ops are merged into the
+        same graph as the model (via input_map), and a single session is kept open
+        for the life of the object, so no graph or session is created per image.
+        Segments can be fed either as file paths (one per run) or as a batch of
+        in memory uint8 arrays (one run per batch).
+
+        Args:
+            modelFile (str): path to frozen model graph
+            labelsFile (str): path to model labels file
+            tfConfig: optional tensorflow session config (default getDefaultConfig())
+            inputSize (int): height and width of model input (e.g., smaller for prefilter models)
+            outputLayer (str): name of model output layer with the class probabilities
+        """
+        import tensorflow as tf
+        self.labels = load_labels(labelsFile)
+        self.smokeIndex = self.labels.index('smoke')
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.fileNamePlaceholder = tf.placeholder(tf.string, shape=[], name='file_name')
+            fileReader = tf.read_file(self.fileNamePlaceholder, 'file_reader')
+            imageReader = tf.image.decode_jpeg(fileReader, channels=3, name='jpeg_reader', dct_method='INTEGER_ACCURATE')
+            # decoded file is the default input, but batches of tiles can be fed directly
+            self.tilesPlaceholder = tf.placeholder_with_default(tf.expand_dims(imageReader, 0),
+                                                                shape=[None, None, None, 3], name='tiles')
+            floatCaster = tf.cast(self.tilesPlaceholder, tf.float32)
+            resized = tf.image.resize_bilinear(floatCaster, [inputSize, inputSize])
+            normalized = tf.divide(tf.subtract(resized, [INPUT_MEAN]), [INPUT_STD], name='normalized')
+            tf.import_graph_def(load_graph_def(modelFile), input_map={INPUT_LAYER + ':0': normalized})
+        self.outputTensor = self.graph.get_operation_by_name('import/' + outputLayer).outputs[0]
+        self.tfSession = tf.Session(graph=self.graph, config=tfConfig or getDefaultConfig())
+
+
+    def classifySegments(self, segments):
+        """Classify the given segments stored as image files
+
+        Persistent graph variant of module function classifySegments().
+        Scores are stored in 'score' of each segment.
+
+        Args:
+            segments (list): List of dictionary containing 'imgPath' for each segment
+        """
+        for segmentInfo in segments:
+            results = self.tfSession.run(self.outputTensor, {self.fileNamePlaceholder: segmentInfo['imgPath']})
+            segmentInfo['score'] = np.squeeze(results)[self.smokeIndex]
+
+
+    def classifySegmentArrays(self, segments):
+        """Classify the given in memory segments with batched inference calls
+
+        For segments generated by rect_to_squares.cutBoxesArray().  All segments
+        with the same dimensions (normally all of them) are scored in one run.
+        Scores are stored in 'score' of each segment.
+
+        Args:
+            segments (list): List of dictionary containing 'imgArray' for each segment
+        """
+        segmentsByShape = {}
+        for segmentInfo in segments:
+            shape = segmentInfo['imgArray'].shape
+            segmentsByShape.setdefault(shape, []).append(segmentInfo)
+        for shapeSegments in segmentsByShape.values():
+            tiles = np.stack([segmentInfo['imgArray'] for segmentInfo in shapeSegments])
+            results = self.tfSession.run(self.outputTensor, {self.tilesPlaceholder: tiles})
+            for segmentInfo, result in zip(shapeSegments, results):
+                segmentInfo['score'] = result[self.smokeIndex]
+
+
+    def close(self):
+        self.tfSession.close()
+
+
+# InceptionV3 logits layer before the spatial squeeze, which is a 1x1 map for 299x299 inputs
+DENSE_OUTPUT_LAYER = "InceptionV3/Logits/Conv2d_1c_1x1/BiasAdd"
+# Each step in the dense map moves the 299x299 input window by this many pixels
+# (32 pixel stride of the last InceptionV3 block and stride 2 of the final average pool)
+DENSE_CELL_STRIDE = 64
+
+
+def getDenseCellRange(start, end, numCells):
+    """Get the range of dense map cells whose input windows best match the given segment range
+
+    Cells whose 299 pixel window overlaps the segment by more than (299 - stride)
+    pixels are selected.  If there are none (e.g., segments smaller than 299), the
+    cell whose window starts closest to the segment start is selected.
+
+    Args:
+        start (int): segment start coordinate
+        end (int): segment end coordinate
+        numCells (int): number of cells in this dimension of the dense map
+
+    Returns:
+        tuple (first, last+1) of cell indexes
+    """
+    first = max(-((DENSE_CELL_STRIDE - 1 - start) // DENSE_CELL_STRIDE), 0)
+    last = min((end - INPUT_HEIGHT + DENSE_CELL_STRIDE - 1) // DENSE_CELL_STRIDE, numCells - 1)
+    if last < first:
+        nearest = min(max(int(round(start / DENSE_CELL_STRIDE)), 0), numCells - 1)
+        return (nearest, nearest + 1)
+    return (first, last + 1)
+
+
+class DenseSegmentClassifier(object):
+    def __init__(self, modelFile, labelsFile, tfConfig=None, stripCells=None):
+        """Fully convolutional smoke classifier that scores whole frames at once
+
+        The InceptionV3 graph is cut at the logits layer (before the spatial
+        squeeze), so feeding a frame larger than 299x299 without resizing
+        produces a dense map of smoke probabilities for 299x299 windows spaced
+        DENSE_CELL_STRIDE pixels apart.  Overlapping windows share all their
+        convolutions.  The map is then max pooled into the existing segment boxes.
+
+        Args:
+            modelFile (str): path to frozen model graph
+            labelsFile (str): path to model labels file
+            tfConfig: optional tensorflow session config (default getDefaultConfig())
+            stripCells (int): if set, frames are processed in horizontal strips of this many
+                              rows of the dense map to limit memory usage
+        """
+        import tensorflow as tf
+        self.labels = load_labels(labelsFile)
+        self.smokeIndex = self.labels.index('smoke')
+        self.stripCells = stripCells
+        graphDef = tf.graph_util.extract_sub_graph(load_graph_def(modelFile), [DENSE_OUTPUT_LAYER])
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.framePlaceholder = tf.placeholder(tf.uint8, shape=[None, None, 3], name='frame')
+            floatCaster = tf.cast(tf.expand_dims(self.framePlaceholder, 0), tf.float32)
+            normalized = tf.divide(tf.subtract(floatCaster, [INPUT_MEAN]), [INPUT_STD], name='normalized')
+            (logits,) = tf.import_graph_def(graphDef, input_map={INPUT_LAYER + ':0': normalized},
+                                            return_elements=[DENSE_OUTPUT_LAYER + ':0'])
+            self.smokeMap = tf.nn.softmax(logits)[0, :, :, self.smokeIndex]
+        self.tfSession = tf.Session(graph=self.graph, config=tfConfig or getDefaultConfig())
+
+
+    def getSmokeMap(self, imgArray):
+        """Get the dense map of smoke probabilities for the given frame
+
+        Args:
+            imgArray (numpy array): HxWx3 uint8 array of the frame
+
+        Returns:
+            numpy array with smoke probability of window starting at (row, col) * DENSE_CELL_STRIDE
+        """
+        if not self.stripCells:
+            return self.tfSession.run(self.smokeMap, {self.framePlaceholder: imgArray})
+        # strips start at multiples of the cell stride, so their cells line up with the full frame cells
+        stripStride = self.stripCells * DENSE_CELL_STRIDE
+        stripHeight = stripStride - DENSE_CELL_STRIDE + INPUT_HEIGHT
+        stripMaps = []
+        for stripStart in range(0, max(imgArray.shape[0] - INPUT_HEIGHT, 0) + 1, stripStride):
+            strip = imgArray[stripStart:stripStart + stripHeight]
+            stripMaps.append(self.tfSession.run(self.smokeMap, {self.framePlaceholder: strip}))
+        return np.concatenate(stripMaps)
+
+
+    def classifyFrameSegments(self, imgArray, segments):
+        """Classify the given segments of the given frame using the dense smoke map
+
+        Args:
+            imgArray (numpy array): HxWx3 uint8 array of the frame
+            segments (list): List of dictionary containing coordinates of each segment
+        """
+        if not segments:
+            return
+        smokeMap = self.getSmokeMap(imgArray)
+        for segmentInfo in segments:
+            rows = getDenseCellRange(segmentInfo['MinY'], segmentInfo['MaxY'], smokeMap.shape[0])
+            cols = getDenseCellRange(segmentInfo['MinX'], segmentInfo['MaxX'], smokeMap.shape[1])
+            segmentInfo['score'] = smokeMap[rows[0]:rows[1], cols[0]:cols[1]].max()
+
+
+    def close(self):
+        self.tfSession.close()
+
+
+class CascadeClassifier(object):
+    def __init__(self, prefilter, classifier, threshold):
+        """Two stage classifier that only runs the full classifier on segments passing a cheap prefilter
+
+        Segments scoring below threshold in the prefilter keep the prefilter
+        score and are marked 'prefiltered'.  Prefilter scores aren't comparable
+        with full model scores, so they must not be recorded into the historical
+        scores.  The prefilter score is kept in 'prefilterScore'.  The threshold
+        should be conservative (well below 0.5) so no smoke is missed (see
+        smoke-classifier/analyze_cascade.py).
+
+        Args:
+            prefilter: cheap classifier (e.g., SegmentClassifier with small model)
+            classifier: full classifier
+            threshold (float): minimum prefilter score for the full classifier
+        """
+        self.prefilter = prefilter
+        self.classifier = classifier
+        self.threshold = threshold
+        self.numSegments = 0
+        self.numPassed = 0
+
+
+    def classifySegmentArrays(self, segments):
+        """Classify the given in memory segments with the prefilter followed by the full classifier
+
+        Args:
+            segments (list): List of dictionary containing 'imgArray' for each segment
+        """
+        self.prefilter.classifySegmentArrays(segments)
+        passed = []
+        for segmentInfo in segments:
+            segmentInfo['prefilterScore'] = segmentInfo['score']
+            if segmentInfo['score'] >= self.threshold:
+                passed.append(segmentInfo)
+            else:
+                segmentInfo['prefiltered'] = True
+        self.classifier.classifySegmentArrays(passed)
+        self.numSegments += len(segments)
+        self.numPassed += len(passed)
+
+
+    def getPassRate(self):
+        return self.numPassed / self.numSegments if self.numSegments else 0
+
+
+    def close(self):
+        self.prefilter.close()
+        self.classifier.close()
+
+
+def createClassifier(settings, tfConfig=None):
+    """Create the smoke classifier configured in settings
+
+    Uses the inference backend in settings.inference_backend (default 'tf').
+    Returns a CascadeClassifier if settings include a prefilter model.
+
+    Args:
+        settings: settings module
+        tfConfig: optional tensorflow session config
+    """
+    backendName = getattr(settings, 'inference_backend', 'tf')
+    classifier = inference_backends.createBackend(backendName,
+                                                  inference_backends.getBackendModelFile(settings, backendName),
+                                                  settings.labels_file, tfConfig)
+    if hasattr(settings, 'prefilter_model_file'):
+        prefilter = SegmentClassifier(settings.prefilter_model_file, settings.prefilter_labels_file, tfConfig,
+                                      inputSize=settings.prefilter_input_size,
+                                      outputLayer=settings.prefilter_output_layer)
+        classifier = CascadeClassifier(prefilter, classifier, settings.prefilter_threshold)
+    return classifier
@@ -18,7 +18,26 @@ googleCredsFile = 'XXX/credentials.json'
 #localCropDir = 'XXX/cropped' #local system directory with cropped images
 model_file = 'XXX/output_graph.pb'
 labels_file = 'XXX/output_labels.txt'
+# inference runtime: 'tf' (model_file), 'tflite' (tflite_model_file), or 'onnx' (onnx_model_file)
+# see smoke-classifier/convert_model.py and benchmark_backends.py
+# inference_backend = 'tflite'
+# tflite_model_file = 'XXX/output_graph.tflite'
+# onnx_model_file = 'XXX/output_graph.onnx'
+# optional cheap prefilter model, only segments scoring >= prefilter_threshold are scored by model_file
+# prefilter_model_file = 'XXX/prefilter_graph.pb'
+# prefilter_labels_file = 'XXX/prefilter_labels.txt'
+# prefilter_input_size = 128
+# prefilter_output_layer = 'MobilenetV1/Predictions/Reshape_1'
+# prefilter_threshold = 0.05
+# score whole frames with fully convolutional model instead of individual segments
+# dense_scoring = True
+# dense_strip_cells = 8 # optional, process frames in strips to limit memory usage
+# adaptive camera scanning (detect_fire.py --adaptiveScan): local daytime hours and fire weather months
+# scan_day_hours = (6, 20)
+# fire_weather_months = [6, 7, 8, 9, 10, 11]
 db_file = 'XXX/local.db'
+# alert_spool_dir = 'XXX/alert_spool' # durable queue of alerts to send (default in system temp directory)
+# upload_spool_dir = 'XXX/upload_spool' # images waiting for google drive upload (default in system temp directory)
 tfSlimDir = 'XXX/tf_models/research/slim'
 downloadDir = 'XXX/orig'
 archive_storage_bucket = "fuego-firecam-a"
@@ -0,0 +1,87 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+suggest, save, list, or clear the segment masks of a camera.  Masked segments
+are skipped by detection.
+
+suggest and save find the segments whose historical scores are static
+(never vary and never look like smoke) or noisy (look like smoke most of
+the time).  Review the suggestions before saving them.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import db_manager
+import segment_masks
+
+import logging
+import time
+
+
+def main():
+    reqArgs = [
+        ["m", "mode", "suggest, save, list, or clear"],
+        ["c", "cameraID", "ID of the camera (e.g., mg-n-mobo-c)"],
+    ]
+    optArgs = [
+        ["d", "days", "(optional) number of days of history to analyze (default 7)", int],
+        ["n", "minSamples", "(optional) minimum number of scores per segment (default 100)", int],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    dbManager = db_manager.DbManager(sqliteFile=settings.db_file,
+                                     psqlHost=settings.psqlHost, psqlDb=settings.psqlDb,
+                                     psqlUser=settings.psqlUser, psqlPasswd=settings.psqlPasswd)
+
+    if args.mode == 'list':
+        sqlTemplate = """SELECT * FROM segment_masks WHERE CameraName = '%s' ORDER BY MinY, MinX"""
+        for row in dbManager.query(sqlTemplate % args.cameraID):
+            logging.warning('Masked %s: %s', (row['minx'], row['miny'], row['maxx'], row['maxy']), row['reason'])
+        return
+
+    if args.mode == 'clear':
+        segment_masks.saveMasks(dbManager, args.cameraID, [])
+        logging.warning('Cleared masks for camera %s', args.cameraID)
+        return
+
+    if args.mode in ['suggest', 'save']:
+        days = args.days if args.days else 7
+        minSamples = args.minSamples if args.minSamples else 100
+        endTime = int(time.time())
+        candidates = segment_masks.findMaskCandidates(dbManager, args.cameraID, endTime - days*24*60*60, endTime,
+                                                      minSamples)
+        for candidate in candidates:
+            logging.warning('%s %s: count %d, max %.3f, avg %.3f, stddev %.3f', candidate['Reason'],
+                            (candidate['MinX'], candidate['MinY'], candidate['MaxX'], candidate['MaxY']),
+                            candidate['cnt'], candidate['maxs'], candidate['avgs'], candidate['stddev'])
+        logging.warning('Found %d segments to mask', len(candidates))
+        if args.mode == 'save':
+            segment_masks.saveMasks(dbManager, args.cameraID, candidates)
+            logging.warning('Saved masks for camera %s', args.cameraID)
+        return
+
+    logging.error('Unexpected mode: %s', args.mode)
+    exit(1)
+
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,149 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Measure the recall loss and CPU savings of a cascade prefilter model
+
+Uses the same test set layout as analyze_test_set.py (test_set_smoke and
+test_set_other subdirectories).  Every segment of every image is scored by
+both the prefilter and the full model, and then for each candidate prefilter
+threshold the cascade results are compared with the full model results:
+images the full model detects as smoke (any segment > 0.5) that the cascade
+misses, the fraction of segments passed to the full model, and the
+estimated time per image.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import rect_to_squares
+import tf_helper
+import analyze_test_set
+
+import numpy as np
+import logging
+import time
+import tensorflow as tf
+from PIL import Image, ImageFile
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+
+def scoreImages(prefilter, classifier, imageList):
+    """Score all segments of the given images with both the prefilter and full classifier
+
+    Returns:
+        Tuple of list of (prefilterScores, fullScores) arrays per image, prefilter seconds, full seconds
+    """
+    results = []
+    prefilterTime = 0
+    fullTime = 0
+    for (count, imgPath) in enumerate(imageList):
+        img = Image.open(imgPath)
+        imgArray = np.asarray(img.convert('RGB'))
+        img.close()
+        segments = rect_to_squares.cutBoxesArray(imgArray)
+        timeStart = time.time()
+        prefilter.classifySegmentArrays(segments)
+        prefilterScores = np.array([segmentInfo['score'] for segmentInfo in segments])
+        timeMid = time.time()
+        classifier.classifySegmentArrays(segments)
+        fullScores = np.array([segmentInfo['score'] for segmentInfo in segments])
+        prefilterTime += timeMid - timeStart
+        fullTime += time.time() - timeMid
+        results.append((prefilterScores, fullScores))
+        sys.stdout.write('\r>> Scored %d/%d' % (count + 1, len(imageList)))
+        sys.stdout.flush()
+    sys.stdout.write('\n')
+    return (results, prefilterTime, fullTime)
+
+
+def evaluateThreshold(results, threshold):
+    """Count the images detected by full model and by the cascade with given prefilter threshold
+
+    Returns:
+        Tuple with number of images detected by full model, by cascade, segments passed, and total segments
+    """
+    fullPositives = 0
+    cascadePositives = 0
+    numPassed = 0
+    numSegments = 0
+    for (prefilterScores, fullScores) in results:
+        passed = prefilterScores >= threshold
+        numPassed += int(passed.sum())
+        numSegments += len(fullScores)
+        if (fullScores > .5).any():
+            fullPositives += 1
+        if (fullScores[passed] > .5).any():
+            cascadePositives += 1
+    return (fullPositives, cascadePositives, numPassed, numSegments)
+
+
+def main():
+    reqArgs = [
+        ["d", "directory", "directory containing the image sets"],
+    ]
+    optArgs = [
+        ["m", "model", "model file for full classifier (default settings.model_file)"],
+        ["l", "labels", "labels file for full classifier (default settings.labels_file)"],
+        ["p", "prefilterModel", "model file for prefilter (default settings.prefilter_model_file)"],
+        ["q", "prefilterLabels", "labels file for prefilter (default settings.prefilter_labels_file)"],
+        ["s", "prefilterSize", "input size of prefilter model (default settings.prefilter_input_size)", int],
+        ["o", "prefilterOutput", "output layer of prefilter (default settings.prefilter_output_layer)"],
+        ["t", "thresholds", "comma separated prefilter thresholds (default 0.01,0.02,0.05,0.1,0.2)"],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    thresholds = [float(x) for x in args.thresholds.split(',')] if args.thresholds else [0.01, 0.02, 0.05, 0.1, 0.2]
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' # quiet down tensorflow logging
+    config = tf.ConfigProto()
+    config.gpu_options.per_process_gpu_memory_fraction = 0.1
+    classifier = tf_helper.SegmentClassifier(args.model or settings.model_file,
+                                             args.labels or settings.labels_file, config)
+    prefilter = tf_helper.SegmentClassifier(args.prefilterModel or settings.prefilter_model_file,
+                                            args.prefilterLabels or settings.prefilter_labels_file, config,
+                                            inputSize=args.prefilterSize or settings.prefilter_input_size,
+                                            outputLayer=args.prefilterOutput or settings.prefilter_output_layer)
+
+    imageSets = [
+        ('smoke', analyze_test_set.listJpegs(os.path.join(args.directory, 'test_set_smoke'))),
+        ('other', analyze_test_set.listJpegs(os.path.join(args.directory, 'test_set_other'))),
+    ]
+    for (className, imageList) in imageSets:
+        logging.warning('Scoring %d images of class %s', len(imageList), className)
+        (results, prefilterTime, fullTime) = scoreImages(prefilter, classifier, imageList)
+        if not results:
+            continue
+        logging.warning('Class %s: prefilter %.3f sec/image, full %.3f sec/image',
+                        className, prefilterTime / len(results), fullTime / len(results))
+        for threshold in thresholds:
+            (fullPositives, cascadePositives, numPassed, numSegments) = evaluateThreshold(results, threshold)
+            passRate = numPassed / numSegments
+            cascadeTime = prefilterTime + passRate * fullTime
+            logging.warning('Class %s threshold %.3f: positives full %d, cascade %d (missed %d), ' +
+                            'segments passed %.3f, est. speedup %.2fx',
+                            className, threshold, fullPositives, cascadePositives, fullPositives - cascadePositives,
+                            passRate, fullTime / cascadeTime)
+    prefilter.close()
+    classifier.close()
+
+
+if __name__=="__main__":
+    main()
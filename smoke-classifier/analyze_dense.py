@@ -0,0 +1,116 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Compare the fidelity and throughput of dense (fully convolutional whole frame)
+scoring against the regular per segment scoring.
+
+Every image in the given directory is scored both ways.  Reports the
+differences between the segment scores, the agreement of detections
+(score > 0.5) per segment and per image, and the time per image.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import rect_to_squares
+import tf_helper
+
+import numpy as np
+import logging
+import time
+import tensorflow as tf
+from PIL import Image, ImageFile
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+
+def main():
+    reqArgs = [
+        ["d", "directory", "directory containing the images"],
+    ]
+    optArgs = [
+        ["m", "model", "model file (default settings.model_file)"],
+        ["l", "labels", "labels file (default settings.labels_file)"],
+        ["s", "stripCells", "(optional) process frames in strips of this many rows of dense map", int],
+        ["n", "numImages", "(optional) maximum number of images to process", int],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    modelFile = args.model or settings.model_file
+    labelsFile = args.labels or settings.labels_file
+
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' # quiet down tensorflow logging
+    config = tf.ConfigProto()
+    config.gpu_options.per_process_gpu_memory_fraction = 0.1
+    tileClassifier = tf_helper.SegmentClassifier(modelFile, labelsFile, config)
+    denseClassifier = tf_helper.DenseSegmentClassifier(modelFile, labelsFile, config, args.stripCells)
+
+    imageList = sorted(os.path.join(args.directory, x) for x in os.listdir(args.directory) if x[-4:] == '.jpg')
+    if args.numImages:
+        imageList = imageList[:args.numImages]
+    tileScores = []
+    denseScores = []
+    imageAgreements = 0
+    tileTime = 0
+    denseTime = 0
+    for (count, imgPath) in enumerate(imageList):
+        img = Image.open(imgPath)
+        imgArray = np.asarray(img.convert('RGB'))
+        img.close()
+        tileSegments = rect_to_squares.cutBoxesArray(imgArray)
+        denseSegments = [dict(segmentInfo) for segmentInfo in tileSegments]
+        timeStart = time.time()
+        tileClassifier.classifySegmentArrays(tileSegments)
+        timeMid = time.time()
+        denseClassifier.classifyFrameSegments(imgArray, denseSegments)
+        denseTime += time.time() - timeMid
+        tileTime += timeMid - timeStart
+        imageTileScores = [segmentInfo['score'] for segmentInfo in tileSegments]
+        imageDenseScores = [segmentInfo['score'] for segmentInfo in denseSegments]
+        if (max(imageTileScores) > .5) == (max(imageDenseScores) > .5):
+            imageAgreements += 1
+        tileScores += imageTileScores
+        denseScores += imageDenseScores
+        sys.stdout.write('\r>> Scored %d/%d' % (count + 1, len(imageList)))
+        sys.stdout.flush()
+    sys.stdout.write('\n')
+    if not imageList:
+        logging.error('No images found in %s', args.directory)
+        exit(1)
+
+    tileScores = np.array(tileScores)
+    denseScores = np.array(denseScores)
+    diffs = np.abs(tileScores - denseScores)
+    logging.warning('Segments: %d, score diff mean %.4f, p99 %.4f, max %.4f, correlation %.4f',
+                    len(diffs), diffs.mean(), np.percentile(diffs, 99), diffs.max(),
+                    np.corrcoef(tileScores, denseScores)[0, 1])
+    tilePositives = tileScores > .5
+    densePositives = denseScores > .5
+    logging.warning('Segment positives: tile %d, dense %d, both %d. Image agreement %d/%d',
+                    tilePositives.sum(), densePositives.sum(), (tilePositives & densePositives).sum(),
+                    imageAgreements, len(imageList))
+    logging.warning('Time per image: tile %.3f sec, dense %.3f sec, speedup %.2fx',
+                    tileTime / len(imageList), denseTime / len(imageList), tileTime / denseTime)
+    tileClassifier.close()
+    denseClassifier.close()
+
+
+if __name__=="__main__":
+    main()
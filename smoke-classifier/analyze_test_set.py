@@ -112,6 +112,24 @@ def classifyImages(graph, labels, imageList, className, outFile):
     return (image_name, crop_name, score_name, class_name, numPositive)
 
 
+def computeMetrics(truePositive, falseNegative, falsePositive, trueNegative):
+    """Compute the classification metrics from the per image counts
+
+    Returns:
+        Dictionary with accuracy, precision, recall, and f1
+    """
+    accuracy = (truePositive + trueNegative)/(truePositive + trueNegative + falsePositive + falseNegative)
+    precision = truePositive/(truePositive + falsePositive) if (truePositive + falsePositive) else 0
+    recall = truePositive/(truePositive + falseNegative) if (truePositive + falseNegative) else 0
+    f1 = 2 * precision*recall/(precision + recall) if (precision + recall) else 0
+    return {
+        'accuracy': accuracy,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+    }
+
+
 def main():
     reqArgs = [
         ["d", "directory", "directory containing the image sets"],
@@ -175,14 +193,11 @@ def main():
     logging.warning('False Positive: %d', falsePositive)
     logging.warning('True Negative: %d', trueNegative)
 
-    accuracy = (truePositive + trueNegative)/(truePositive + trueNegative + falsePositive + falseNegative)
-    logging.warning('Accuracy: %f', accuracy)
-    precision = truePositive/(truePositive + falsePositive)
-    logging.warning('Precision: %f', precision)
-    recall = truePositive/(truePositive + falseNegative)
-    logging.warning('Recall: %f', recall)
-    f1 = 2 * precision*recall/(precision + recall)
-    logging.warning('F1: %f', f1)
+    metrics = computeMetrics(truePositive, falseNegative, falsePositive, trueNegative)
+    logging.warning('Accuracy: %f', metrics['accuracy'])
+    logging.warning('Precision: %f', metrics['precision'])
+    logging.warning('Recall: %f', metrics['recall'])
+    logging.warning('F1: %f', metrics['f1'])
 
     test_data = [image_name, crop_name, score_name, class_name]
     np.savetxt(args.outputFile, np.transpose(test_data), fmt = "%s")
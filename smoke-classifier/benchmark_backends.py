@@ -0,0 +1,119 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Benchmark the inference backends (see lib/inference_backends.py) on the same images
+
+Each image is segmented and all its segments are classified in one call per
+backend.  Reports tiles per second, the p50 and p99 latency per image, and
+the max score difference from the first backend.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import rect_to_squares
+import inference_backends
+
+import numpy as np
+import logging
+import time
+from PIL import Image
+
+
+def loadImageArray(imgPath):
+    img = Image.open(imgPath)
+    imgArray = np.asarray(img.convert('RGB'))
+    img.close()
+    return imgArray
+
+
+def benchmarkClassifier(classifier, imageList):
+    """Classify all segments of each image with one call per image, timing each call
+
+    Args:
+        classifier: classifier with classifySegmentArrays()
+        imageList (list): paths of the images
+
+    Returns:
+        Tuple of list of segment score arrays per image, list of latencies per image (seconds)
+    """
+    # warm up so one time initialization is not included in latencies
+    classifier.classifySegmentArrays(rect_to_squares.cutBoxesArray(loadImageArray(imageList[0])))
+    imageScores = []
+    latencies = []
+    for imgPath in imageList:
+        segments = rect_to_squares.cutBoxesArray(loadImageArray(imgPath))
+        timeStart = time.time()
+        classifier.classifySegmentArrays(segments)
+        latencies.append(time.time() - timeStart)
+        imageScores.append(np.array([float(segmentInfo['score']) for segmentInfo in segments]))
+    return (imageScores, latencies)
+
+
+def getThroughput(imageScores, latencies):
+    """Summarize the results of benchmarkClassifier()
+
+    Returns:
+        Tuple of tiles per second, p50 and p99 latency per image
+    """
+    numTiles = sum(len(scores) for scores in imageScores)
+    return (numTiles / sum(latencies), np.percentile(latencies, 50), np.percentile(latencies, 99))
+
+
+def main():
+    reqArgs = [
+        ["d", "directory", "directory containing the images"],
+    ]
+    optArgs = [
+        ["b", "backends", "(optional) comma separated backends (default tf,tflite,onnx)"],
+        ["n", "numImages", "(optional) maximum number of images to process", int],
+        ["t", "numThreads", "(optional) number of CPU threads for tflite and onnx backends", int],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    backendNames = args.backends.split(',') if args.backends else inference_backends.BACKENDS
+
+    imageList = sorted(os.path.join(args.directory, x) for x in os.listdir(args.directory) if x[-4:] == '.jpg')
+    if args.numImages:
+        imageList = imageList[:args.numImages]
+    if not imageList:
+        logging.error('No images found in %s', args.directory)
+        exit(1)
+    logging.warning('Found %d images', len(imageList))
+
+    baselineScores = None
+    for backendName in backendNames:
+        modelFile = inference_backends.getBackendModelFile(settings, backendName)
+        classifier = inference_backends.createBackend(backendName, modelFile, settings.labels_file,
+                                                      numThreads=args.numThreads)
+        (imageScores, latencies) = benchmarkClassifier(classifier, imageList)
+        classifier.close()
+        scores = np.concatenate(imageScores)
+        if baselineScores is None:
+            baselineScores = scores
+        (tilesPerSec, p50, p99) = getThroughput(imageScores, latencies)
+        logging.warning('Backend %s: %.1f tiles/sec, latency per image p50 %.3f sec, p99 %.3f sec, ' +
+                        'max score diff from %s %.4f',
+                        backendName, tilesPerSec, p50, p99, backendNames[0], np.abs(scores - baselineScores).max())
+
+
+if __name__=="__main__":
+    main()
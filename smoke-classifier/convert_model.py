@@ -0,0 +1,79 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Convert the frozen smoke classification graph (settings.model_file) for use
+with the tflite or onnx inference backends (see lib/inference_backends.py)
+
+ONNX conversion requires the tf2onnx package.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import tf_helper
+
+import logging
+import subprocess
+import tensorflow as tf
+
+
+def convertToTFLite(modelFile, outputFile):
+    converter = tf.lite.TFLiteConverter.from_frozen_graph(
+        modelFile, input_arrays=[tf_helper.INPUT_LAYER], output_arrays=[tf_helper.OUTPUT_LAYER],
+        input_shapes={tf_helper.INPUT_LAYER: [1, tf_helper.INPUT_HEIGHT, tf_helper.INPUT_WIDTH, 3]})
+    with open(outputFile, 'wb') as f:
+        f.write(converter.convert())
+
+
+def convertToONNX(modelFile, outputFile):
+    pArgs = [
+        sys.executable, '-m', 'tf2onnx.convert',
+        '--graphdef', modelFile,
+        '--inputs', tf_helper.INPUT_LAYER + ':0',
+        '--outputs', tf_helper.OUTPUT_LAYER + ':0',
+        '--output', outputFile,
+    ]
+    subprocess.check_call(pArgs)
+
+
+def main():
+    reqArgs = [
+        ["f", "format", "output format: tflite or onnx"],
+        ["o", "outputFile", "output model file name"],
+    ]
+    optArgs = [
+        ["m", "model", "model file to convert (default settings.model_file)"],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    modelFile = args.model if args.model else settings.model_file
+    if args.format == 'tflite':
+        convertToTFLite(modelFile, args.outputFile)
+    elif args.format == 'onnx':
+        convertToONNX(modelFile, args.outputFile)
+    else:
+        logging.error('Unexpected format: %s', args.format)
+        exit(1)
+    logging.warning('Converted %s to %s', modelFile, args.outputFile)
+
+
+if __name__=="__main__":
+    main()
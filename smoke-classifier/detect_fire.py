@@ -39,9 +39,16 @@ import db_manager
 import email_helper
 import sms_helper
 import img_archive
+import pipeline
+import camera_fetcher
+import camera_scheduler
+import scan_priority
+import frame_buffer
+import alert_dispatcher
 from detection_policies import policies
 
 import logging
+import io
 import pathlib
 import tempfile
 import shutil
@@ -49,57 +56,37 @@ import time, datetime, dateutil.parser
 import random
 import re
 import hashlib
-from urllib.request import urlretrieve
-import tensorflow as tf
+import numpy as np
 from PIL import Image, ImageFile, ImageDraw, ImageFont
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 
-def getNextImage(dbManager, cameras, cameraID=None):
+def getNextImage(cameraFetcher, debugImageDir=None):
     """Gets the next image to check for smoke
 
-    Uses a shared counter being updated by all cooperating detection processes
-    to index into the list of cameras to download the image to a local
-    temporary directory
+    Uses the given camera fetcher (which picks cameras leased by this process
+    from the pool shared by all cooperating detection processes) to download the
+    next changed image into memory.  The image is only written to disk if
+    debugImageDir is given.
 
     Args:
-        dbManager (DbManager):
-        cameras (list): list of cameras
-        cameraID (str): optional specific camera to get image from
+        cameraFetcher (CameraFetcher):
+        debugImageDir (str): optional directory where to also save the image for debugging
 
     Returns:
-        Tuple containing camera name, current timestamp, and filepath of the image
+        Tuple containing camera name, current timestamp, filepath (or just name) of the image,
+        image bytes, md5 of the image, and whether the image is for a re-check.
+        All None if no changed image was found
     """
-    if getNextImage.tmpDir == None:
-        getNextImage.tmpDir = tempfile.TemporaryDirectory()
-        logging.warning('TempDir %s', getNextImage.tmpDir.name)
-
-    if cameraID:
-        camera = list(filter(lambda x: x['name'] == cameraID, cameras))[0]
-    else:
-        index = dbManager.getNextSourcesCounter() % len(cameras)
-        camera = cameras[index]
-    timestamp = int(time.time())
-    imgPath = img_archive.getImgPath(getNextImage.tmpDir.name, camera['name'], timestamp)
-    # logging.warning('urlr %s %s', camera['url'], imgPath)
-    try:
-        urlretrieve(camera['url'], imgPath)
-    except Exception as e:
-        logging.error('Error fetching image from %s %s', camera['name'], str(e))
-        return getNextImage(dbManager, cameras)
-    md5 = hashlib.md5(open(imgPath, 'rb').read()).hexdigest()
-    if ('md5' in camera) and (camera['md5'] == md5) and not cameraID:
-        logging.warning('Camera %s image unchanged', camera['name'])
-        # skip to next camera
-        return getNextImage(dbManager, cameras)
-    camera['md5'] = md5
-    return (camera['name'], timestamp, imgPath, md5)
-getNextImage.tmpDir = None
-
-# XXXXX Use a fixed stable directory for testing
-# from collections import namedtuple
-# Tdir = namedtuple('Tdir', ['name'])
-# getNextImage.tmpDir = Tdir('c:/tmp/dftest')
+    fetched = cameraFetcher.fetchNext()
+    if not fetched:
+        return (None, None, None, None, None, None)
+    (cameraName, timestamp, imgBytes, md5, isRecheck) = fetched
+    imgPath = img_archive.getImgPath(debugImageDir or '', cameraName, timestamp)
+    if debugImageDir:
+        with open(imgPath, 'wb') as f:
+            f.write(imgBytes)
+    return (cameraName, timestamp, imgPath, imgBytes, md5, isRecheck)
 
 
 def getNextImageFromDir(imgDirectory):
@@ -164,32 +151,58 @@ def checkAndUpdateAlerts(dbManager, camera, timestamp, driveFileIDs):
         logging.warning('Supressing new alert due to recent detection')
         return False
 
-    dbRow = {
-        'CameraName': camera,
-        'Timestamp': timestamp,
-        'ImageID': driveFileIDs[0] if driveFileIDs else ''
-    }
-    dbManager.add_data('alerts', dbRow)
+    imageID = driveFileIDs[0] if driveFileIDs else ''
+    # the lock keeps the background upload from patching the detection between the lookup and the insert,
+    # which would leave the alert without ImageID
+    with dbManager.lock:
+        if not imageID:
+            # image may have been uploaded in background since the detection was recorded
+            sqlTemplate = """SELECT ImageID FROM detections where CameraName='%s' and Timestamp=%s"""
+            dbResult = dbManager.query(sqlTemplate % (camera, timestamp))
+            if dbResult and dbResult[0]['imageid']:
+                imageID = dbResult[0]['imageid']
+        dbRow = {
+            'CameraName': camera,
+            'Timestamp': timestamp,
+            'ImageID': imageID
+        }
+        dbManager.add_data('alerts', dbRow)
     return True
 
 
-def alertFire(constants, cameraID, imgPath, annotatedFile, driveFileIDs, fireSegment, timestamp):
-    """Send alerts about given fire through all channels (currently email and sms)
+def alertFire(constants, cameraID, imgPath, imgBytes, annotatedImage, driveFileIDs, fireSegment, timestamp):
+    """Queue alerts about given fire for all channels (currently email and sms)
+
+    The alerts are sent in the background by the alert dispatcher, so
+    detection continues immediately
 
     Args:
         constants (dict): "global" contants
         cameraID (str): camera name
-        imgPath: filepath of the original image
-        annotatedFile: filepath of the annotated image
+        imgPath: filepath (or just name) of the original image
+        imgBytes (bytes): JPEG data of the original image (None to read from imgPath)
+        annotatedImage (tuple): file name and JPEG bytes of the annotated image
         driveFileIDs (list): List of Google drive IDs for the uploaded image files
         fireSegment (dictionary): dictionary with information for the segment with fire/smoke
         timestamp (int): time.time() value when image was taken
     """
-    emailFireNotification(constants, cameraID, imgPath, annotatedFile, driveFileIDs, fireSegment, timestamp)
-    smsFireNotification(constants['dbManager'], cameraID)
-
-
-def emailFireNotification(constants, cameraID, imgPath, annotatedFile, driveFileIDs, fireSegment, timestamp):
+    dbManager = constants['dbManager']
+    deliveries = []
+    # emails are sent from settings.fuegoEmail and bcc to everyone with active emails in notifications SQL table
+    emails = [x['email'] for x in dbManager.getNotifications(filterActiveEmail = True)]
+    if len(emails) > 0:
+        deliveries.append(('email', ','.join(emails)))
+    phones = [x['phone'] for x in dbManager.getNotifications(filterActivePhone = True)]
+    deliveries += [('sms', phone) for phone in phones]
+    if imgBytes == None:
+        with open(imgPath, 'rb') as imgFile:
+            imgBytes = imgFile.read()
+    image = (os.path.basename(imgPath), imgBytes)
+    constants['alertSpool'].addAlert(cameraID, timestamp, fireSegment['score'], image, annotatedImage, deliveries)
+    constants['alertDispatcher'].wakeup()
+
+
+def emailFireNotification(constants, delivery):
     """Send an email alert for a potential new fire
 
     Send email with information about the camera and fire score includeing
@@ -197,15 +210,14 @@ def emailFireNotification(constants, cameraID, imgPath, annotatedFile, driveFile
 
     Args:
         constants (dict): "global" contants
-        cameraID (str): camera name
-        imgPath: filepath of the original image
-        annotatedFile: filepath of the annotated image
-        driveFileIDs (list): List of Google drive IDs for the uploaded image files
-        fireSegment (dictionary): dictionary with information for the segment with fire/smoke
-        timestamp (int): time.time() value when image was taken
+        delivery (dict): alert delivery from the AlertSpool
+
+    Returns:
+        True if email was sent successfully
     """
-    dbManager = constants['dbManager']
-    subject = 'Possible (%d%%) fire in camera %s' % (int(fireSegment['score']*100), cameraID)
+    cameraID = delivery['CameraName']
+    timestamp = delivery['Timestamp']
+    subject = 'Possible (%d%%) fire in camera %s' % (int(delivery['Score']*100), cameraID)
     body = 'Please check the attached images for fire.'
     # commenting out links to google drive because they appear as extra attachments causing confusion
     # and some email recipients don't even have permissions to access drive.
@@ -214,54 +226,43 @@ def emailFireNotification(constants, cameraID, imgPath, annotatedFile, driveFile
     #     driveBody = driveTempl % driveFileID
     #     body += driveBody
 
-    # emails are sent from settings.fuegoEmail and bcc to everyone with active emails in notifications SQL table
-    dbResult = dbManager.getNotifications(filterActiveEmail = True)
-    emails = [x['email'] for x in dbResult]
-    if len(emails) > 0:
-        # attach images spanning a few minutes so reviewers can evaluate based on progression
-        startTimeDT = datetime.datetime.fromtimestamp(timestamp - 3*60)
-        endTimeDT = datetime.datetime.fromtimestamp(timestamp - 1*60)
-        with tempfile.TemporaryDirectory() as tmpDirName:
-            oldImages = img_archive.getHpwrenImages(constants['googleServices'], settings, tmpDirName,
-                                                    constants['camArchives'], cameraID, startTimeDT, endTimeDT, 1)
-            attachments = oldImages or []
-            attachments.append(imgPath)
-            if annotatedFile:
-                attachments.append(annotatedFile)
-            email_helper.sendEmail(constants['googleServices']['mail'], settings.fuegoEmail, emails, subject, body, attachments)
-
-
-def smsFireNotification(dbManager, cameraID):
+    emails = delivery['Recipient'].split(',')
+    # attach images spanning a few minutes so reviewers can evaluate based on progression
+    startTimeDT = datetime.datetime.fromtimestamp(timestamp - 3*60)
+    endTimeDT = datetime.datetime.fromtimestamp(timestamp - 1*60)
+    with tempfile.TemporaryDirectory() as tmpDirName:
+        oldImages = img_archive.getHpwrenImages(constants['googleServices'], settings, tmpDirName,
+                                                constants['camArchives'], cameraID, startTimeDT, endTimeDT, 1)
+        attachments = oldImages or []
+        attachments.append(delivery['ImgPath'])
+        if delivery['AnnotatedPath']:
+            attachments.append(delivery['AnnotatedPath'])
+        # dispatcher handles retries
+        return email_helper.sendEmail(constants['googleServices']['mail'], settings.fuegoEmail, emails, subject, body,
+                                      attachments, retries=1)
+
+
+def smsFireNotification(delivery):
     """Send an sms (phone text message) alert for a potential new fire
 
     Args:
-        dbManager (DbManager):
-        cameraID (str): camera name
+        delivery (dict): alert delivery from the AlertSpool
+
+    Returns:
+        True if sms was sent successfully
     """
-    message = 'Fuego fire notification in camera %s. Please check email for details' % cameraID
-    dbResult = dbManager.getNotifications(filterActivePhone = True)
-    phones = [x['phone'] for x in dbResult]
-    if len(phones) > 0:
-        for phone in phones:
-            sms_helper.sendSms(settings, phone, message)
+    message = 'Fuego fire notification in camera %s. Please check email for details' % delivery['CameraName']
+    return sms_helper.sendSms(settings, delivery['Recipient'], message, retries=1) != None
 
 
-def deleteImageFiles(imgPath, origImgPath, annotatedFile):
-    """Delete all image files given in segments
+def deleteImageFiles(filePaths):
+    """Delete the temporary image files of an image (only archived images use files)
 
     Args:
-        imgPath: filepath of the original image
-        annotatedFile: filepath of the annotated image
+        filePaths (list): filepaths to delete
     """
-    os.remove(imgPath)
-    if imgPath != origImgPath:
-        os.remove(origImgPath)
-    if annotatedFile:
-        os.remove(annotatedFile)
-    ppath = pathlib.PurePath(imgPath)
-    # leftoverFiles = os.listdir(str(ppath.parent))
-    # if len(leftoverFiles) > 0:
-    #     logging.warning('leftover files %s', str(leftoverFiles))
+    for filePath in set(filePaths):
+        os.remove(filePath)
 
 
 def getLastScoreCamera(dbManager):
@@ -296,25 +297,92 @@ def genDiffImage(imgPath, earlierImgPath, minusMinutes):
     """
     imgA = Image.open(imgPath)
     imgB = Image.open(earlierImgPath)
+    return saveDiffImage(imgPath, imgA, imgB, minusMinutes)
+
+
+def saveDiffImage(imgPath, imgA, imgB, minusMinutes):
+    """Subtract the two given images and store result in new difference image file next to imgPath
+
+    Args:
+        imgPath (str): filepath of the current image
+        imgA: Pillow image object of the current image (to subtract from)
+        imgB: Pillow image object of the earlier image (value to subtract)
+        minusMinutes (int): number of minutes separating subtracted images
+
+    Returns:
+        file path to the difference image
+    """
     imgDiff = img_archive.diffImages(imgA, imgB)
+    imgDiffPath = getDiffImgPath(imgPath, minusMinutes)
+    imgDiff.save(imgDiffPath, format='JPEG')
+    return imgDiffPath
+
+
+def getDiffImgPath(imgPath, minusMinutes):
+    """Get the filepath of the difference image for given image next to it
+
+    Args:
+        imgPath (str): filepath of the current image
+        minusMinutes (int): number of minutes separating subtracted images
+
+    Returns:
+        file path for the difference image
+    """
     parsedName = img_archive.parseFilename(imgPath)
     parsedName['diffMinutes'] = minusMinutes
     imgDiffName = img_archive.repackFileName(parsedName)
-    ppath = pathlib.PurePath(imgPath)
-    imgDiffPath = os.path.join(str(ppath.parent), imgDiffName)
-    imgDiff.save(imgDiffPath, format='JPEG')
-    return imgDiffPath
+    return os.path.join(os.path.dirname(imgPath), imgDiffName)
+
+
+def getLiveDiffImage(frameBuffer, cameraID, timestamp, imgPath, imgBytes, minusMinutes, toleranceSeconds=60,
+                     saveDebug=False):
+    """Subtract the buffered frame from minusMinutes ago from the given live image
+
+    The decoded live image is added to the camera's buffer for later diffs.
+
+    Args:
+        frameBuffer (FrameRingBuffer): buffer of recent frames
+        cameraID (str): camera name
+        timestamp (int): unix time of the live image
+        imgPath (str): filepath (or just name) of the live image
+        imgBytes (bytes): JPEG data of the live image
+        minusMinutes (int): number of desired minutes between images to subract
+        toleranceSeconds (int): maximum number of seconds the earlier frame may be older than desired
+        saveDebug (bool): also save the difference image next to imgPath for debugging
+
+    Returns:
+        numpy array of the difference image, or None if no suitable earlier frame is buffered
+    """
+    imgFile = Image.open(io.BytesIO(imgBytes))
+    img = imgFile.convert('RGB')
+    imgFile.close()
+    imgArray = np.asarray(img)
+    (earlierTimestamp, earlierArray) = frameBuffer.getFrame(cameraID, timestamp - 60 * minusMinutes, toleranceSeconds)
+    frameBuffer.addFrame(cameraID, timestamp, imgArray)
+    if earlierArray is None:
+        return None
+    if earlierArray.shape != imgArray.shape:
+        logging.warning('Camera %s image size changed from %s to %s', cameraID, earlierArray.shape, imgArray.shape)
+        return None
+    diffArray = img_archive.diffImageArrays(imgArray, earlierArray)
+    if saveDebug:
+        Image.fromarray(diffArray).save(getDiffImgPath(imgPath, minusMinutes), format='JPEG')
+    return diffArray
 
 
 def updateTimeTracker(timeTracker, processingTime):
     """Update the time tracker data with given time to process current image
 
+    The processing time is the detection busy time per image, which excludes
+    fetching and waits in the pipeline queues, so timePerSample reflects the
+    cost of checking an image rather than its latency.
+
     If enough samples new samples have been reorded, resets the history and
     updates the average timePerSample
 
     Args:
         timeTracker (dict): tracks recent image processing times
-        processingTime (float): number of seconds needed to process current image
+        processingTime (float): number of seconds spent detecting smoke in current image
     """
     timeTracker['totalTime'] += processingTime
     timeTracker['numSamples'] += 1
@@ -391,6 +459,136 @@ def getArchivedImages(constants, cameras, startTimeDT, timeRangeSeconds, minusMi
 getArchivedImages.tmpDir = None
 
 
+def fetchImage(constants, cameras):
+    """Fetch stage of the detection pipeline: get the next image to check for smoke
+
+    Live images stay in memory (imgBytes, and classifyBytes or classifyArray)
+    and imgPath and classifyImgPath are only names unless debugImageDir is
+    given.  Archived images are files that are deleted after post-processing.
+
+    Args:
+        constants (dict): "global" contants
+        cameras (list): list of cameras
+
+    Returns:
+        Dictionary with information about the image or None if no image was found
+    """
+    timeStart = time.time()
+    md5 = None
+    debugImageDir = constants['debugImageDir']
+    imgBytes = None
+    classifyBytes = None
+    classifyArray = None
+    tmpFiles = []
+    isRecheck = False
+    if constants['useArchivedImages']:
+        (cameraID, timestamp, imgPath, classifyImgPath) = \
+            getArchivedImages(constants, cameras, constants['startTimeDT'], constants['timeRangeSeconds'],
+                              constants['minusMinutes'])
+        tmpFiles = [imgPath, classifyImgPath]
+    elif constants['frameBuffer']: # live diff mode
+        (cameraID, timestamp, imgPath, imgBytes, md5, isRecheck) = getNextImage(constants['cameraFetcher'],
+                                                                                debugImageDir)
+        if not cameraID:
+            return None
+        classifyArray = getLiveDiffImage(constants['frameBuffer'], cameraID, timestamp, imgPath, imgBytes,
+                                         constants['minusMinutes'], saveDebug=bool(debugImageDir))
+        if classifyArray is None:
+            return None # no earlier frame to subtract yet, but image is buffered
+        classifyImgPath = getDiffImgPath(imgPath, constants['minusMinutes'])
+    # elif args.imgDirectory:  unused functionality -- to delete?
+    #     (cameraID, timestamp, imgPath, md5) = getNextImageFromDir(args.imgDirectory)
+    else: # regular (non diff mode), grab image and process
+        (cameraID, timestamp, imgPath, imgBytes, md5, isRecheck) = getNextImage(constants['cameraFetcher'],
+                                                                                debugImageDir)
+        classifyImgPath = imgPath
+        classifyBytes = imgBytes
+    if not cameraID:
+        return None # skip to next camera
+    return {
+        'cameraID': cameraID,
+        'timestamp': timestamp,
+        'imgPath': imgPath,
+        'imgBytes': imgBytes,
+        'classifyImgPath': classifyImgPath,
+        'classifyBytes': classifyBytes,
+        'classifyArray': classifyArray,
+        'tmpFiles': tmpFiles,
+        'md5': md5,
+        'recheck': isRecheck,
+        'timeStart': timeStart,
+        'timeFetch': time.time(),
+    }
+
+
+def detectImages(detectionPolicy, imageInfos):
+    """Detect stage of the detection pipeline: check the given batch of images for smoke
+
+    Args:
+        detectionPolicy: detection policy object
+        imageInfos (list): list of image information from fetchImage()
+
+    Returns:
+        imageInfos updated with the detection results
+    """
+    timeDetectStart = time.time()
+    imageSpecs = []
+    for imageInfo in imageInfos:
+        imageInfo['timeDetectStart'] = timeDetectStart
+        image_spec = [{}]
+        image_spec[-1]['path'] = imageInfo['classifyImgPath']
+        image_spec[-1]['timestamp'] = imageInfo['timestamp']
+        image_spec[-1]['cameraID'] = imageInfo['cameraID']
+        # in memory image data (if not set, the image is read from path)
+        image_spec[-1]['imgBytes'] = imageInfo['classifyBytes']
+        image_spec[-1]['imgArray'] = imageInfo['classifyArray']
+        image_spec[-1]['recheck'] = imageInfo['recheck']
+        imageSpecs.append(image_spec)
+
+    detectionResults = detectionPolicy.detectMultiple(imageSpecs)
+    timeDetect = time.time()
+    detectSeconds = (timeDetect - timeDetectStart) / len(imageInfos) # busy time shared by the batch
+    for (imageInfo, detectionResult) in zip(imageInfos, detectionResults):
+        imageInfo['detectionResult'] = detectionResult
+        imageInfo['timeDetect'] = timeDetect
+        imageInfo['detectSeconds'] = detectSeconds
+    return imageInfos
+
+
+def postProcessImage(constants, timeTracker, imageInfo):
+    """Post-processing stage of the detection pipeline: alerts, cleanup and heartbeat
+
+    Args:
+        constants (dict): "global" contants
+        timeTracker (dict): tracks recent per image detection busy times
+        imageInfo (dict): image information with results from detectImage()
+    """
+    args = constants['args']
+    cameraID = imageInfo['cameraID']
+    timestamp = imageInfo['timestamp']
+    imgPath = imageInfo['imgPath']
+    detectionResult = imageInfo['detectionResult']
+    if detectionResult['fireSegment']:
+        if checkAndUpdateAlerts(constants['dbManager'], cameraID, timestamp, detectionResult['driveFileIDs']):
+            alertFire(constants, cameraID, imgPath, imageInfo['imgBytes'], detectionResult['annotatedImage'], detectionResult['driveFileIDs'], detectionResult['fireSegment'], timestamp)
+    deleteImageFiles(imageInfo['tmpFiles'])
+    if (args.heartbeat):
+        heartBeat(args.heartbeat)
+
+    timePost = time.time()
+    updateTimeTracker(timeTracker, imageInfo['detectSeconds'])
+    if constants['scanPriority']:
+        constants['scanPriority'].setTimePerImage(timeTracker['timePerSample'])
+    if args.time:
+        timeDetect = imageInfo['timeDetect']
+        if not detectionResult['timeMid']:
+            detectionResult['timeMid'] = timeDetect
+        logging.warning('Timings: fetch=%.2f, wait=%.2f, detect0=%.2f, detect1=%.2f post=%.2f',
+            imageInfo['timeFetch']-imageInfo['timeStart'], imageInfo['timeDetectStart']-imageInfo['timeFetch'],
+            detectionResult['timeMid']-imageInfo['timeDetectStart'], timeDetect-detectionResult['timeMid'],
+            timePost-timeDetect)
+
+
 def main():
     optArgs = [
         ["b", "heartbeat", "filename used for heartbeating check"],
@@ -401,29 +599,42 @@ def main():
         ["r", "restrictType", "Only process images from cameras of given type"],
         ["s", "startTime", "(optional) performs search with modifiedTime > startTime"],
         ["e", "endTime", "(optional) performs search with modifiedTime < endTime"],
+        ["f", "numFetchers", "(optional) number of parallel image fetchers (default 2)"],
+        ["y", "maxPerHost", "(optional) maximum concurrent fetches from one camera host (default numFetchers)"],
+        ["g", "changeThreshold", "(optional) reuse scores of segments that changed less than this (default 2, 0 disables)"],
+        ["n", "rescoreFrames", "(optional) rescore all segments of a camera every N images (default 10)"],
+        ["i", "batchImages", "(optional) maximum number of images classified together (default 1)"],
+        ["w", "batchWaitMs", "(optional) maximum milliseconds to wait for more images for a batch (default 200)"],
+        ["x", "inferenceSocket", "(optional) Unix socket of shared inference server (see serve_inference.py)"],
+        ["k", "diffBufferFrames", "(optional) max frames per camera buffered for live diff mode (default minusMinutes + 2)"],
+        ["u", "diffBufferMB", "(optional) max MB of frames buffered for live diff mode (default 2048)"],
+        ["a", "adaptiveScan", "(optional) scan cameras based on priority using given fraction of CPU (e.g., 0.9)"],
+        ["p", "numProcesses", "(optional) number of detection processes sharing the cameras (default 1)"],
+        ["q", "recheck", "(optional) number of prompt re-checks of segments scoring just below threshold (default 0)"],
+        ["o", "debugImageDir", "(optional) also save the fetched and difference images in given directory for debugging"],
     ]
     args = collect_args.collectArgs([], optionalArgs=optArgs, parentParsers=[goog_helper.getParentParser()])
     minusMinutes = int(args.minusMinutes) if args.minusMinutes else 0
+    numFetchers = int(args.numFetchers) if args.numFetchers else 2
+    batchImages = int(args.batchImages) if args.batchImages else 1
+    batchWaitSeconds = int(args.batchWaitMs) / 1000 if args.batchWaitMs else 0.2
     googleServices = goog_helper.getGoogleServices(settings, args)
     dbManager = db_manager.DbManager(sqliteFile=settings.db_file,
                                     psqlHost=settings.psqlHost, psqlDb=settings.psqlDb,
                                     psqlUser=settings.psqlUser, psqlPasswd=settings.psqlPasswd)
-    tfConfig = tf.ConfigProto()
-    tfConfig.gpu_options.per_process_gpu_memory_fraction = 0.1 #hopefully reduces segfaults
+    tfConfig = None # tensorflow backed classifiers use tf_helper.getDefaultConfig(), so only they load tensorflow
     cameras = dbManager.get_sources(activeOnly=True, restrictType=args.restrictType)
+    if args.debugImageDir:
+        os.makedirs(args.debugImageDir, exist_ok=True)
     startTimeDT = dateutil.parser.parse(args.startTime) if args.startTime else None
     endTimeDT = dateutil.parser.parse(args.endTime) if args.endTime else None
     timeRangeSeconds = None
     useArchivedImages = False
     camArchives = img_archive.getHpwrenCameraArchives(googleServices['sheet'], settings)
+    # google API clients are not thread safe, so each pipeline stage gets its own
+    policyGoogleServices = goog_helper.getGoogleServices(settings, args)
     DetectionPolicyClass = policies.get_policies()[settings.detectionPolicy]
-    detectionPolicy = DetectionPolicyClass(settings, args, googleServices, dbManager, tfConfig, camArchives, minusMinutes, useArchivedImages)
-    constants = { # dictionary of constants to reduce parameters in various functions
-        'args': args,
-        'googleServices': googleServices,
-        'camArchives': camArchives,
-        'dbManager': dbManager,
-    }
+    detectionPolicy = DetectionPolicyClass(settings, args, policyGoogleServices, dbManager, tfConfig, camArchives, minusMinutes, useArchivedImages)
 
     if startTimeDT or endTimeDT:
         assert startTimeDT and endTimeDT
@@ -431,46 +642,81 @@ def main():
         assert timeRangeSeconds > 0
         assert args.collectPositves
         useArchivedImages = True
+        numFetchers = 1 # single fetcher to keep the randomized ordering reproducible
         random.seed(0) # fixed seed guarantees same randomized ordering.  Should make this optional argument in future
 
-    processingTimeTracker = initializeTimeTracker()
-    while True:
-        classifyImgPath = None
-        timeStart = time.time()
-        if useArchivedImages:
-            (cameraID, timestamp, imgPath, classifyImgPath) = \
-                getArchivedImages(constants, cameras, startTimeDT, timeRangeSeconds, minusMinutes)
-        # elif minusMinutes: to be resurrected using archive functionality
-        # elif args.imgDirectory:  unused functionality -- to delete?
-        #     (cameraID, timestamp, imgPath, md5) = getNextImageFromDir(args.imgDirectory)
-        else: # regular (non diff mode), grab image and process
-            (cameraID, timestamp, imgPath, md5) = getNextImage(dbManager, cameras)
-            classifyImgPath = imgPath
-        if not cameraID:
-            continue # skip to next camera
-        timeFetch = time.time()
+    scanPriority = None
+    if args.adaptiveScan:
+        scanPriority = scan_priority.ScanPriority(dbManager, [camera['name'] for camera in cameras],
+                                                  cpuBudget=float(args.adaptiveScan),
+                                                  numProcesses=int(args.numProcesses) if args.numProcesses else 1,
+                                                  dayHours=getattr(settings, 'scan_day_hours', (6, 20)),
+                                                  fireWeatherMonths=getattr(settings, 'fire_weather_months', []))
 
-        image_spec = [{}]
-        image_spec[-1]['path'] = classifyImgPath
-        image_spec[-1]['timestamp'] = timestamp
-        image_spec[-1]['cameraID'] = cameraID
-
-        detectionResult = detectionPolicy.detect(image_spec)
-        timeDetect = time.time()
-        if detectionResult['fireSegment']:
-            if checkAndUpdateAlerts(dbManager, cameraID, timestamp, detectionResult['driveFileIDs']):
-                alertFire(constants, cameraID, imgPath, detectionResult['annotatedFile'], detectionResult['driveFileIDs'], detectionResult['fireSegment'], timestamp)
-        deleteImageFiles(imgPath, imgPath, detectionResult['annotatedFile'])
-        if (args.heartbeat):
-            heartBeat(args.heartbeat)
-
-        timePost = time.time()
-        updateTimeTracker(processingTimeTracker, timePost - timeStart)
-        if args.time:
-            if not detectionResult['timeMid']:
-                detectionResult['timeMid'] = timeDetect
-            logging.warning('Timings: fetch=%.2f, detect0=%.2f, detect1=%.2f post=%.2f',
-                timeFetch-timeStart, detectionResult['timeMid']-timeFetch, timeDetect-detectionResult['timeMid'], timePost-timeDetect)
+    affinitySeconds = None
+    if minusMinutes and not useArchivedImages:
+        # live diff mode buffers the earlier frames in memory, so keep cameras with the process that buffered them
+        # for as long as the frames are usable
+        affinitySeconds = 60 * minusMinutes + 60
+
+    constants = { # dictionary of constants to reduce parameters in various functions
+        'args': args,
+        'googleServices': googleServices,
+        'camArchives': camArchives,
+        'dbManager': dbManager,
+        'minusMinutes': minusMinutes,
+        'useArchivedImages': useArchivedImages,
+        'startTimeDT': startTimeDT,
+        'timeRangeSeconds': timeRangeSeconds,
+        'scanPriority': scanPriority,
+        'debugImageDir': args.debugImageDir,
+        'cameraFetcher': camera_fetcher.CameraFetcher(camera_scheduler.CameraScheduler(dbManager, cameras,
+                                                                                       scanPriority=scanPriority,
+                                                                                       recheckQueue=getattr(detectionPolicy, 'recheckQueue', None),
+                                                                                       affinitySeconds=affinitySeconds),
+                                                      cameras, maxConnections=numFetchers,
+                                                      maxPerHost=int(args.maxPerHost) if args.maxPerHost else numFetchers),
+    }
+    if minusMinutes and not useArchivedImages:
+        # live diff mode: earlier frames come from memory instead of the archive
+        maxFramesPerCamera = int(args.diffBufferFrames) if args.diffBufferFrames else minusMinutes + 2
+        maxBytes = int(args.diffBufferMB) * 1024 * 1024 if args.diffBufferMB else 2048 * 1024 * 1024
+        constants['frameBuffer'] = frame_buffer.FrameRingBuffer(maxFramesPerCamera, maxBytes,
+                                                                maxAgeSeconds=affinitySeconds)
+    else:
+        constants['frameBuffer'] = None
+    # alerts are sent in background from a durable spool so detection isn't blocked
+    alertConstants = dict(constants, googleServices=goog_helper.getGoogleServices(settings, args))
+    alertSpool = alert_dispatcher.AlertSpool(getattr(settings, 'alert_spool_dir', None) or
+                                             os.path.join(tempfile.gettempdir(), 'fuego_alert_spool'))
+    alertDispatcher = alert_dispatcher.AlertDispatcher(alertSpool, {
+        'email': lambda delivery: emailFireNotification(alertConstants, delivery),
+        'sms': smsFireNotification,
+    }, channelWorkers={'email': 1, 'sms': 4}) # gmail client is not thread safe
+    alertDispatcher.start()
+    constants['alertSpool'] = alertSpool
+    constants['alertDispatcher'] = alertDispatcher
+    postConstants = dict(constants, googleServices=goog_helper.getGoogleServices(settings, args))
+
+    # fetching (network), detection (CPU), and post-processing (network) run concurrently
+    processingTimeTracker = initializeTimeTracker()
+    detectPipeline = pipeline.Pipeline(queueSize=max(numFetchers, batchImages) + 1)
+    detectPipeline.addStage('fetch', lambda: fetchImage(constants, cameras), numWorkers=numFetchers)
+    detectPipeline.addStage('detect', lambda imageInfos: detectImages(detectionPolicy, imageInfos),
+                            batchSize=batchImages, maxWaitSeconds=batchWaitSeconds)
+    detectPipeline.addStage('post', lambda imageInfo: postProcessImage(postConstants, processingTimeTracker, imageInfo))
+    try:
+        error = detectPipeline.run(statsIntervalSeconds=60 if args.time else None)
+    finally:
+        # write buffered scores and finish pending uploads and alerts before exiting
+        if hasattr(detectionPolicy, 'scoreBuffer'):
+            detectionPolicy.scoreBuffer.flush()
+        alertDispatcher.stop()
+        if hasattr(detectionPolicy, 'driveUploader'):
+            detectionPolicy.driveUploader.logStats()
+            detectionPolicy.driveUploader.stop()
+    if error:
+        exit(1)
 
 
 if __name__=="__main__":
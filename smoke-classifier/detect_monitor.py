@@ -51,7 +51,8 @@ def findProcess(name):
     return None
 
 
-def startProcess(detectFire, heartbeatFileName, collectPositves, restrictType):
+def startProcess(detectFire, heartbeatFileName, collectPositves, restrictType, inferenceSocket=None,
+                 adaptiveScan=None, numProcesses=1):
     pArgs = [
         sys.executable,
         os.path.join(settings.fuegoRoot, "smoke-classifier", detectFire),
@@ -62,12 +63,28 @@ def startProcess(detectFire, heartbeatFileName, collectPositves, restrictType):
         pArgs += ['--collectPositves', '1']
     if restrictType:
         pArgs += ['--restrictType', restrictType]
+    if inferenceSocket:
+        pArgs += ['--inferenceSocket', inferenceSocket]
+    if adaptiveScan:
+        pArgs += ['--adaptiveScan', adaptiveScan, '--numProcesses', str(numProcesses)]
     proc = subprocess.Popen(pArgs)
     logging.warning('Started PID %d %s', proc.pid, pArgs)
     heartBeat(heartbeatFileName) # reset heartbeat
     return proc
 
 
+def startInferenceServer(socketPath):
+    pArgs = [
+        sys.executable,
+        os.path.join(settings.fuegoRoot, "smoke-classifier", "serve_inference.py"),
+        '--socket',
+        socketPath
+    ]
+    proc = subprocess.Popen(pArgs)
+    logging.warning('Started inference server PID %d %s', proc.pid, pArgs)
+    return proc
+
+
 def heartBeat(filename):
     """Inform monitor process that this detection process is alive
 
@@ -89,6 +106,8 @@ def main():
         ["g", "useGpu", "(optional) specify any value to use gpu (default off)"],
         ["c", "collectPositves", "collect positive segments for training data"],
         ["r", "restrictType", "Only process images from cameras of given type"],
+        ["s", "sharedInference", "(optional) specify any value to share one inference server among all processes"],
+        ["a", "adaptiveScan", "(optional) scan cameras based on priority using given fraction of CPU (e.g., 0.9)"],
     ]
     args = collect_args.collectArgs([], optionalArgs=optArgs, parentParsers=[goog_helper.getParentParser()])
     numProcesses = int(args.numProcesses) if args.numProcesses else 1
@@ -97,11 +116,18 @@ def main():
     if not useGpu:
         os.environ["CUDA_VISIBLE_DEVICES"]="-1"
     scriptName = 'detect_fire.py'
+    inferenceSocket = None
+    if args.sharedInference:
+        socketDir = tempfile.TemporaryDirectory()
+        inferenceSocket = os.path.join(socketDir.name, 'inference.sock')
+        inferenceProc = startInferenceServer(inferenceSocket)
+        time.sleep(10) # allow model to load
     procInfos = []
     for i in range(numProcesses):
         heartbeatFile = tempfile.NamedTemporaryFile()
         heartbeatFileName = heartbeatFile.name
-        proc = startProcess(scriptName, heartbeatFileName, args.collectPositves, args.restrictType)
+        proc = startProcess(scriptName, heartbeatFileName, args.collectPositves, args.restrictType, inferenceSocket,
+                            args.adaptiveScan, numProcesses)
         procInfos.append({
             'proc': proc,
             'heartbeatFile': heartbeatFile,
@@ -110,6 +136,9 @@ def main():
         time.sleep(10) # 10 seconds per process to allow startup
 
     while True:
+        if inferenceSocket and (inferenceProc.poll() != None):
+            logging.warning('Inference server %d exited. Restarting', inferenceProc.pid)
+            inferenceProc = startInferenceServer(inferenceSocket)
         for procInfo in procInfos:
             lastTS = lastHeartbeat(procInfo['heartbeatFileName']) # check heartbeat
             timestamp = int(time.time())
@@ -121,7 +150,8 @@ def main():
             if (timestamp - lastTS) > 4*60: # kill if stuck more than 4 minutes
                 logging.warning('Killing %d', proc.pid)
                 proc.kill()
-                procInfo['proc'] = startProcess(scriptName, procInfo['heartbeatFileName'], args.collectPositves, args.restrictType)
+                procInfo['proc'] = startProcess(scriptName, procInfo['heartbeatFileName'], args.collectPositves, args.restrictType, inferenceSocket,
+                                                args.adaptiveScan, numProcesses)
         time.sleep(30)
 
 
@@ -0,0 +1,215 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Export post-training quantized (float16 and/or int8) TFLite variants of the
+frozen smoke classification graph and compare them with the float32 model
+
+int8 quantization is calibrated with a random sample of the training images
+in the TFRecords created by train/prepare_trainset.py.  All models are then
+evaluated on the test set (same layout and metrics as analyze_test_set.py)
+while measuring throughput (same as benchmark_backends.py).  A quantized model
+is marked acceptable when neither its precision nor recall is worse than the
+float32 model by more than the given delta.
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import tf_helper
+import inference_backends
+import analyze_test_set
+import benchmark_backends
+
+import glob
+import io
+import random
+import logging
+import numpy as np
+import tensorflow as tf
+from PIL import Image
+
+QUANTIZATIONS = ['float16', 'int8']
+
+
+def sampleTFRecordImages(tfrecordsDir, split, numSamples):
+    """Get a uniformly random sample of the encoded images in the given TFRecords split
+
+    Args:
+        tfrecordsDir (str): directory with TFRecords from prepare_trainset.py
+        split (str): 'train' or 'validation'
+        numSamples (int): number of images to sample
+
+    Returns:
+        List of encoded images
+    """
+    recordFiles = sorted(glob.glob(os.path.join(tfrecordsDir, 'firecam_%s_*.tfrecord' % split)))
+    if not recordFiles:
+        raise ValueError('No %s TFRecords found in %s' % (split, tfrecordsDir))
+    samples = []
+    count = 0
+    for recordFile in recordFiles:
+        for record in tf.python_io.tf_record_iterator(recordFile):
+            if len(samples) < numSamples:
+                samples.append(record)
+            else:
+                index = random.randint(0, count)
+                if index < numSamples:
+                    samples[index] = record
+            count += 1
+    logging.warning('Sampled %d of %d images from %d TFRecord files', len(samples), count, len(recordFiles))
+    return [tf.train.Example.FromString(record).features.feature['image/encoded'].bytes_list.value[0]
+            for record in samples]
+
+
+def getRepresentativeDataset(encodedImages):
+    """Get generator of model inputs for int8 calibration, preprocessed the same way as detection
+    """
+    def representativeDataset():
+        for encodedImage in encodedImages:
+            img = Image.open(io.BytesIO(encodedImage))
+            imgArray = np.asarray(img.convert('RGB'))
+            img.close()
+            yield [inference_backends.normalizeTiles(np.expand_dims(imgArray, 0))]
+    return representativeDataset
+
+
+def quantizeModel(modelFile, outputFile, quantization, encodedImages=None):
+    """Convert the frozen graph to a post-training quantized TFLite model
+
+    Args:
+        modelFile (str): path to frozen graph
+        outputFile (str): path of the TFLite model to write
+        quantization (str): one of QUANTIZATIONS
+        encodedImages (list): calibration images (required for int8)
+    """
+    converter = tf.lite.TFLiteConverter.from_frozen_graph(
+        modelFile, input_arrays=[tf_helper.INPUT_LAYER], output_arrays=[tf_helper.OUTPUT_LAYER],
+        input_shapes={tf_helper.INPUT_LAYER: [1, tf_helper.INPUT_HEIGHT, tf_helper.INPUT_WIDTH, 3]})
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == 'int8':
+        # weights and activations in int8, keeping float input and output so the model is a drop in replacement
+        converter.representative_dataset = getRepresentativeDataset(encodedImages)
+    else:
+        raise ValueError('Unknown quantization %s' % quantization)
+    with open(outputFile, 'wb') as f:
+        f.write(converter.convert())
+    logging.warning('Wrote %s model %s', quantization, outputFile)
+
+
+def evaluateModel(classifier, smokeImages, otherImages):
+    """Compute the test set metrics and throughput of the given classifier
+
+    Images are positive if any segment scores > 0.5, same as analyze_test_set.py
+
+    Returns:
+        Dictionary with test set metrics, tilesPerSec, and p50 and p99 latency per image
+    """
+    (smokeScores, smokeLatencies) = benchmark_backends.benchmarkClassifier(classifier, smokeImages)
+    (otherScores, otherLatencies) = benchmark_backends.benchmarkClassifier(classifier, otherImages)
+    truePositive = sum(1 for scores in smokeScores if scores.max() > .5)
+    falsePositive = sum(1 for scores in otherScores if scores.max() > .5)
+    results = analyze_test_set.computeMetrics(truePositive, len(smokeImages) - truePositive,
+                                              falsePositive, len(otherImages) - falsePositive)
+    (results['tilesPerSec'], results['p50'], results['p99']) = \
+        benchmark_backends.getThroughput(smokeScores + otherScores, smokeLatencies + otherLatencies)
+    return results
+
+
+def formatResults(name, modelFile, results, baseline, maxDelta):
+    line = ('%s (%s, %.1f MB): accuracy %.4f, precision %.4f, recall %.4f, F1 %.4f, ' +
+            '%.1f tiles/sec, p50 %.3f sec, p99 %.3f sec') % (
+        name, os.path.basename(modelFile), os.path.getsize(modelFile) / 1e6, results['accuracy'],
+        results['precision'], results['recall'], results['f1'], results['tilesPerSec'], results['p50'], results['p99'])
+    if baseline:
+        precisionDelta = results['precision'] - baseline['precision']
+        recallDelta = results['recall'] - baseline['recall']
+        acceptable = (precisionDelta >= -maxDelta) and (recallDelta >= -maxDelta)
+        line += '. vs float32: precision %+.4f, recall %+.4f, speedup %.2fx -> %s' % (
+            precisionDelta, recallDelta, results['tilesPerSec'] / baseline['tilesPerSec'],
+            'ACCEPTABLE' if acceptable else 'REJECTED')
+    return line
+
+
+def main():
+    reqArgs = [
+        ["o", "outputDir", "directory to write quantized models and report"],
+        ["d", "directory", "test set directory (with test_set_smoke and test_set_other)"],
+    ]
+    optArgs = [
+        ["m", "model", "frozen graph to quantize (default settings.model_file)"],
+        ["l", "labels", "labels file (default settings.labels_file)"],
+        ["q", "quantizations", "(optional) comma separated quantizations (default float16,int8)"],
+        ["r", "tfrecordsDir", "directory with TFRecords for int8 calibration (required for int8)"],
+        ["s", "split", "(optional) TFRecords split for calibration (default train)"],
+        ["n", "numCalibration", "(optional) number of calibration images (default 500)", int],
+        ["x", "maxDelta", "(optional) max acceptable drop in precision or recall (default 0.01)", float],
+        ["t", "numThreads", "(optional) number of CPU threads for tflite models", int],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    modelFile = args.model or settings.model_file
+    labelsFile = args.labels or settings.labels_file
+    quantizations = args.quantizations.split(',') if args.quantizations else QUANTIZATIONS
+    maxDelta = args.maxDelta if args.maxDelta != None else 0.01
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3' # quiet down tensorflow logging
+
+    encodedImages = None
+    if 'int8' in quantizations:
+        if not args.tfrecordsDir:
+            logging.error('int8 quantization requires TFRecords for calibration (--tfrecordsDir)')
+            exit(1)
+        encodedImages = sampleTFRecordImages(args.tfrecordsDir, args.split or 'train', args.numCalibration or 500)
+
+    modelBase = os.path.splitext(os.path.basename(modelFile))[0]
+    quantizedFiles = []
+    for quantization in quantizations:
+        outputFile = os.path.join(args.outputDir, '%s_%s.tflite' % (modelBase, quantization))
+        quantizeModel(modelFile, outputFile, quantization, encodedImages)
+        quantizedFiles.append((quantization, outputFile))
+
+    smokeImages = analyze_test_set.listJpegs(os.path.join(args.directory, 'test_set_smoke'))
+    otherImages = analyze_test_set.listJpegs(os.path.join(args.directory, 'test_set_other'))
+    logging.warning('Evaluating on %d smoke and %d other images', len(smokeImages), len(otherImages))
+
+    config = tf.ConfigProto()
+    config.gpu_options.per_process_gpu_memory_fraction = 0.1
+    classifier = inference_backends.createBackend('tf', modelFile, labelsFile, tfConfig=config)
+    baseline = evaluateModel(classifier, smokeImages, otherImages)
+    classifier.close()
+    reportLines = [formatResults('float32', modelFile, baseline, None, maxDelta)]
+    logging.warning(reportLines[-1])
+    for (quantization, outputFile) in quantizedFiles:
+        classifier = inference_backends.createBackend('tflite', outputFile, labelsFile, numThreads=args.numThreads)
+        results = evaluateModel(classifier, smokeImages, otherImages)
+        classifier.close()
+        reportLines.append(formatResults(quantization, outputFile, results, baseline, maxDelta))
+        logging.warning(reportLines[-1])
+
+    reportFile = os.path.join(args.outputDir, modelBase + '_quantization_report.txt')
+    with open(reportFile, 'w') as f:
+        f.write('\n'.join(reportLines) + '\n')
+    logging.warning('Wrote report %s', reportFile)
+
+
+if __name__=="__main__":
+    main()
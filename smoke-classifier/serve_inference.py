@@ -0,0 +1,52 @@
+# Copyright 2018 The Fuego Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""
+
+Serve smoke classification requests from detection processes on this host.
+Loads the model once and batches requests across all the clients
+(detect_fire.py --inferenceSocket)
+
+"""
+
+import os
+import sys
+fuegoRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(fuegoRoot, 'lib'))
+sys.path.insert(0, fuegoRoot)
+import settings
+settings.fuegoRoot = fuegoRoot
+import collect_args
+import tf_helper
+import inference_server
+
+
+def main():
+    reqArgs = [
+        ["s", "socket", "file path of Unix socket to listen on"],
+    ]
+    optArgs = [
+        ["b", "maxBatchTiles", "(optional) maximum number of tiles classified together (default 512)"],
+        ["w", "batchWaitMs", "(optional) maximum milliseconds to wait for more requests for a batch (default 50)"],
+    ]
+    args = collect_args.collectArgs(reqArgs, optionalArgs=optArgs)
+    maxBatchTiles = int(args.maxBatchTiles) if args.maxBatchTiles else 512
+    batchWaitSeconds = int(args.batchWaitMs) / 1000 if args.batchWaitMs else 0.05
+    classifier = tf_helper.createClassifier(settings) # tensorflow is only loaded by the tf backend
+    server = inference_server.InferenceServer(classifier, args.socket, maxBatchTiles, batchWaitSeconds)
+    server.serveForever()
+
+
+if __name__=="__main__":
+    main()